@@ -1,14 +1,93 @@
-import time
 import openai
 from openai import OpenAIError
 from modules.logging_utils import logger
 from modules.system_settings import SystemSettings
+from modules.rate_limiter import get_rate_limiter, estimate_request_tokens
+from modules.response_cache import get_response_cache, make_cache_key
+from modules.openai_client import get_client
+from modules.retry_policy import get_retry_policy
+from modules.compact_schema import response_format_kwargs
+from openai.types.chat import ChatCompletion
 
 # ✅ Initialize global MODEL_CACHE to avoid NameError
 MODEL_CACHE = None  
 
-def get_openai_response(prompt_messages, retries=3):
-    """Send request to OpenAI API and return response, retrying on failure."""
+def should_cache(request, use_cache=None):
+    """Cache explicitly opted-in requests, or deterministic (temperature=0) ones when caching is enabled."""
+    if use_cache is not None:
+        return use_cache
+    return SystemSettings.use_response_cache and request.get("temperature", 1) == 0
+
+def create_chat_completion(client, use_cache=None, retry_policy=None, validate=None, **request):
+    """
+    Create a chat completion paced by the shared RPM/TPM limiter for `request["model"]`.
+
+    The `x-ratelimit-*` headers of every response (including 429s) are fed back
+    into the limiter, so all callers in the process converge on the provider limits.
+    Cacheable requests are answered from the on-disk response cache when possible.
+    Failures are retried by `retry_policy` (default: `get_retry_policy()`), which backs off
+    with full jitter and pauses every caller while the shared circuit breaker is open.
+
+    `validate(response)` runs inside the retried call: raising a JSON decode error or
+    `InvalidResponseError` retries the request, and only valid responses are cached.
+    """
+    cache_key = make_cache_key(request) if should_cache(request, use_cache) else None
+    if cache_key:
+        cached = get_response_cache().get(cache_key)
+        if cached is not None:
+            logger.info("💾 Response cache hit, skipping API call.")
+            return ChatCompletion.model_validate_json(cached)
+
+    response = (retry_policy or get_retry_policy()).call(_send_chat_completion, client, request, validate)
+    if cache_key:
+        get_response_cache().put(cache_key, response.model_dump_json(), model=request["model"])
+    return response
+
+def _send_chat_completion(client, request, validate=None):
+    limiter = get_rate_limiter(request["model"])
+    limiter.acquire(estimate_request_tokens(request))
+    try:
+        raw_response = client.chat.completions.with_raw_response.create(**request)
+    except openai.APIStatusError as e:
+        limiter.update_from_headers(e.response.headers)
+        raise
+    limiter.update_from_headers(raw_response.headers)
+    response = raw_response.parse()
+    if validate:
+        validate(response)
+    return response
+
+async def create_chat_completion_async(client, use_cache=None, retry_policy=None, validate=None, **request):
+    """Async twin of `create_chat_completion` for `AsyncOpenAI` clients."""
+    cache_key = make_cache_key(request) if should_cache(request, use_cache) else None
+    if cache_key:
+        cached = get_response_cache().get(cache_key)
+        if cached is not None:
+            logger.info("💾 Response cache hit, skipping API call.")
+            return ChatCompletion.model_validate_json(cached)
+
+    policy = retry_policy or get_retry_policy()
+    response = await policy.call_async(_send_chat_completion_async, client, request, validate)
+    if cache_key:
+        get_response_cache().put(cache_key, response.model_dump_json(), model=request["model"])
+    return response
+
+async def _send_chat_completion_async(client, request, validate=None):
+    limiter = get_rate_limiter(request["model"])
+    await limiter.acquire_async(estimate_request_tokens(request))
+    try:
+        raw_response = await client.chat.completions.with_raw_response.create(**request)
+    except openai.APIStatusError as e:
+        limiter.update_from_headers(e.response.headers)
+        raise
+    limiter.update_from_headers(raw_response.headers)
+    response = raw_response.parse()
+    if validate:
+        validate(response)
+    return response
+
+def get_openai_response(prompt_messages, retries=None):
+    """Send request to OpenAI API and return response, retrying per the shared retry policy."""
     
     # ✅ Ensure correct API Key is set
     api_key = SystemSettings.api_key  
@@ -19,34 +98,55 @@ def get_openai_response(prompt_messages, retries=3):
     # ✅ Default to GPT-4o Mini if no model is explicitly selected
     model = SystemSettings.model_name if SystemSettings.model_name else "gpt-4o-mini"
     
-    client = openai.OpenAI(api_key=api_key)
+    client = get_client(api_key)  # ✅ Pooled client, connections are reused across rows
+
+    try:
+        logger.info("🚀 Sending request to OpenAI...")
+
+        # ✅ Send structured prompt to OpenAI (retries, backoff and circuit breaking happen inside)
+        response = create_chat_completion(
+            client,
+            retry_policy=get_retry_policy(retries),
+            model=model,
+            messages=prompt_messages,
+            temperature=0,
+            **response_format_kwargs()  # ✅ Strict code schema in codes mode
+        )
+    except openai.OpenAIError as e:
+        logger.error(f"❌ OpenAI API request failed: {e}")
+        return "Error: API request failed", 0, 0
 
-    for attempt in range(retries):
-        try:
-            logger.info(f"🚀 Attempt {attempt + 1}: Sending request to OpenAI...")
+    predicted_status = response.choices[0].message.content.strip()
+    token_input = response.usage.prompt_tokens
+    token_output = response.usage.completion_tokens
 
-            # ✅ Send structured prompt to OpenAI
-            response = client.chat.completions.create(
-                model=model,
-                messages=prompt_messages,
-                temperature=0
-            )
+    logger.info(f"✅ AI Response: {predicted_status}")
+    return predicted_status, token_input, token_output
 
-            predicted_status = response.choices[0].message.content.strip()
-            token_input = response.usage.prompt_tokens
-            token_output = response.usage.completion_tokens
+async def get_openai_response_async(prompt_messages, client, retries=None):
+    """Async twin of `get_openai_response`, sharing one `AsyncOpenAI` client across in-flight requests."""
 
-            logger.info(f"✅ AI Response: {predicted_status}")
-            return predicted_status, token_input, token_output
+    model = SystemSettings.model_name if SystemSettings.model_name else "gpt-4o-mini"
+
+    try:
+        response = await create_chat_completion_async(
+            client,
+            retry_policy=get_retry_policy(retries),
+            model=model,
+            messages=prompt_messages,
+            temperature=0,
+            **response_format_kwargs()
+        )
+    except openai.OpenAIError as e:
+        logger.error(f"❌ OpenAI API request failed: {e}")
+        return "Error: API request failed", 0, 0
 
-        except openai.OpenAIError as e:
-            logger.error(f"❌ OpenAI API Error: {e}")
-            wait_time = (attempt + 1) * 5  # Exponential backoff
-            logger.warning(f"⚠️ Retrying in {wait_time} seconds...")
-            time.sleep(wait_time)
+    predicted_status = response.choices[0].message.content.strip()
+    token_input = response.usage.prompt_tokens
+    token_output = response.usage.completion_tokens
 
-    logger.error("❌ OpenAI API request failed after multiple attempts.")
-    return "Error: API request failed", 0, 0
+    logger.info(f"✅ AI Response: {predicted_status}")
+    return predicted_status, token_input, token_output
 
 def fetch_openai_models():
     """Retrieve the list of available OpenAI models from the API, caching the result."""
@@ -65,7 +165,7 @@ def fetch_openai_models():
         return ["gpt-4o-mini"]
 
     try:
-        client = openai.OpenAI(api_key=SystemSettings.api_key)
+        client = get_client(SystemSettings.api_key)
         models = client.models.list()
 
         # Extract model names and filter relevant ones
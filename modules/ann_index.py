@@ -0,0 +1,236 @@
+import os
+import json
+import numpy as np
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+from modules.embeddings import normalise_rows
+from modules.similarity_search import nearest_neighbours
+from modules.embedding_store import get_embedding_store
+
+try:
+    import hnswlib
+except ImportError:  # ✅ HNSW is optional (`pip install hnswlib`); the NumPy IVF index needs nothing native
+    hnswlib = None
+
+class IvfIndex:
+    """
+    Inverted-file index in pure NumPy.
+
+    Vectors are assigned to the nearest of ~sqrt(n) spherical k-means centroids; a query
+    scores the centroids, then only the vectors of its `nprobe` closest lists. Probing
+    every list is an exact search.
+    """
+
+    backend = "ivf"
+
+    def __init__(self, dim, nprobe=None):
+        self.dim = dim
+        self.nprobe = nprobe or SystemSettings.ann_nprobe
+        self.centroids = np.zeros((0, dim), dtype=np.float32)
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.lists = np.zeros(0, dtype=np.int64)
+        self.trained_on = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def train(self, iterations=10, seed=0):
+        """(Re)fit the centroids on the current vectors and reassign every vector."""
+        nlist = max(1, int(np.sqrt(len(self))))
+        rng = np.random.default_rng(seed)
+        sample = self.vectors[rng.choice(len(self), min(len(self), 64 * nlist), replace=False)] if len(self) else self.vectors
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)] if len(sample) else sample
+        for _ in range(iterations if nlist > 1 else 0):
+            nearest = nearest_neighbours(sample, centroids, k=1, normalised=True).indices
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]  # ✅ Keep a centroid that lost all its points
+            centroids = normalise_rows(sums)
+        self.centroids = centroids
+        self.lists = self._assign(self.vectors)
+        self.trained_on = len(self)
+
+    def _assign(self, vectors):
+        if not len(vectors):
+            return np.zeros(0, dtype=np.int64)
+        return nearest_neighbours(vectors, self.centroids, k=1, normalised=True).indices
+
+    def add(self, vectors, ids):
+        vectors = normalise_rows(vectors)
+        self.vectors = np.concatenate([self.vectors, vectors])
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+        if not len(self.centroids) or len(self) > 4 * self.trained_on:
+            self.train()  # ✅ Refit once the index has grown well past what the centroids were fitted on
+        else:
+            self.lists = np.concatenate([self.lists, self._assign(vectors)])
+
+    def indexed_ids(self):
+        return self.ids
+
+    def remove(self, ids):
+        keep = ~np.isin(self.ids, np.asarray(ids, dtype=np.int64))
+        self.vectors, self.ids, self.lists = self.vectors[keep], self.ids[keep], self.lists[keep]
+
+    def query(self, vectors, k=1):
+        queries = normalise_rows(vectors)
+        best_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if not len(self) or not len(queries):
+            return best_ids, np.where(np.isinf(best_scores), np.nan, best_scores)
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = nearest_neighbours(queries, self.centroids, k=nprobe, normalised=True).indices.reshape(-1, nprobe)
+        order = np.argsort(self.lists, kind="stable")
+        bounds = np.searchsorted(self.lists[order], np.arange(len(self.centroids) + 1))
+        for list_id in np.unique(probes):
+            members = order[bounds[list_id]:bounds[list_id + 1]]
+            asking = np.nonzero((probes == list_id).any(axis=1))[0]
+            if not len(members):
+                continue
+            # ✅ One matrix product per probed list, merged into each query's running top-k
+            scores = np.concatenate([best_scores[asking], queries[asking] @ self.vectors[members].T], axis=1)
+            candidates = np.concatenate([best_ids[asking], np.broadcast_to(self.ids[members], (len(asking), len(members)))], axis=1)
+            top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+            best_scores[asking] = np.take_along_axis(scores, top, axis=1)
+            best_ids[asking] = np.take_along_axis(candidates, top, axis=1)
+        return best_ids, np.where(np.isinf(best_scores), np.nan, best_scores)
+
+    def save(self, path):
+        np.savez(path + ".npz", centroids=self.centroids, vectors=self.vectors, ids=self.ids, lists=self.lists,
+                 trained_on=self.trained_on)
+
+    @classmethod
+    def load(cls, path, meta):
+        index = cls(meta["dim"])
+        with np.load(path + ".npz") as data:
+            index.centroids, index.vectors, index.ids, index.lists = (
+                data["centroids"], data["vectors"], data["ids"], data["lists"])
+            index.trained_on = int(data["trained_on"])
+        return index
+
+class HnswIndex:
+    """HNSW graph index (hnswlib, cosine space)."""
+
+    backend = "hnsw"
+
+    def __init__(self, dim, capacity=1024, ef=None):
+        self.dim = dim
+        self.ef = ef or SystemSettings.ann_ef
+        self.index = hnswlib.Index(space="cosine", dim=dim)
+        self.index.init_index(max_elements=capacity, ef_construction=200, M=16, allow_replace_deleted=True)
+        self.ids = set()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, vectors, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        needed = self.index.element_count + len(ids)
+        if needed > self.index.get_max_elements():
+            self.index.resize_index(max(needed, 2 * self.index.get_max_elements()))
+        self.index.add_items(normalise_rows(vectors), ids, replace_deleted=True)
+        self.ids.update(ids.tolist())
+
+    def indexed_ids(self):
+        return np.fromiter(self.ids, dtype=np.int64, count=len(self.ids))
+
+    def remove(self, ids):
+        for id_ in ids:
+            self.index.mark_deleted(int(id_))
+            self.ids.discard(int(id_))
+
+    def query(self, vectors, k=1):
+        count = min(k, len(self))
+        best_ids = np.full((len(vectors), k), -1, dtype=np.int64)
+        best_scores = np.full((len(vectors), k), np.nan, dtype=np.float32)
+        if count and len(vectors):
+            self.index.set_ef(max(self.ef, count))
+            labels, distances = self.index.knn_query(normalise_rows(vectors), k=count)
+            best_ids[:, :count], best_scores[:, :count] = labels, 1 - distances
+        return best_ids, best_scores
+
+    def save(self, path):
+        self.index.save_index(path + ".hnsw")
+        with open(path + ".ids.json", "w", encoding="utf-8") as f:
+            json.dump(sorted(self.ids), f)
+
+    @classmethod
+    def load(cls, path, meta):
+        index = cls.__new__(cls)
+        index.dim, index.ef = meta["dim"], SystemSettings.ann_ef
+        index.index = hnswlib.Index(space="cosine", dim=meta["dim"])
+        index.index.load_index(path + ".hnsw", allow_replace_deleted=True)
+        with open(path + ".ids.json", encoding="utf-8") as f:
+            index.ids = set(json.load(f))
+        return index
+
+ANN_BACKENDS = {"ivf": IvfIndex, "hnsw": HnswIndex}
+
+def resolve_ann_backend(backend=None):
+    """The backend to use: "hnsw" if requested (or "auto") and hnswlib is installed, else "ivf"."""
+    backend = backend or SystemSettings.ann_backend
+    if backend in ("auto", "hnsw") and hnswlib is not None:
+        return "hnsw"
+    if backend == "hnsw":
+        logger.warning("⚠️ hnswlib is not installed; using the NumPy IVF index.")
+    return "ivf"
+
+def build_ann_index(vectors, ids=None, backend=None):
+    """
+    An index over `vectors` (ids default to row positions).
+
+    Both backends offer `add(vectors, ids)`, `remove(ids)`, `indexed_ids()`, `query(vectors, k)`
+    → (ids, cosine similarities), best first, padded with -1/nan, and `save(path)` (see `save_ann_index`).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    index = ANN_BACKENDS[resolve_ann_backend(backend)](vectors.shape[1])
+    index.add(vectors, np.arange(len(vectors)) if ids is None else ids)
+    return index
+
+def save_ann_index(index, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    index.save(path)
+    with open(path + ".json", "w", encoding="utf-8") as f:
+        json.dump({"backend": index.backend, "dim": index.dim}, f)
+
+def load_ann_index(path, backend=None):
+    """A saved index, or None if there is none (or it was saved by a backend that is not in use now)."""
+    try:
+        with open(path + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if meta["backend"] != resolve_ann_backend(backend):
+        return None
+    return ANN_BACKENDS[meta["backend"]].load(path, meta)
+
+def get_ann_index(name, texts, model_name=None, backend=None):
+    """
+    The persisted index over `texts`, brought up to date incrementally.
+
+    Ids are the texts' embedding-store rows: texts new since the last run are added and
+    texts no longer in the list are removed, so a run after a few edits touches only those.
+
+    Returns:
+        tuple: (index, store rows of `texts` — map query ids back with them)
+    """
+    store = get_embedding_store(model_name)
+    rows = store.rows(texts)
+    path = os.path.join(SystemSettings.ann_index_dir, f"{name}-{os.path.basename(store.directory)}")
+
+    index = load_ann_index(path, backend)
+    if index is None:
+        index = build_ann_index(store.vectors[np.unique(rows)], np.unique(rows), backend)
+        logger.info(f"🗂️ Built {index.backend} index `{name}` over {len(index)} texts")
+    else:
+        indexed = index.indexed_ids()
+        new, stale = np.setdiff1d(rows, indexed), np.setdiff1d(indexed, rows)
+        if len(stale):
+            index.remove(stale)
+        if len(new):
+            index.add(store.vectors[new], new)
+        logger.info(f"🗂️ Updated {index.backend} index `{name}`: {len(new)} added, {len(stale)} removed, {len(index)} total")
+    save_ann_index(index, path)
+    return index, rows
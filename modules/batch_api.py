@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import uuid
+import shutil
+from datetime import datetime
+from openai.types.chat import ChatCompletion
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+from modules.response_cache import get_response_cache, make_cache_key
+
+CHAT_COMPLETIONS_URL = "/v1/chat/completions"
+MAX_REQUESTS_PER_BATCH = 50000  # ✅ OpenAI Batch API limit per input file
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+def build_batch_line(custom_id, body, url=CHAT_COMPLETIONS_URL):
+    """Build one Batch API input line for a chat completion request body."""
+    return {"custom_id": custom_id, "method": "POST", "url": url, "body": body}
+
+def write_batch_file(requests, path):
+    """Serialise (custom_id, body) pairs to a Batch API JSONL input file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, body in requests:
+            f.write(json.dumps(build_batch_line(custom_id, body), ensure_ascii=False) + "\n")
+    return path
+
+def parse_batch_output(text):
+    """Parse Batch API output/error JSONL into {custom_id: {"response": ChatCompletion | None, "error": str | None}}."""
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        body = response.get("body")
+        if response.get("status_code") == 200 and body:
+            results[record["custom_id"]] = {"response": ChatCompletion.model_validate(body), "error": None}
+        else:
+            error = record.get("error") or (body or {}).get("error") or f"HTTP {response.get('status_code')}"
+            results[record["custom_id"]] = {"response": None, "error": json.dumps(error) if not isinstance(error, str) else error}
+    return results
+
+class OpenAIBatchService:
+    """Thin wrapper over the OpenAI Files + Batches endpoints."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def upload(self, path):
+        with open(path, "rb") as f:
+            return self.client.files.create(file=f, purpose="batch").id
+
+    def create(self, input_file_id, endpoint=CHAT_COMPLETIONS_URL):
+        batch = self.client.batches.create(input_file_id=input_file_id, endpoint=endpoint, completion_window="24h")
+        return batch.id
+
+    def retrieve(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        return {"status": batch.status, "output_file_id": batch.output_file_id, "error_file_id": batch.error_file_id}
+
+    def cancel(self, batch_id):
+        self.client.batches.cancel(batch_id)
+
+    def download(self, file_id):
+        return self.client.files.content(file_id).text
+
+def stub_responder(body):
+    """Default local responder: a fixed completion, so dry runs exercise the full pipeline for free."""
+    return {"content": "LOCAL_BATCH_STUB", "prompt_tokens": 0, "completion_tokens": 0}
+
+class LocalBatchService:
+    """
+    File-based stand-in for the Batch API, for tests and dry runs.
+
+    Uploaded files and batch state live under `root_dir`. A batch stays
+    `in_progress` for `polls_until_complete` retrieves, then every line is
+    answered by `responder(body)`. The responder returns {"content", "prompt_tokens",
+    "completion_tokens"} or raises to produce an error line.
+    """
+
+    def __init__(self, root_dir, responder=stub_responder, polls_until_complete=1):
+        self.root_dir = root_dir
+        self.responder = responder
+        self.polls_until_complete = polls_until_complete
+        os.makedirs(os.path.join(root_dir, "files"), exist_ok=True)
+        os.makedirs(os.path.join(root_dir, "batches"), exist_ok=True)
+
+    def _file_path(self, file_id):
+        return os.path.join(self.root_dir, "files", f"{file_id}.jsonl")
+
+    def _batch_path(self, batch_id):
+        return os.path.join(self.root_dir, "batches", f"{batch_id}.json")
+
+    def upload(self, path):
+        file_id = f"file-local-{uuid.uuid4().hex[:12]}"
+        shutil.copyfile(path, self._file_path(file_id))
+        return file_id
+
+    def create(self, input_file_id, endpoint=CHAT_COMPLETIONS_URL):
+        batch_id = f"batch-local-{uuid.uuid4().hex[:12]}"
+        state = {"id": batch_id, "input_file_id": input_file_id, "endpoint": endpoint, "status": "validating",
+                 "polls": 0, "output_file_id": None, "error_file_id": None}
+        with open(self._batch_path(batch_id), "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        return batch_id
+
+    def retrieve(self, batch_id):
+        with open(self._batch_path(batch_id), "r", encoding="utf-8") as f:
+            state = json.load(f)
+
+        if state["status"] not in TERMINAL_STATUSES:
+            state["polls"] += 1
+            state["status"] = "in_progress"
+            if state["polls"] > self.polls_until_complete:
+                self._complete(state)
+            with open(self._batch_path(batch_id), "w", encoding="utf-8") as f:
+                json.dump(state, f)
+
+        return {"status": state["status"], "output_file_id": state["output_file_id"], "error_file_id": state["error_file_id"]}
+
+    def cancel(self, batch_id):
+        with open(self._batch_path(batch_id), "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state["status"] not in TERMINAL_STATUSES:
+            state["status"] = "cancelled"
+            with open(self._batch_path(batch_id), "w", encoding="utf-8") as f:
+                json.dump(state, f)
+
+    def _complete(self, state):
+        outputs, errors = [], []
+        with open(self._file_path(state["input_file_id"]), "r", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+
+        for line in lines:
+            body = line["body"]
+            try:
+                answer = self.responder(body)
+            except Exception as e:
+                errors.append({"id": f"req-{uuid.uuid4().hex[:8]}", "custom_id": line["custom_id"],
+                               "response": None, "error": {"message": str(e)}})
+                continue
+
+            completion = {
+                "id": f"chatcmpl-local-{uuid.uuid4().hex[:8]}", "object": "chat.completion",
+                "created": int(time.time()), "model": body.get("model", "local"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": answer["content"]}}],
+                "usage": {"prompt_tokens": answer.get("prompt_tokens", 0),
+                          "completion_tokens": answer.get("completion_tokens", 0),
+                          "total_tokens": answer.get("prompt_tokens", 0) + answer.get("completion_tokens", 0)},
+            }
+            outputs.append({"id": f"req-{uuid.uuid4().hex[:8]}", "custom_id": line["custom_id"],
+                            "response": {"status_code": 200, "body": completion}, "error": None})
+
+        for key, records in (("output_file_id", outputs), ("error_file_id", errors)):
+            if records:
+                file_id = f"file-local-{uuid.uuid4().hex[:12]}"
+                with open(self._file_path(file_id), "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(r) + "\n" for r in records)
+                state[key] = file_id
+        state["status"] = "completed"
+
+    def download(self, file_id):
+        with open(self._file_path(file_id), "r", encoding="utf-8") as f:
+            return f.read()
+
+def get_batch_service(client=None):
+    """Return the batch service selected by `SystemSettings.batch_service` ("openai" or "local")."""
+    if SystemSettings.batch_service == "local":
+        return LocalBatchService(os.path.join(SystemSettings.batch_work_dir, "local_service"))
+    return OpenAIBatchService(client)
+
+def run_batch(requests, service, work_dir=None, poll_interval=None, timeout=None, use_cache=None):
+    """
+    Submit chat completion requests through the Batch API and wait for the results.
+
+    Args:
+        requests (list): (custom_id, body) pairs; custom_ids must be unique.
+        service: `OpenAIBatchService` or `LocalBatchService`.
+        work_dir (str): Where the JSONL input files are written.
+        poll_interval (float): Seconds between status polls.
+        timeout (float): Cancel the batch after polling this many seconds (default: `batch_timeout_seconds`;
+            a None setting waits for the 24h window).
+        use_cache (bool): Serve/store temperature=0 bodies through the response cache.
+
+    Returns:
+        dict: {custom_id: {"response": ChatCompletion | None, "error": str | None}}.
+    """
+    work_dir = work_dir or SystemSettings.batch_work_dir
+    poll_interval = SystemSettings.batch_poll_seconds if poll_interval is None else poll_interval
+    timeout = SystemSettings.batch_timeout_seconds if timeout is None else timeout
+    use_cache = SystemSettings.use_response_cache if use_cache is None else use_cache
+
+    results = {}
+    pending = []
+    cache_keys = {}
+    for custom_id, body in requests:
+        if use_cache and body.get("temperature", 1) == 0:
+            cache_keys[custom_id] = make_cache_key(body)
+            cached = get_response_cache().get(cache_keys[custom_id])
+            if cached is not None:
+                results[custom_id] = {"response": ChatCompletion.model_validate_json(cached), "error": None}
+                continue
+        pending.append((custom_id, body))
+
+    if results:
+        logger.info(f"💾 {len(results)} batch requests answered from the response cache.")
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    for chunk_start in range(0, len(pending), MAX_REQUESTS_PER_BATCH):
+        chunk = pending[chunk_start:chunk_start + MAX_REQUESTS_PER_BATCH]
+        input_path = write_batch_file(chunk, os.path.join(work_dir, f"batch_input_{timestamp}_{chunk_start}.jsonl"))
+        file_id = service.upload(input_path)
+        batch_id = service.create(file_id)
+        logger.info(f"📤 Submitted batch {batch_id} with {len(chunk)} requests ({input_path}).")
+
+        started = time.monotonic()
+        while True:
+            state = service.retrieve(batch_id)
+            if state["status"] in TERMINAL_STATUSES:
+                break
+            if timeout is not None and time.monotonic() - started > timeout:
+                # ✅ Cancel rather than leave it running (and billing) with nobody collecting the results
+                logger.error(f"❌ Batch {batch_id} still '{state['status']}' after {timeout}s. Cancelling it.")
+                service.cancel(batch_id)
+                state = service.retrieve(batch_id)
+                break
+            logger.info(f"⏳ Batch {batch_id} is '{state['status']}'. Polling again in {poll_interval}s...")
+            time.sleep(poll_interval)
+
+        logger.info(f"📥 Batch {batch_id} finished with status '{state['status']}'.")
+        # ✅ Expired/cancelled batches can still carry partial output, so always collect what exists
+        for file_key in ("output_file_id", "error_file_id"):
+            if state.get(file_key):
+                results.update(parse_batch_output(service.download(state[file_key])))
+
+        for custom_id, _ in chunk:
+            result = results.setdefault(custom_id, {"response": None, "error": f"No result (batch {state['status']})"})
+            if result["response"] is not None and custom_id in cache_keys:
+                get_response_cache().put(cache_keys[custom_id], result["response"].model_dump_json(),
+                                         model=result["response"].model)
+
+    failed = sum(1 for r in results.values() if r["response"] is None)
+    logger.info(f"✅ Batch run complete: {len(results) - failed} succeeded, {failed} failed.")
+    return results
@@ -0,0 +1,154 @@
+import json
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+from modules.prompt_generator import load_status_mapping
+from modules.token_counter import estimate_tokens
+
+CODE_SCHEMA_NAME = "tracking_codes"
+
+def format_status_answer(progress, final_status=None):
+    """Shape a status like the model's JSON answer: {"status": ..., "final_status": ...}."""
+    answer = {"status": progress}
+    if final_status:
+        answer["final_status"] = final_status
+    return json.dumps(answer, ensure_ascii=False)
+
+def codes_enabled():
+    return SystemSettings.response_mode == "codes"
+
+def build_code_schema(mapping=None, multi=False):
+    """
+    Strict `json_schema` response format allowing only status_mapping.json codes.
+
+    One shipment answers {"p": "<progress code>", "s": "<final status code>" | null};
+    with `multi=True` the answer is {"shipments": [{"tracking_number": ..., "p": ..., "s": ...}]}.
+    """
+    mapping = mapping or load_status_mapping()
+    item = {
+        "type": "object",
+        "properties": {
+            "p": {"type": "string", "enum": list(mapping.get("progress", {}))},
+            "s": {"type": ["string", "null"], "enum": list(mapping.get("final_status", {})) + [None]},
+        },
+        "required": ["p", "s"],
+        "additionalProperties": False,
+    }
+    schema = item
+    if multi:
+        item["properties"] = {"tracking_number": {"type": "string"}, **item["properties"]}
+        item["required"] = ["tracking_number", "p", "s"]
+        schema = {"type": "object", "properties": {"shipments": {"type": "array", "items": item}},
+                  "required": ["shipments"], "additionalProperties": False}
+    return {"type": "json_schema", "json_schema": {"name": CODE_SCHEMA_NAME, "strict": True, "schema": schema}}
+
+def response_format_kwargs(multi=False):
+    """{"response_format": <code schema>} in codes mode, else {} (spread into a request)."""
+    return {"response_format": build_code_schema(multi=multi)} if codes_enabled() else {}
+
+def code_instructions(mapping=None, multi=False):
+    """The code tables appended to the system prompt in codes mode."""
+    mapping = mapping or load_status_mapping()
+    shape = '{"shipments": [{"tracking_number": "...", "p": "<code>", "s": "<code or null>"}]}' if multi \
+        else '{"p": "<code>", "s": "<code or null>"}'
+    progress = "\n".join(f"{code} = {label}" for code, label in mapping.get("progress", {}).items())
+    final_status = "\n".join(f"{code} = {label}" for code, label in mapping.get("final_status", {}).items())
+    return (
+        f"Answer format (overrides any format above): reply ONLY with {shape}.\n"
+        f"p is the progress code:\n{progress}\n"
+        f"s is the final status code while the shipment is not yet collected, otherwise null:\n{final_status}"
+    )
+
+def add_code_instructions(prompt_messages, mapping=None, multi=False):
+    """Copy of `prompt_messages` with the code tables appended to the system message."""
+    messages = [dict(message) for message in prompt_messages]
+    messages[0]["content"] = f"{messages[0]['content']}\n\n{code_instructions(mapping, multi)}"
+    return messages
+
+def decode_codes(answer, mapping):
+    """
+    Map a {"p": ..., "s": ...} answer (dict or JSON text) back to labels.
+
+    Returns:
+        tuple: (progress label, final status label or None)
+
+    Raises:
+        ValueError: if the answer is not valid JSON or holds an unknown code.
+    """
+    codes = json.loads(answer) if isinstance(answer, str) else answer
+    if not isinstance(codes, dict):
+        raise ValueError(f"expected a JSON object, got {answer!r}")
+    progress = mapping.get("progress", {}).get(str(codes.get("p")))
+    if progress is None:
+        raise ValueError(f"unknown progress code {codes.get('p')!r}")
+    final_status = codes.get("s")
+    if final_status is None:
+        return progress, None
+    if str(final_status) not in mapping.get("final_status", {}):
+        raise ValueError(f"unknown final status code {final_status!r}")
+    return progress, mapping["final_status"][str(final_status)]
+
+class CodeDecoder:
+    """
+    Decodes code answers into label answers and measures the completion tokens saved.
+
+    The label-mode cost of a response is estimated as the completion tokens paid for it
+    plus the extra tokens its answers take with every code spelled out as its label.
+    """
+
+    def __init__(self, mapping=None, model=None):
+        self.mapping = mapping or load_status_mapping()
+        self.model = model
+        self.completion_tokens = 0
+        self.label_tokens = 0
+
+    def record(self, completion_tokens, code_answers, label_answers):
+        """Count one paid response with its code answers and the same answers spelled out as labels."""
+        model = self.model or "gpt-4o-mini"
+        extra = sum(estimate_tokens(json.dumps(answer, ensure_ascii=False), model) for answer in label_answers) \
+            - sum(estimate_tokens(json.dumps(answer, ensure_ascii=False), model) for answer in code_answers)
+        self.completion_tokens += completion_tokens
+        self.label_tokens += completion_tokens + max(0, extra)
+
+    def decode_prediction(self, prediction):
+        """Prediction record with its code answer replaced by the label answer ("Error: ..." if invalid)."""
+        answer = prediction["Predicted_Status"]
+        if not isinstance(answer, str) or answer.startswith("Error:"):
+            return prediction
+        try:
+            codes = json.loads(answer)
+            progress, final_status = decode_codes(codes, self.mapping)
+        except ValueError as e:  # ✅ json.JSONDecodeError included
+            logger.error(f"❌ Invalid code answer {answer!r}: {e}")
+            return {**prediction, "Predicted_Status": f"Error: invalid code response: {answer}"}
+
+        if prediction.get("Token_Output"):  # ✅ Duplicates and replayed rows cost nothing
+            self.record(prediction["Token_Output"], [codes], [{"p": progress, "s": final_status}])
+        return {**prediction, "Predicted_Status": format_status_answer(progress, final_status)}
+
+    def decode_shipments(self, answers, completion_tokens):
+        """
+        Decode a multi-shipment answer list; entries with unknown codes are dropped.
+
+        Returns:
+            list: [{"tracking_number": ..., "progress": ..., "final_status": ...}, ...]
+        """
+        decoded, codes, labels = [], [], []
+        for answer in answers:
+            try:
+                progress, final_status = decode_codes(answer, self.mapping)
+            except ValueError as e:
+                logger.error(f"❌ Invalid code answer {answer!r}: {e}")
+                continue
+            decoded.append({"tracking_number": answer.get("tracking_number"), "progress": progress,
+                            "final_status": final_status})
+            codes.append(answer)
+            labels.append({**answer, "p": progress, "s": final_status})
+        self.record(completion_tokens, codes, labels)
+        return decoded
+
+    def log_savings(self):
+        saved = self.label_tokens - self.completion_tokens
+        share = saved / self.label_tokens if self.label_tokens else 0
+        logger.info(f"🔢 Code answers: {self.completion_tokens} completion tokens vs ~{self.label_tokens} with labels "
+                    f"(saved ~{saved}, {share:.0%}).")
+        return saved
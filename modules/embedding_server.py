@@ -0,0 +1,176 @@
+import json
+import time
+import queue
+import base64
+import threading
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+from modules.embeddings import load_encoder, DEFAULT_EMBEDDING_MODEL
+
+class MicroBatcher:
+    """
+    Runs the encode requests of one model through its encoder together.
+
+    A worker thread takes the oldest request, then keeps collecting requests for up to
+    `max_wait_ms` or until `max_batch` texts are waiting, and encodes them in one call.
+    """
+
+    def __init__(self, encoder, max_batch=None, max_wait_ms=None):
+        self.encoder = encoder
+        self.max_batch = max_batch or SystemSettings.embedding_server_max_batch
+        self.max_wait = (SystemSettings.embedding_server_max_wait_ms if max_wait_ms is None else max_wait_ms) / 1000
+        self.queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "texts": 0, "batches": 0, "max_batch_texts": 0, "queue_wait_seconds": 0.0,
+                       "encode_seconds": 0.0, "errors": 0}
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def encode(self, texts):
+        """Embeddings of `texts` (blocks until their batch has run)."""
+        future = Future()
+        self.queue.put((list(texts), future, time.perf_counter()))
+        return future.result()
+
+    def _run(self):
+        while True:
+            items = [self.queue.get()]
+            count, deadline = len(items[0][0]), time.perf_counter() + self.max_wait
+            while count < self.max_batch:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                items.append(item)
+                count += len(item[0])
+
+            started = time.perf_counter()
+            try:
+                vectors = self.encoder([text for texts, _, _ in items for text in texts])
+            except Exception as e:
+                for _, future, _ in items:
+                    future.set_exception(e)
+                with self._lock:
+                    self._stats["errors"] += 1
+                continue
+
+            offset = 0
+            for texts, future, _ in items:
+                future.set_result(vectors[offset:offset + len(texts)])
+                offset += len(texts)
+            with self._lock:
+                self._stats["requests"] += len(items)
+                self._stats["texts"] += count
+                self._stats["batches"] += 1
+                self._stats["max_batch_texts"] = max(self._stats["max_batch_texts"], count)
+                self._stats["queue_wait_seconds"] += sum(started - queued for _, _, queued in items)
+                self._stats["encode_seconds"] += time.perf_counter() - started
+
+    def metrics(self):
+        """Batching and queue metrics since start-up."""
+        with self._lock:
+            stats = dict(self._stats)
+        batches, requests = max(1, stats["batches"]), max(1, stats["requests"])
+        return {
+            **stats,
+            "queue_depth": self.queue.qsize(),
+            "mean_batch_texts": stats["texts"] / batches,
+            "mean_requests_per_batch": stats["requests"] / batches,
+            "mean_queue_wait_ms": 1000 * stats["queue_wait_seconds"] / requests,
+            "texts_per_second": stats["texts"] / stats["encode_seconds"] if stats["encode_seconds"] else 0.0,
+        }
+
+class EmbeddingServer(ThreadingHTTPServer):
+    """
+    Localhost HTTP server that keeps embedding models loaded.
+
+    POST /encode {"model", "texts"} → {"shape", "vectors": base64 float32}, GET /health?model=...
+    and GET /metrics. Models load on first encode request (or up front with `models`).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, models=(), max_batch=None, max_wait_ms=None, load_encoder=load_encoder):
+        super().__init__(address, EmbeddingRequestHandler)
+        self.max_batch, self.max_wait_ms, self.load_encoder = max_batch, max_wait_ms, load_encoder
+        self.batchers = {}
+        self._lock = threading.Lock()
+        for model_name in models:
+            self.batcher(model_name)
+
+    def batcher(self, model_name):
+        """The micro-batcher of a model, loading it on first use; None if it cannot be loaded."""
+        with self._lock:
+            if model_name not in self.batchers:
+                encoder = self.load_encoder(model_name)
+                self.batchers[model_name] = MicroBatcher(encoder, self.max_batch, self.max_wait_ms) if encoder else None
+            return self.batchers[model_name]
+
+    def model_status(self, model_name):
+        """True if the model is loaded, False if it failed to load, None if it has not been requested yet."""
+        if model_name not in self.batchers:
+            return None  # ✅ Also while it is loading; the load lock is not taken here
+        return self.batchers[model_name] is not None
+
+class EmbeddingRequestHandler(BaseHTTPRequestHandler):
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            model_name = parse_qs(url.query).get("model", [None])[0]
+            # ✅ Never loads a model: a cold load would outlast the client's short probe timeout
+            available = self.server.model_status(model_name) if model_name else None
+            self.send_json(200, {"status": "ok", "model_available": available,
+                                 "models": sorted(name for name, batcher in self.server.batchers.items() if batcher)})
+        elif url.path == "/metrics":
+            self.send_json(200, {name: batcher.metrics() for name, batcher in self.server.batchers.items() if batcher})
+        else:
+            self.send_json(404, {"error": f"unknown path {url.path}"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/encode":
+            self.send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            model_name, texts = request.get("model") or DEFAULT_EMBEDDING_MODEL, [str(text) for text in request["texts"]]
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"error": f"bad request: {e}"})
+            return
+
+        batcher = self.server.batcher(model_name)
+        if batcher is None:
+            self.send_json(503, {"error": f"embedding model `{model_name}` is unavailable"})
+            return
+        try:
+            vectors = np.ascontiguousarray(batcher.encode(texts), dtype=np.float32)
+        except Exception as e:
+            logger.error(f"❌ Encoding failed for {len(texts)} texts with `{model_name}`: {e}")
+            self.send_json(500, {"error": str(e)})
+            return
+        self.send_json(200, {"shape": list(vectors.shape), "vectors": base64.b64encode(vectors.tobytes()).decode("ascii")})
+
+    def log_message(self, format, *args):
+        pass  # ✅ No access log line per request
+
+def serve(host="127.0.0.1", port=8765, models=(), max_batch=None, max_wait_ms=None):
+    """Run the embedding server until interrupted."""
+    server = EmbeddingServer((host, port), models, max_batch, max_wait_ms)
+    logger.info(f"🧠 Embedding server on http://{host}:{port} (models: {', '.join(models) or 'loaded on first use'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("🛑 Embedding server stopped.")
+    finally:
+        server.server_close()
@@ -0,0 +1,165 @@
+import os
+import re
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+import numpy as np
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+from modules.text_normaliser import normalise_text
+from modules.embeddings import load_text_encoder, DEFAULT_EMBEDDING_MODEL
+
+try:
+    import fcntl
+except ImportError:  # ✅ Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock on `path` shared with other processes (blocks until it is free)."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def embedding_text(text):
+    """The text that is embedded: smart punctuation normalised, whitespace collapsed (case is kept)."""
+    return " ".join(normalise_text(str(text)).split())
+
+def embedding_key(text):
+    """Store key of an already normalised text."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class EmbeddingStore:
+    """
+    Disk-backed embeddings for one model.
+
+    Vectors live in a flat memory-mapped float32/float16 file (one L2-normalised row per
+    text) with an SQLite sidecar mapping each normalised text's hash to its row. Only texts
+    the store has not seen are encoded, in batches, and appended; rows are never rewritten.
+    Appends hold a lock file, so several processes can share one store directory.
+    """
+
+    def __init__(self, model_name=None, directory=None, dtype=None, encoder=None, batch_size=256):
+        self.model_name = model_name or SystemSettings.embedding_model or DEFAULT_EMBEDDING_MODEL
+        self.dtype = np.dtype(dtype or SystemSettings.embedding_store_dtype)
+        self.directory = os.path.join(directory or SystemSettings.embedding_store_dir,
+                                      f"{re.sub(r'[^A-Za-z0-9._-]+', '_', self.model_name)}-{self.dtype.name}")
+        self.vectors_path = os.path.join(self.directory, "vectors.bin")
+        self.lock_path = os.path.join(self.directory, "store.lock")
+        self.batch_size = batch_size
+        self._encoder = encoder
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS rows (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+        dim = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self.dim = int(dim[0]) if dim else None
+        self._rows = dict(self._conn.execute("SELECT key, row FROM rows"))
+        self._map()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _map(self):
+        if self._rows:
+            self.vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(len(self._rows), self.dim))
+        else:
+            self.vectors = np.zeros((0, self.dim or 0), dtype=self.dtype)
+
+    def _sync(self):
+        """Pick up rows other processes appended since this store last looked."""
+        added = self._conn.execute("SELECT key, row FROM rows WHERE row >= ?", (len(self._rows),)).fetchall()
+        if added:
+            dim = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+            self.dim = int(dim[0]) if dim else self.dim
+            self._rows.update(added)
+            self._map()
+
+    def _append(self, texts):
+        encoder = self._encoder or load_text_encoder(self.model_name)
+        if encoder is None:
+            raise RuntimeError(f"Embedding model `{self.model_name}` is unavailable; {len(texts)} texts are not in the store.")
+
+        keys = list(texts)
+        with open(self.vectors_path, "ab") as f:
+            expected = len(self._rows) * (self.dim or 0) * self.dtype.itemsize
+            if f.tell() > expected:
+                f.truncate(expected)  # ✅ Drop rows of an interrupted write
+            for start in range(0, len(keys), self.batch_size):
+                vectors = np.asarray(encoder([texts[key] for key in keys[start:start + self.batch_size]]))
+                self.dim = self.dim or vectors.shape[1]
+                f.write(np.ascontiguousarray(vectors, dtype=self.dtype).tobytes())
+
+        first = len(self._rows)
+        self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (str(self.dim),))
+        self._conn.executemany("INSERT INTO rows (key, row) VALUES (?, ?)",
+                               [(key, first + offset) for offset, key in enumerate(keys)])
+        self._conn.commit()
+        self._rows.update((key, first + offset) for offset, key in enumerate(keys))
+        self._map()
+
+    def rows(self, texts):
+        """Store row of each text (stable ids across runs), encoding and appending new texts first."""
+        texts = [embedding_text(text) for text in texts]
+        keys = [embedding_key(text) for text in texts]
+        with self._lock:
+            if any(key not in self._rows for key in keys):
+                with file_lock(self.lock_path):
+                    self._sync()
+                    missing = {key: text for key, text in zip(keys, texts) if key not in self._rows}
+                    if missing:
+                        self._append(missing)
+                        logger.info(f"🧠 Embeddings ({self.model_name}): {len(missing)} new texts encoded, "
+                                    f"{len(set(keys)) - len(missing)} read from the store")
+            return np.fromiter((self._rows[key] for key in keys), dtype=np.int64, count=len(keys))
+
+    def encode(self, texts):
+        """
+        Embeddings of `texts`, one row each, in the store's dtype.
+
+        New texts are encoded and appended first. When the texts' rows are consecutive
+        (e.g. the same list as a previous run) the result is a zero-copy view of the memory map.
+        """
+        rows = self.rows(texts)
+        vectors = self.vectors
+        if len(rows) and rows[-1] - rows[0] == len(rows) - 1 and (np.diff(rows) == 1).all():
+            return vectors[rows[0]:rows[-1] + 1]
+        return vectors[rows] if len(rows) else np.zeros((0, vectors.shape[1]), dtype=self.dtype)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_embedding_store(model_name=None):
+    """The shared store for a model (default: `SystemSettings.embedding_model`, else all-MiniLM-L6-v2)."""
+    model_name = model_name or SystemSettings.embedding_model or DEFAULT_EMBEDDING_MODEL
+    with _stores_lock:
+        if model_name not in _stores:
+            _stores[model_name] = EmbeddingStore(model_name)
+        return _stores[model_name]
+
+def encode_texts(texts, model_name=None):
+    """Embeddings of `texts` through the shared store: only texts never seen before are encoded."""
+    return get_embedding_store(model_name).encode(texts)
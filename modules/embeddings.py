@@ -0,0 +1,96 @@
+import json
+import base64
+import urllib.error
+import urllib.parse
+import urllib.request
+from functools import lru_cache
+import numpy as np
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # ✅ Embeddings are optional (`pip install sentence-transformers`)
+    SentenceTransformer = None
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"  # ✅ Same model as the scan group comparison scripts
+
+def normalise_rows(vectors):
+    """L2-normalise each row, so a dot product is the cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+@lru_cache(maxsize=None)
+def load_encoder(model_name):
+    """The in-process encoder of a sentence-transformers model (loaded once), or None if it is unavailable."""
+    if SentenceTransformer is None:
+        logger.warning("⚠️ sentence-transformers is not installed; embedding features are disabled.")
+        return None
+    try:
+        model = SentenceTransformer(model_name)
+    except Exception as e:
+        logger.error(f"❌ Failed to load embedding model `{model_name}`: {e}")
+        return None
+    logger.info(f"🧠 Loaded embedding model `{model_name}`")
+    return lambda texts: normalise_rows(model.encode(list(texts), convert_to_numpy=True, show_progress_bar=False))
+
+def remote_encoder(url, model_name):
+    """
+    An encoder that sends texts to the embedding server at `url` (see `modules.embedding_server`).
+
+    If the server stops answering mid-run, the model is loaded in-process and used from then on.
+    """
+    local = None
+
+    def encode(texts):
+        nonlocal local
+        if local is None:
+            request = urllib.request.Request(
+                f"{url}/encode", data=json.dumps({"model": model_name, "texts": list(texts)}).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=SystemSettings.embedding_server_timeout) as response:
+                    payload = json.load(response)
+                return np.frombuffer(base64.b64decode(payload["vectors"]), dtype=np.float32).reshape(payload["shape"])
+            except (OSError, ValueError, KeyError) as e:
+                local = load_encoder(model_name)
+                if local is None:
+                    raise
+                _servers_with_model.discard((url, model_name))
+                logger.warning(f"⚠️ Embedding server at {url} failed ({e}); encoding `{model_name}` in-process.")
+        return local(texts)
+    return encode
+
+_servers_with_model = set()  # ✅ Only positive answers are kept; a server started later is still found
+
+def _server_has_model(url, model_name):
+    if (url, model_name) in _servers_with_model:
+        return True
+    try:
+        query = urllib.parse.urlencode({"model": model_name})
+        with urllib.request.urlopen(f"{url}/health?{query}",
+                                    timeout=SystemSettings.embedding_server_probe_timeout) as response:
+            # ✅ None: not loaded yet, the server loads it on the first encode request
+            available = json.load(response).get("model_available") is not False
+    except (OSError, ValueError):
+        return False  # ✅ No server running: load the model in-process
+    if available:
+        _servers_with_model.add((url, model_name))
+        logger.info(f"🧠 Using the embedding server at {url} for `{model_name}`")
+    return available
+
+def load_text_encoder(model_name=None):
+    """
+    A function mapping a list of texts to an L2-normalised float32 matrix (one row per text).
+
+    Uses the warm model of the embedding server at `SystemSettings.embedding_server_url` when
+    one is running, else loads the model in-process. Returns None if sentence-transformers or
+    the model is unavailable, so callers can fall back.
+    """
+    model_name = model_name or SystemSettings.embedding_model or DEFAULT_EMBEDDING_MODEL
+    url = SystemSettings.embedding_server_url
+    if url and _server_has_model(url.rstrip("/"), model_name):
+        return remote_encoder(url.rstrip("/"), model_name)
+    return load_encoder(model_name)
@@ -65,6 +65,33 @@ def get_output_file():
     logger.info(f"✅ Output file set to: {output_file}")
     return output_file
 
+# ✅ OpenAI token pricing (USD per 1K tokens)
+PRICING_TABLE = {
+    "gpt-3.5-turbo": {"input_cost": 0.001, "output_cost": 0.002},
+    "gpt-4": {"input_cost": 0.03, "output_cost": 0.06},
+    "gpt-4-turbo": {"input_cost": 0.01, "output_cost": 0.03},
+    "gpt-4o": {"input_cost": 0.03, "output_cost": 0.06},
+    "gpt-4o-mini": {"input_cost": 0.00015, "output_cost": 0.0006},
+}
+
+def get_model_pricing(model=None):
+    """Per-1K token prices for a model (defaults to the selected model, falling back to gpt-3.5-turbo)."""
+    return PRICING_TABLE.get(model or get_model_name(), PRICING_TABLE["gpt-3.5-turbo"])
+
+def estimate_cost(token_input, token_output, model=None):
+    """Estimated USD cost of a request."""
+    pricing = get_model_pricing(model)
+    return (token_input / 1000) * pricing["input_cost"] + (token_output / 1000) * pricing["output_cost"]
+
+def add_cost_columns(record, model=None):
+    """Return a copy of a prediction record with `Total_Tokens` and `Estimated_Cost ($USD)` added."""
+    token_input, token_output = record.get("Token_Input", 0), record.get("Token_Output", 0)
+    return {
+        **record,
+        "Total_Tokens": token_input + token_output,
+        "Estimated_Cost ($USD)": estimate_cost(token_input, token_output, model),
+    }
+
 def save_csv(df, filename="predictions.csv"):
     """Save AI predictions to CSV in `output/`, including token usage and estimated cost. Updates existing file if available."""
     
@@ -75,17 +102,7 @@ def save_csv(df, filename="predictions.csv"):
     # ✅ Full path to CSV file in `output/`
     csv_path = os.path.join(OUTPUT_DIR, filename)
 
-    # ✅ Define OpenAI token pricing dynamically
-    pricing_table = {
-        "gpt-3.5-turbo": {"input_cost": 0.001, "output_cost": 0.002},
-        "gpt-4": {"input_cost": 0.03, "output_cost": 0.06},
-        "gpt-4-turbo": {"input_cost": 0.01, "output_cost": 0.03},
-        "gpt-4o": {"input_cost": 0.03, "output_cost": 0.06},
-    }
-
-    from modules.system_settings import SystemSettings  # ✅ Lazy import to prevent circular import issues
-    model = SystemSettings.model_name if SystemSettings.model_name else "gpt-3.5-turbo"
-    model_pricing = pricing_table.get(model, pricing_table["gpt-3.5-turbo"])
+    model_pricing = get_model_pricing()
 
     # ✅ Ensure required columns exist
     for col in ["Token_Input", "Token_Output"]:
@@ -0,0 +1,201 @@
+import re
+import json
+import math
+import openai
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+from modules.ai_model import create_chat_completion, create_chat_completion_async
+from modules.openai_client import get_client
+from modules.retry_policy import get_retry_policy
+from modules.prompt_generator import load_status_mapping, load_prompt_from_json
+from modules.compact_schema import codes_enabled, response_format_kwargs
+
+def normalise_label(label):
+    """Compare labels ignoring case, quotes, spaces and punctuation ("In Transit" == "InTransit")."""
+    return re.sub(r"[^a-z0-9]", "", str(label).lower())
+
+DEFAULT_PROMPT_FILE = "data/prompts/system_prompt.json"
+
+def prompt_labels(prompt_path=None):
+    """The `shipmentStatus` enum of a prompt's response schema ([] if the prompt has none)."""
+    content = load_prompt_from_json(prompt_path or DEFAULT_PROMPT_FILE)
+    match = re.search(rf'"{re.escape(SystemSettings.cascade_label_field)}"\s*:\s*\{{\s*"enum"\s*:\s*\[(.*?)\]',
+                      content or "", re.S)
+    return re.findall(r'"([^"]+)"', match.group(1)) if match else []
+
+def load_allowed_labels(prompt_path=None):
+    """
+    Normalised allowed labels: `SystemSettings.cascade_allowed_labels`, else the status enum of
+    the prompt's response schema (the status_mapping.json codes in codes mode).
+    """
+    labels = SystemSettings.cascade_allowed_labels
+    if not labels and not codes_enabled():
+        labels = prompt_labels(prompt_path)
+    if not labels:
+        mapping = load_status_mapping()
+        labels = list(mapping.get("progress", {}).values()) + list(mapping.get("final_status", {}).values())
+    return {normalise_label(label) for label in labels}
+
+def _answer_labels(parsed):
+    """Labels of a parsed JSON answer: one per shipment, or the top-level status field."""
+    if isinstance(parsed, dict) and isinstance(parsed.get("shipments"), list):
+        return [_answer_labels(item)[0] if isinstance(item, dict) else str(item) for item in parsed["shipments"]]
+    if isinstance(parsed, dict) and codes_enabled() and "p" in parsed:
+        return [load_status_mapping().get("progress", {}).get(str(parsed["p"]), str(parsed["p"]))]  # ✅ Code answer
+    if isinstance(parsed, dict):
+        for key in (SystemSettings.cascade_label_field, "status"):  # ✅ "status": decoded code answers
+            if key in parsed:
+                return [str(parsed[key])]
+        return [""]
+    return [parsed] if isinstance(parsed, str) else None
+
+def extract_labels(content):
+    """
+    Every label in a response: `shipments[i].shipmentStatus` of the prompt's JSON answer
+    (`SystemSettings.cascade_label_field`), otherwise the whole text.
+    """
+    try:
+        labels = _answer_labels(json.loads(content))
+    except (TypeError, ValueError):
+        labels = None
+    return labels or [content]
+
+def extract_label(content):
+    """The label of the first shipment in a response (see `extract_labels`)."""
+    return extract_labels(content)[0]
+
+def sequence_probability(response):
+    """
+    Probability of the generated answer: exp(sum of token logprobs).
+
+    Returns None when the response carries no logprobs.
+    """
+    logprobs = response.choices[0].logprobs
+    if logprobs is None or not logprobs.content:
+        return None
+    return math.exp(sum(token.logprob for token in logprobs.content))
+
+def label_probability(response):
+    """
+    Probability of the labels in an answer: exp(sum of the logprobs of the tokens that spell
+    the label values), so the rest of the JSON (field names, counts) does not lower it.
+
+    Falls back to `sequence_probability` for bare label answers. Returns None without logprobs.
+    """
+    logprobs = response.choices[0].logprobs
+    if logprobs is None or not logprobs.content:
+        return None
+    text = "".join(token.token for token in logprobs.content)
+    fields = "|".join(re.escape(field) for field in (SystemSettings.cascade_label_field, "p", "status"))
+    spans = [match.span(1) for match in re.finditer(rf'"(?:{fields})"\s*:\s*"?([^",}}]+)', text)]
+    if not spans:
+        return sequence_probability(response)
+
+    total, offset = 0.0, 0
+    for token in logprobs.content:
+        start, offset = offset, offset + len(token.token)
+        if any(start < end and offset > begin for begin, end in spans):
+            total += token.logprob
+    return math.exp(total)
+
+def escalation_reason(labels, probability, threshold, allowed_labels):
+    """Why a cheap-tier answer (one label or a list of labels) must be re-asked, or None if it can be kept."""
+    labels = [labels] if isinstance(labels, str) else labels
+    if allowed_labels and any(normalise_label(label) not in allowed_labels for label in labels):
+        return "label not in allowed list"
+    if probability is None:
+        return "no logprobs"
+    if probability < threshold:
+        return f"confidence {probability:.2f} < {threshold}"
+    return None
+
+def build_cascade_request(model, prompt_messages, with_logprobs):
+    request = {"model": model, "messages": prompt_messages, "temperature": 0, **response_format_kwargs()}
+    if with_logprobs:
+        request["logprobs"] = True
+    return request
+
+def cascade_models():
+    """(cheap, strong) models from `SystemSettings.cascade_models`."""
+    cheap, strong = SystemSettings.cascade_models[0], SystemSettings.cascade_models[-1]
+    return cheap, strong
+
+def _finish(tier1, tier2, cheap, strong):
+    """Pick the answering tier. Token counts add up both calls, since both were paid for."""
+    content = tier1.choices[0].message.content.strip()
+    probability = label_probability(tier1)
+    token_input, token_output = tier1.usage.prompt_tokens, tier1.usage.completion_tokens
+    if tier2 is None:
+        return content, token_input, token_output, cheap, probability
+
+    return (tier2.choices[0].message.content.strip(), token_input + tier2.usage.prompt_tokens,
+            token_output + tier2.usage.completion_tokens, strong, probability)
+
+def get_cascade_response(prompt_messages, retries=None, allowed_labels=None):
+    """
+    Ask the cheap model first (with logprobs) and re-ask the strong model only when the
+    answer's probability is below `SystemSettings.cascade_threshold` or its label is not allowed.
+
+    Returns:
+        tuple: (predicted_status, token_input, token_output, model_tier, confidence)
+    """
+    cheap, strong = cascade_models()
+    allowed_labels = load_allowed_labels() if allowed_labels is None else allowed_labels
+    client = get_client(SystemSettings.api_key)
+    if client is None:
+        return "Error: No API Key", 0, 0, cheap, None
+    policy = get_retry_policy(retries)
+
+    try:
+        tier1 = create_chat_completion(client, retry_policy=policy, **build_cascade_request(cheap, prompt_messages, True))
+    except openai.OpenAIError as e:
+        logger.error(f"❌ OpenAI API request failed: {e}")
+        return "Error: API request failed", 0, 0, cheap, None
+
+    tier2 = None
+    reason = escalation_reason(extract_labels(tier1.choices[0].message.content.strip()), label_probability(tier1),
+                               SystemSettings.cascade_threshold, allowed_labels)
+    if reason:
+        logger.info(f"⬆️ Escalating to {strong}: {reason}.")
+        try:
+            tier2 = create_chat_completion(client, retry_policy=policy,
+                                           **build_cascade_request(strong, prompt_messages, False))
+        except openai.OpenAIError as e:
+            logger.error(f"❌ {strong} request failed, keeping the {cheap} answer: {e}")
+
+    return _finish(tier1, tier2, cheap, strong)
+
+async def get_cascade_response_async(prompt_messages, client, retries=None, allowed_labels=None):
+    """Async twin of `get_cascade_response` on a shared `AsyncOpenAI` client."""
+    cheap, strong = cascade_models()
+    allowed_labels = load_allowed_labels() if allowed_labels is None else allowed_labels
+    policy = get_retry_policy(retries)
+
+    try:
+        tier1 = await create_chat_completion_async(client, retry_policy=policy,
+                                                   **build_cascade_request(cheap, prompt_messages, True))
+    except openai.OpenAIError as e:
+        logger.error(f"❌ OpenAI API request failed: {e}")
+        return "Error: API request failed", 0, 0, cheap, None
+
+    tier2 = None
+    reason = escalation_reason(extract_labels(tier1.choices[0].message.content.strip()), label_probability(tier1),
+                               SystemSettings.cascade_threshold, allowed_labels)
+    if reason:
+        logger.info(f"⬆️ Escalating to {strong}: {reason}.")
+        try:
+            tier2 = await create_chat_completion_async(client, retry_policy=policy,
+                                                       **build_cascade_request(strong, prompt_messages, False))
+        except openai.OpenAIError as e:
+            logger.error(f"❌ {strong} request failed, keeping the {cheap} answer: {e}")
+
+    return _finish(tier1, tier2, cheap, strong)
+
+def log_cascade_summary(tiers):
+    """Log how many rows each tier answered."""
+    counts = {}
+    for tier in tiers:
+        counts[tier] = counts.get(tier, 0) + 1
+    total = sum(counts.values())
+    summary = ", ".join(f"{tier}: {count} ({count / total:.0%})" for tier, count in counts.items()) if total else "no rows"
+    logger.info(f"🪜 Model cascade: {summary}")
@@ -0,0 +1,118 @@
+import os
+import atexit
+import asyncio
+import threading
+import httpx
+import openai
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+
+_clients = {}  # ✅ api_key -> OpenAI
+_async_clients = {}  # ✅ api_key -> (event loop, AsyncOpenAI)
+_lock = threading.Lock()
+
+def http2_available():
+    """HTTP/2 needs the optional `h2` package (`pip install httpx[http2]`)."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _http_options():
+    """Connection pool, timeouts and protocol settings shared by every pooled client."""
+    return {
+        "limits": httpx.Limits(
+            max_connections=SystemSettings.http_max_connections,
+            max_keepalive_connections=SystemSettings.http_max_keepalive,
+            keepalive_expiry=SystemSettings.http_keepalive_seconds,
+        ),
+        "timeout": httpx.Timeout(SystemSettings.http_timeout_seconds, connect=SystemSettings.http_connect_timeout_seconds),
+        "http2": SystemSettings.use_http2 and http2_available(),
+    }
+
+def _resolve_api_key(api_key):
+    return api_key or SystemSettings.api_key or os.getenv("OPENAI_API_KEY")
+
+def get_client(api_key=None):
+    """
+    Return the process-wide `OpenAI` client for an API key (default: `SystemSettings.api_key`).
+
+    The client keeps a tuned keep-alive connection pool, so consecutive requests reuse
+    TCP/TLS connections instead of paying for a new handshake each time.
+    """
+    api_key = _resolve_api_key(api_key)
+    if not api_key:
+        logger.error("❌ No API key found. Please enter it in `user_input.py` or set OPENAI_API_KEY.")
+        return None
+
+    with _lock:
+        if api_key not in _clients:
+            options = _http_options()
+            _clients[api_key] = openai.OpenAI(
+                api_key=api_key,
+                max_retries=SystemSettings.client_max_retries,
+                http_client=openai.DefaultHttpxClient(**options),
+            )
+            logger.info(f"🔌 Created pooled OpenAI client (HTTP/2: {options['http2']}).")
+        return _clients[api_key]
+
+def get_async_client(api_key=None):
+    """
+    Return the pooled `AsyncOpenAI` client for an API key and the running event loop.
+
+    Async connections belong to the loop that opened them, so each `asyncio.run` gets its own
+    client; it is reused by every coroutine on that loop.
+    """
+    api_key = _resolve_api_key(api_key)
+    if not api_key:
+        logger.error("❌ No API key found. Please enter it in `user_input.py` or set OPENAI_API_KEY.")
+        return None
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    with _lock:
+        # ✅ Keep the loop itself (not its id) so a recycled address never matches a closed loop
+        cached_loop, client = _async_clients.get(api_key, (None, None))
+        if client is None or cached_loop is not loop:
+            options = _http_options()
+            client = openai.AsyncOpenAI(
+                api_key=api_key,
+                max_retries=SystemSettings.client_max_retries,
+                http_client=openai.DefaultAsyncHttpxClient(**options),
+            )
+            _async_clients[api_key] = (loop, client)
+            logger.info(f"🔌 Created pooled AsyncOpenAI client (HTTP/2: {options['http2']}).")
+        return client
+
+async def close_async_client(api_key=None):
+    """Close the running loop's pooled `AsyncOpenAI` client; await it before the loop ends."""
+    api_key = _resolve_api_key(api_key)
+    loop = asyncio.get_running_loop()
+    with _lock:
+        cached_loop, client = _async_clients.get(api_key, (None, None))
+        if client is None or cached_loop is not loop:
+            return
+        del _async_clients[api_key]
+    await client.close()
+
+def close_clients():
+    """Close every pooled client (called automatically at exit)."""
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        leftover = [client for _, client in _async_clients.values()]
+        _async_clients.clear()
+
+    # ✅ Async clients not closed by their runner: close them on a fresh loop
+    for client in leftover:
+        try:
+            asyncio.run(client.close())
+        except Exception as e:
+            logger.warning(f"⚠️ Could not close an AsyncOpenAI client: {e}")
+
+atexit.register(close_clients)
@@ -0,0 +1,164 @@
+import csv
+import io
+import json
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+from modules.token_counter import estimate_tokens
+
+SHIPMENT_FIELDS = ("tracking_number", "shipment_id", "carrier")  # ✅ IDs the answers are matched back on
+
+class PayloadEncoder:
+    """
+    Serialises the user message of a prompt.
+
+    `encode_shipments` takes shipment dicts ({"tracking_number", "shipment_id", "carrier",
+    "scans": [{"timestamp", "scan"}]}) and `encode_scans` a flat list of scan texts. Scan text
+    is expected to be cleaned already (see `prompt_generator.clean_shipments`).
+    """
+
+    name = None
+
+    def encode_shipments(self, shipments):
+        raise NotImplementedError
+
+    def encode_scans(self, scans):
+        raise NotImplementedError
+
+class TextEncoder(PayloadEncoder):
+    """The original "Shipment Start ... Shipment End" blocks and a bulleted scan list."""
+
+    name = "text"
+
+    def encode_shipments(self, shipments):
+        shipment_details = []
+        for shipment in shipments:
+            scans_text = "\n".join(f"- {scan['timestamp']}: {scan['scan']}" for scan in shipment.get("scans", []))
+            shipment_details.append(
+                "\nShipment Start\n"
+                f"Tracking Number: {shipment.get('tracking_number')}\n"
+                f"Shipment ID: {shipment.get('shipment_id')}\n"
+                f"Carrier: {shipment.get('carrier')}\n"
+                "Scans:\n" + scans_text + "\n"
+                "Shipment End\n"
+            )
+        return "\n\n".join(shipment_details)
+
+    def encode_scans(self, scans):
+        return "scans_to_classify:\n" + "\n".join(f"- {scan}" for scan in scans)
+
+class JsonEncoder(PayloadEncoder):
+    """{"shipments": [...]} / {"scans_to_classify": [...]}, pretty-printed or minified."""
+
+    def __init__(self, name, indent=None):
+        self.name = name
+        self.dump_kwargs = {"indent": indent} if indent else {"separators": (",", ":")}
+
+    def encode_shipments(self, shipments):
+        payload = [{**{field: shipment.get(field) for field in SHIPMENT_FIELDS},
+                    "scans": [{"timestamp": scan["timestamp"], "scan": scan["scan"]} for scan in shipment.get("scans", [])]}
+                   for shipment in shipments]
+        return json.dumps({"shipments": payload}, ensure_ascii=False, **self.dump_kwargs)
+
+    def encode_scans(self, scans):
+        return json.dumps({"scans_to_classify": list(scans)}, ensure_ascii=False, **self.dump_kwargs)
+
+class TableEncoder(PayloadEncoder):
+    """
+    One header row, then one row per scan.
+
+    The shipment columns are only filled on a shipment's first row; the rows below it
+    with empty shipment columns belong to the same shipment.
+    """
+
+    def __init__(self, name, delimiter):
+        self.name = name
+        self.delimiter = delimiter
+
+    def write_rows(self, rows):
+        if self.delimiter == "\t":  # ✅ Cleaned scan text has no tabs or newlines, so nothing needs quoting
+            return "\n".join("\t".join(str(value) for value in row) for row in rows)
+        buffer = io.StringIO()
+        csv.writer(buffer, delimiter=self.delimiter, lineterminator="\n").writerows(rows)
+        return buffer.getvalue().rstrip("\n")
+
+    def encode_shipments(self, shipments):
+        rows = [list(SHIPMENT_FIELDS) + ["timestamp", "scan"]]
+        for shipment in shipments:
+            ids = ["" if shipment.get(field) is None else shipment.get(field) for field in SHIPMENT_FIELDS]
+            scans = shipment.get("scans", []) or [{"timestamp": "", "scan": ""}]
+            for position, scan in enumerate(scans):
+                rows.append((ids if position == 0 else [""] * len(ids)) + [scan["timestamp"], scan["scan"]])
+        return self.write_rows(rows)
+
+    def encode_scans(self, scans):
+        return self.write_rows([["scan"]] + [[scan] for scan in scans])
+
+class LineEncoder(PayloadEncoder):
+    """A legend line, then "# id | id | carrier" per shipment followed by one "timestamp scan" line per scan."""
+
+    name = "lines"
+    legend = "# " + " | ".join(SHIPMENT_FIELDS) + ", then one `timestamp scan` line per scan"
+
+    def encode_shipments(self, shipments):
+        lines = [self.legend]
+        for shipment in shipments:
+            lines.append("# " + " | ".join("" if shipment.get(field) is None else str(shipment.get(field))
+                                           for field in SHIPMENT_FIELDS))
+            lines.extend(f"{scan['timestamp']} {scan['scan']}" for scan in shipment.get("scans", []))
+        return "\n".join(lines)
+
+    def encode_scans(self, scans):
+        return "scans_to_classify (one per line):\n" + "\n".join(scans)
+
+PAYLOAD_ENCODERS = {
+    encoder.name: encoder for encoder in (
+        TextEncoder(),
+        JsonEncoder("json", indent=2),
+        JsonEncoder("json_min"),
+        TableEncoder("tsv", "\t"),
+        TableEncoder("csv", ","),
+        LineEncoder(),
+    )
+}
+
+def resolve_payload_format(model=None, default="text"):
+    """
+    The configured payload format for `model`.
+
+    `SystemSettings.payload_format` is either one format name or a {model prefix: name}
+    mapping (longest prefix wins), so each model can use its densest encoding.
+    """
+    configured = SystemSettings.payload_format
+    if isinstance(configured, dict):
+        model = model or SystemSettings.model_name or ""
+        prefixes = [prefix for prefix in configured if model.startswith(prefix)]
+        configured = configured[max(prefixes, key=len)] if prefixes else None
+    return configured or default
+
+def get_payload_encoder(name=None, model=None, default="text"):
+    """The encoder called `name`, else the configured one; unknown names fall back to `default`."""
+    name = name or resolve_payload_format(model, default)
+    if name not in PAYLOAD_ENCODERS:
+        logger.warning(f"⚠️ Unknown payload format `{name}`, using `{default}`. Options: {sorted(PAYLOAD_ENCODERS)}")
+        name = default
+    return PAYLOAD_ENCODERS[name]
+
+def measure_payload_tokens(shipments, models, per_request=20, encoders=None):
+    """
+    Average prompt tokens per shipment for every encoder and model.
+
+    Shipments are encoded `per_request` at a time, as a multi-shipment request would
+    send them, so header-once formats get credit for sharing their header.
+
+    Returns:
+        dict: {model: {encoder name: tokens per shipment}}
+    """
+    encoders = encoders or list(PAYLOAD_ENCODERS)
+    chunks = [shipments[start:start + per_request] for start in range(0, len(shipments), per_request)]
+    results = {}
+    for model in models:
+        results[model] = {}
+        for name in encoders:
+            total = sum(estimate_tokens(PAYLOAD_ENCODERS[name].encode_shipments(chunk), model) for chunk in chunks)
+            results[model][name] = total / len(shipments) if shipments else 0
+    return results
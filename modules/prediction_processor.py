@@ -1,14 +1,213 @@
+import asyncio
 from modules.logging_utils import logger
-from modules.file_handler import load_csv, save_csv
+from modules.file_handler import load_csv, add_cost_columns
 from modules.json_handler import save_json
 from modules.prompt_generator import generate_prompt
-from modules.ai_model import get_openai_response
+from modules.ai_model import get_openai_response, get_openai_response_async
+from modules.model_cascade import (
+    get_cascade_response, get_cascade_response_async, cascade_models, load_allowed_labels,
+    escalation_reason, extract_labels, label_probability, log_cascade_summary
+)
+from modules.openai_client import get_client, get_async_client, close_async_client
+from modules.batch_api import run_batch, get_batch_service
 from modules.conversation_handler import ConversationHandler
+from modules.system_settings import SystemSettings
+from modules.response_cache import get_response_cache
+from modules.scan_dedup import dedup_scan_histories
+from modules.result_sink import open_sink
+from modules.run_ledger import open_run_ledger
+from modules.rule_engine import load_rule_engine, get_audit_sampler, audit_disagreements, log_rule_report
+from modules.status_state_machine import load_two_stage_resolver
+from modules.compact_schema import CodeDecoder, codes_enabled, add_code_instructions, response_format_kwargs
+from modules.scan_compaction import compact_scan_history, log_compaction_savings, add_compaction_notes
+from modules.run_planner import plan_jobs
 import pandas as pd  # ✅ Ensure Pandas is imported for NaN checks
 
-def process_csv(input_file, output_file, json_output_file, selected_column, prompt_file, max_tokens=8192):
-    """Processes a CSV file row by row, makes predictions using AI, and saves results dynamically."""
-    
+SCAN_HISTORY_PREFIX = "Scan History:\n"
+
+def prepare_scan_history(value, level=None):
+    """Turn a raw CSV cell into the scan history text sent to the model (compacted at `scan_compaction_level`)."""
+    # ✅ Ensure scan_history is always a string (fixes TypeError issue)
+    if pd.isna(value):  # ✅ Handle NaN (empty values)
+        return ""
+
+    scan_history = str(value).strip()  # ✅ Convert to string and remove leading/trailing spaces
+    scan_history = compact_scan_history(scan_history, level)
+
+    # ✅ Ensure timestamps are explicitly included
+    if scan_history:
+        scan_history = SCAN_HISTORY_PREFIX + scan_history  # ✅ Makes sure GPT recognizes it
+    return scan_history
+
+def default_model():
+    return SystemSettings.model_name if SystemSettings.model_name else "gpt-4o-mini"
+
+def first_tier_model():
+    """The model every sent row goes to first (the cheap tier in cascade mode)."""
+    return cascade_models()[0] if SystemSettings.use_model_cascade else default_model()
+
+def rule_values(df, selected_column):
+    """The column values the rule engine / two-stage resolver decides rows from."""
+    return df[SystemSettings.rule_scan_group_column or selected_column]
+
+def plan_alignment_stage(plan, rules, df, selected_column):
+    """Add the stage-1 scan group alignment requests a `TwoStageResolver` would send to `plan`."""
+    requests, prompt_tokens, completion_tokens = rules.plan(rule_values(df, selected_column).dropna())
+    plan.add_stage("stage 1 alignment", SystemSettings.scan_group_model, requests, prompt_tokens, completion_tokens)
+    return plan
+
+def build_prediction(scan_history, predicted_status, token_input, token_output, model_tier=None, confidence=None):
+    """Shape a single prediction record for the CSV/JSON outputs."""
+    return {
+        "Input_Text": scan_history,
+        "Predicted_Status": predicted_status,
+        "Token_Input": token_input,
+        "Token_Output": token_output,
+        "Model_Tier": model_tier or default_model(),  # ✅ Which model answered (cascade mode escalates some rows)
+        "Confidence": confidence
+    }
+
+def find_row_key_column(df):
+    """The column that identifies rows across runs: `SystemSettings.row_key_column` or a unique tracking number column."""
+    if SystemSettings.row_key_column:
+        return SystemSettings.row_key_column
+    for column in df.columns:
+        if str(column).lower().replace("_", "").replace(" ", "") == "trackingnumber" and df[column].notna().all() \
+                and df[column].is_unique:
+            return column
+    return None  # ✅ Fall back to the row index
+
+def build_jobs(df, selected_column, prompt_file, rules=None):
+    """
+    Prepare (row_key, scan_history, prompt_messages) for every row that produces a prompt, in input order.
+
+    With a `RuleEngine` (or `TwoStageResolver`), rows it decides get no prompt (prompt_messages
+    is None) unless they are sampled for the audit, in which case the model is asked as well.
+
+    Returns:
+        tuple: (jobs, decisions) where `decisions` is {row_key: rule status}
+    """
+    key_column = find_row_key_column(df)
+    values = rule_values(df, selected_column)
+    audit = get_audit_sampler()
+    if rules:
+        rules.prepare(values.dropna())
+    level = SystemSettings.scan_compaction_level
+    jobs, decisions, raw_texts, compacted_texts = [], {}, [], []
+    for idx, row in df.iterrows():
+        row_key = str(row[key_column]) if key_column else f"row-{idx}"
+        scan_history = prepare_scan_history(row[selected_column])
+        if level and not pd.isna(row[selected_column]):
+            raw_texts.append(str(row[selected_column]).strip())
+            compacted_texts.append(scan_history.removeprefix(SCAN_HISTORY_PREFIX))
+
+        # ✅ Fast path: decide trivially classifiable rows before building their prompt
+        status = rules.decide(None if pd.isna(row[values.name]) else row[values.name]) if rules else None
+        if status:
+            decisions[row_key] = status
+            if not audit():
+                jobs.append((row_key, scan_history, None))
+                continue
+
+        prompt_messages = generate_prompt(scan_history, prompt_file)
+        if prompt_messages and level:
+            prompt_messages = add_compaction_notes(prompt_messages, level)  # ✅ Only compacted runs pay for it
+        if prompt_messages and codes_enabled():
+            prompt_messages = add_code_instructions(prompt_messages)  # ✅ Answer with status_mapping.json codes
+        if prompt_messages:  # ✅ Skip rows whose prompt could not be generated (same as sync mode)
+            jobs.append((row_key, scan_history, prompt_messages))
+    if raw_texts:
+        log_compaction_savings(raw_texts, compacted_texts, level, default_model())
+    return jobs, decisions
+
+def assign_duplicates(jobs):
+    """
+    Map every job to the unique scan history that answers it.
+
+    Returns (representatives, assignments) as in `dedup_scan_histories`; with dedup
+    disabled every job answers itself.
+    """
+    if not SystemSettings.dedup_scan_histories:
+        return list(range(len(jobs))), list(range(len(jobs)))
+    return dedup_scan_histories([scan_history for _, scan_history, _ in jobs])
+
+def build_job_prediction(jobs, representatives, assignments, results, position):
+    """Build the prediction for a job from its unique history's result."""
+    slot = assignments[position]
+    predicted_status, token_input, token_output, *tier = results[slot]
+    if representatives[slot] != position:
+        token_input, token_output = 0, 0  # ✅ Copied from an identical history, no API call made
+    return build_prediction(jobs[position][1], predicted_status, token_input, token_output, *tier)
+
+class PredictionWriter:
+    """
+    Streams predictions to the results sink in input order and records each one in the run ledger.
+
+    On a resumed run, rows the ledger already completed are replayed from it into the
+    output at their original position instead of being sent again. With a `CodeDecoder`,
+    code answers are decoded to labels before they are recorded.
+    """
+
+    def __init__(self, sink, ledger, row_keys, completed=None, decoder=None):
+        self.sink = sink
+        self.ledger = ledger
+        self.row_keys = row_keys
+        self.completed = completed or {}
+        self.decoder = decoder
+        self.predictions = []
+        self._next = 0
+
+    def _emit(self, prediction):
+        self.predictions.append(prediction)
+        self.sink.write(add_cost_columns(prediction))
+
+    def _replay_until(self, row_key=None):
+        while self._next < len(self.row_keys) and self.row_keys[self._next] != row_key:
+            if self.row_keys[self._next] in self.completed:
+                self._emit(self.completed[self.row_keys[self._next]])
+            self._next += 1
+
+    def write(self, row_key, prediction):
+        """Record and emit a new prediction (rows must arrive in input order)."""
+        if self.decoder:
+            prediction = self.decoder.decode_prediction(prediction)
+        self.ledger.record(row_key, prediction)
+        self._replay_until(row_key)
+        self._emit(prediction)
+        self._next += 1
+
+    def finish(self):
+        """Replay any completed rows after the last new prediction."""
+        self._replay_until()
+        return self.predictions
+
+def process_csv(input_file, output_file, json_output_file, selected_column, prompt_file, max_tokens=8192,
+                mode=None, concurrency=None, run_id=None, resume=False):
+    """
+    Processes a CSV file, makes predictions using AI, and saves results dynamically.
+
+    `mode` is "sync" (one request at a time), "async" (up to `concurrency` requests in flight),
+    "batch" (OpenAI Batch API, half price, results within 24h) or "two_stage" (scan texts are
+    mapped to scan groups once and a local state machine derives each status, see
+    `modules.status_state_machine`; only unresolved rows are sent, using
+    `SystemSettings.two_stage_fallback_mode`); both default to the values in `SystemSettings`. Predictions are always returned in input-row order. Rows with an
+    identical normalised scan history share one request (see `modules.scan_dedup`).
+
+    Rows are streamed to `output_file` through an append-only sink chosen by extension
+    (.csv, .jsonl or .parquet); `json_output_file` is written once at the end.
+
+    Every finished row is recorded in the run ledger `run_id`. With `resume=True` rows the
+    ledger already completed are copied from it and only unfinished or failed rows are sent.
+
+    With `SystemSettings.use_rule_engine`, rows ending in an unambiguous terminal scan are
+    decided locally (see `modules.rule_engine`); a sample of them is also sent to the model
+    to report how often the rules disagree with it.
+
+    Before anything is sent the pending rows are planned (`modules.run_planner`); if the
+    projected cost is over `SystemSettings.run_budget_usd` the run stops and returns [].
+    two_stage runs check the stage-1 alignment requests against the budget before sending them.
+    """
+
     logger.info(f"📂 Loading input CSV: {input_file}")
 
     df = load_csv(input_file)
@@ -16,61 +215,254 @@ def process_csv(input_file, output_file, json_output_file, selected_column, prom
         logger.error("❌ Failed to load CSV. Exiting.")
         return []
 
+    mode = mode or SystemSettings.execution_mode
+    if SystemSettings.use_model_cascade:
+        logger.info(f"🪜 Model cascade on: {' -> '.join(cascade_models())} below {SystemSettings.cascade_threshold} confidence.")
+    run_id, ledger = open_run_ledger(run_id, resume)
+    if resume:
+        meta = ledger.get_meta()
+        if meta and (meta.get("input_file"), meta.get("selected_column")) != (input_file, selected_column):
+            logger.warning(f"⚠️ Run `{run_id}` was recorded for {meta.get('input_file')} / {meta.get('selected_column')}.")
+    ledger.set_meta(input_file=input_file, selected_column=selected_column, prompt_file=prompt_file, mode=mode)
+
+    alignment = None
+    if mode == "two_stage":
+        rules = load_two_stage_resolver()
+        mode = SystemSettings.two_stage_fallback_mode
+        if rules:
+            # ✅ Stage 1 sends the unmapped scan texts before any row can be planned; check those first
+            alignment = plan_alignment_stage(plan_jobs([], first_tier_model(), mode, concurrency), rules, df,
+                                             selected_column)
+            alignment.log()
+            if alignment.exceeds_budget():
+                logger.error(f"🛑 Projected stage 1 alignment cost ${alignment.cost:.4f} exceeds the "
+                             f"${SystemSettings.run_budget_usd} run budget. Nothing was sent.")
+                ledger.close()
+                return []
+    else:
+        rules = load_rule_engine() if SystemSettings.use_rule_engine else None
+    jobs, decisions = build_jobs(df, selected_column, prompt_file, rules)
+    completed = ledger.completed() if resume else {}
+
+    # ✅ Rule-decided rows are recorded straight away and replayed into the output like completed rows
+    for row_key, scan_history, prompt_messages in jobs:
+        if prompt_messages is None and row_key not in completed:
+            completed[row_key] = build_prediction(scan_history, decisions[row_key], 0, 0, rules.tier, 1.0)
+            ledger.record(row_key, completed[row_key])
+
+    pending = [job for job in jobs if job[0] not in completed]
+    if resume:
+        logger.info(f"🔁 {len(jobs) - len(pending)} rows already completed, {len(pending)} to send "
+                    f"({len(ledger.failed())} failed rows retried).")
+
+    # ✅ Pre-flight plan of what is about to be sent; refuse the run if it is over budget
+    plan = plan_jobs(pending, first_tier_model(), mode, concurrency)
+    if alignment:
+        plan.stages = alignment.stages + plan.stages  # ✅ Already spent, but part of the run's cost
+    plan.log()
+    if plan.exceeds_budget():
+        sent = "Only the stage 1 alignment was sent." if alignment and alignment.stages[0]["requests"] \
+            else "Nothing was sent."
+        logger.error(f"🛑 Projected cost ${plan.cost:.4f} exceeds the ${SystemSettings.run_budget_usd} run budget. "
+                     f"{sent}")
+        ledger.close()
+        return []
+
+    with open_sink(output_file) as sink:
+        decoder = CodeDecoder(model=default_model()) if codes_enabled() else None
+        writer = PredictionWriter(sink, ledger, [job[0] for job in jobs], completed, decoder)
+        if mode == "async":
+            concurrency = concurrency or SystemSettings.max_concurrency
+            logger.info(f"⚡ Async mode enabled with up to {concurrency} requests in flight.")
+            asyncio.run(process_rows_async(pending, writer, concurrency, prompt_file))
+        elif mode == "batch":
+            process_rows_batch(pending, writer, prompt_file)
+        else:
+            process_rows_sync(pending, writer, prompt_file, max_tokens)
+        predictions = writer.finish()
+
+    # ✅ Final JSON snapshot, written once instead of at every checkpoint
+    save_json(predictions, json_output_file)
+
+    if rules:
+        audit = {row_key: decisions[row_key] for row_key, _, prompt_messages in jobs
+                 if prompt_messages is not None and row_key in decisions}
+        log_rule_report(len(jobs), len(decisions), *audit_disagreements(audit, ledger.completed()), source=rules.tier)
+
+    ledger.log_summary()
+    ledger.close()
+    if decoder:
+        decoder.log_savings()
+    if SystemSettings.use_model_cascade:
+        log_cascade_summary([p["Model_Tier"] for p in predictions])
+    if SystemSettings.use_response_cache:
+        get_response_cache().log_stats()
+    logger.info(f"✅ Processing complete. {len(predictions)} predictions saved to {output_file} (run `{run_id}`).")
+    return predictions
+
+def plan_csv(input_file, selected_column, prompt_file, mode=None, concurrency=None):
+    """
+    Pre-flight `RunPlan` for a file without sending anything.
+
+    Applies the rule engine if enabled. two_stage runs are planned as the stage-1 alignment
+    requests plus every row sent to the fallback mode, an upper bound, since which rows the
+    state machine resolves is only known after the alignment.
+    """
+    df = load_csv(input_file)
+    if df is None:
+        logger.error("❌ Failed to load CSV. Exiting.")
+        return None
+    mode = mode or SystemSettings.execution_mode
+    rules = load_rule_engine() if SystemSettings.use_rule_engine and mode != "two_stage" else None
+    jobs, _ = build_jobs(df, selected_column, prompt_file, rules)
+    if mode != "two_stage":
+        return plan_jobs(jobs, first_tier_model(), mode, concurrency)
+
+    mode = SystemSettings.two_stage_fallback_mode
+    plan = plan_jobs(jobs, first_tier_model(), mode, concurrency)
+    resolver = load_two_stage_resolver()
+    return plan_alignment_stage(plan, resolver, df, selected_column) if resolver else plan
+
+def process_rows_sync(jobs, writer, prompt_file, max_tokens):
+    """Send rows one at a time, streaming each prediction to the writer."""
+    representatives, assignments = assign_duplicates(jobs)
+
     # ✅ Initialize conversation with the system prompt
     conversation = ConversationHandler(prompt_file, max_token_limit=max_tokens)
-    
-    predictions = []
-    batch_size = 50  # ✅ Save results every 50 rows to avoid memory overload
 
-    for idx, row in df.iterrows():
-        scan_history = row[selected_column]
+    results = [None] * len(representatives)
+    allowed_labels = load_allowed_labels(prompt_file) if SystemSettings.use_model_cascade else None
 
-        # ✅ Ensure scan_history is always a string (fixes TypeError issue)
-        if pd.isna(scan_history):  # ✅ Handle NaN (empty values)
-            scan_history = ""
-        else:
-            scan_history = str(scan_history).strip()  # ✅ Convert to string and remove leading/trailing spaces
+    for idx, (row_key, scan_history, prompt_messages) in enumerate(jobs):
+        slot = assignments[idx]
 
-        # ✅ Ensure timestamps are explicitly included
-        if scan_history:
-            scan_history = "Scan History:\n" + scan_history  # ✅ Makes sure GPT recognizes it
+        # ✅ Only the first row of each unique scan history is sent to GPT
+        if results[slot] is None:
+            # ✅ Reset conversation if token limit is exceeded
+            if conversation.token_count + conversation.count_tokens(scan_history) > max_tokens:
+                logger.info("⚠️ Token limit exceeded, resetting conversation state.")
+                conversation.reset_conversation()
 
-        # ✅ Reset conversation if token limit is exceeded
-        if conversation.token_count + conversation.count_tokens(scan_history) > max_tokens:
-            logger.info("⚠️ Token limit exceeded, resetting conversation state.")
-            conversation.reset_conversation()
+            # ✅ Query GPT for prediction (cheap model first in cascade mode)
+            results[slot] = get_cascade_response(prompt_messages, allowed_labels=allowed_labels) \
+                if SystemSettings.use_model_cascade else get_openai_response(prompt_messages)
 
-        # ✅ Generate structured AI prompt
-        prompt_messages = generate_prompt(scan_history, prompt_file)
-        
-        # ✅ Skip if prompt generation fails
-        if not prompt_messages:
-            continue
+            # ✅ Add response to conversation history
+            conversation.add_to_history("user", scan_history)
+            conversation.add_to_history("assistant", results[slot][0])
 
-        # ✅ Query GPT for prediction
-        predicted_status, token_input, token_output = get_openai_response(prompt_messages)
+        # ✅ Record the result and append it to the sink (checkpointed every few rows/seconds)
+        writer.write(row_key, build_job_prediction(jobs, representatives, assignments, results, idx))
 
-        # ✅ Add response to conversation history
-        conversation.add_to_history("user", scan_history)
-        conversation.add_to_history("assistant", predicted_status)
+async def process_rows_async(jobs, writer, concurrency, prompt_file=None):
+    """
+    Fan rows out across up to `concurrency` in-flight requests on a shared `AsyncOpenAI` client.
 
-        # ✅ Store the result in memory
-        predictions.append({
-            "Input_Text": scan_history,
-            "Predicted_Status": predicted_status,
-            "Token_Input": token_input,
-            "Token_Output": token_output
-        })
+    Results are collected by row position and streamed to the writer as a contiguous prefix,
+    so intermediate and final outputs keep the input-row order.
+    """
+    if not jobs:
+        logger.warning("⚠️ No rows left to send.")
+        return
 
-        # ✅ Save periodically to avoid memory overload
-        if idx % batch_size == 0:
-            save_json(predictions, json_output_file)  # ✅ Saves intermediate results
-            save_csv(df, output_file)  # ✅ Save to CSV dynamically
-            logger.info(f"✅ Intermediate results saved. Processed {idx + 1} rows so far.")
+    client = get_async_client()
+    if client is None:
+        return
 
-    # ✅ Final Save after processing all rows
-    save_json(predictions, json_output_file)
-    save_csv(df, output_file)
+    representatives, assignments = assign_duplicates(jobs)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    results = [None] * len(representatives)
+    emitted = 0
+
+    allowed_labels = load_allowed_labels(prompt_file) if SystemSettings.use_model_cascade else None
+
+    async def predict(slot, prompt_messages):
+        async with semaphore:
+            if allowed_labels is not None:
+                results[slot] = await get_cascade_response_async(prompt_messages, client, allowed_labels=allowed_labels)
+            else:
+                results[slot] = await get_openai_response_async(prompt_messages, client)
+
+    # ✅ One request per unique scan history
+    tasks = [asyncio.create_task(predict(slot, jobs[position][2])) for slot, position in enumerate(representatives)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            await finished
+
+            # ✅ Emit the completed prefix so outputs stay in input order
+            while emitted < len(jobs) and results[assignments[emitted]] is not None:
+                writer.write(jobs[emitted][0], build_job_prediction(jobs, representatives, assignments, results, emitted))
+                emitted += 1
+    finally:
+        await close_async_client()  # ✅ Its connections belong to this loop, which ends with the run
+
+    logger.info("✅ Async processing complete.")
+
+def process_rows_batch(jobs, writer, prompt_file=None):
+    """
+    Submit every unique row through the Batch API and merge results back by `custom_id` (row position).
+
+    Rows the batch could not answer are kept in place with an "Error: ..." status.
+    """
+    if not jobs:
+        logger.warning("⚠️ No rows left to submit.")
+        return
+
+    client = None
+    if SystemSettings.batch_service != "local":
+        client = get_client()
+        if client is None:
+            return
+
+    representatives, assignments = assign_duplicates(jobs)
+    cascade = SystemSettings.use_model_cascade
+    model, strong = cascade_models() if cascade else (default_model(), None)
+    extra = {"logprobs": True} if cascade else {}  # ✅ Cascade mode needs the cheap model's token probabilities
+    extra.update(response_format_kwargs())
+    requests = [
+        (f"row-{position}", {"model": model, "messages": jobs[position][2], "temperature": 0, **extra})
+        for position in representatives
+    ]
+    batch_results = run_batch(requests, get_batch_service(client))
+
+    results = []
+    for position in representatives:
+        result = batch_results.get(f"row-{position}", {"response": None, "error": "missing from batch output"})
+        response = result["response"]
+        if response is None:
+            results.append((f"Error: {result['error']}", 0, 0, model, None))
+            continue
+        results.append((
+            response.choices[0].message.content.strip(),
+            response.usage.prompt_tokens,
+            response.usage.completion_tokens,
+            model,
+            label_probability(response) if cascade else None
+        ))
+
+    if cascade:
+        # ✅ Second batch: re-ask the strong model only for low-confidence or unknown labels
+        allowed_labels = load_allowed_labels(prompt_file)
+        escalate = [
+            slot for slot, (content, _, _, _, probability) in enumerate(results)
+            if not content.startswith("Error:")
+            and escalation_reason(extract_labels(content), probability, SystemSettings.cascade_threshold, allowed_labels)
+        ]
+        logger.info(f"⬆️ Escalating {len(escalate)} of {len(results)} rows to {strong}.")
+        strong_results = run_batch([
+            (f"row-{representatives[slot]}", {"model": strong, "messages": jobs[representatives[slot]][2], "temperature": 0,
+                                              **response_format_kwargs()})
+            for slot in escalate
+        ], get_batch_service(client)) if escalate else {}
+        for slot in escalate:
+            response = strong_results.get(f"row-{representatives[slot]}", {}).get("response")
+            if response is None:
+                continue  # ✅ Keep the cheap answer if the strong model failed
+            _, token_input, token_output, _, probability = results[slot]
+            results[slot] = (response.choices[0].message.content.strip(), token_input + response.usage.prompt_tokens,
+                             token_output + response.usage.completion_tokens, strong, probability)
+
+    for position in range(len(jobs)):
+        writer.write(jobs[position][0], build_job_prediction(jobs, representatives, assignments, results, position))
 
-    logger.info("✅ Processing complete. All predictions saved.")
-    return predictions
\ No newline at end of file
+    logger.info("✅ Batch processing complete.")
@@ -1,46 +1,40 @@
 import os
-import json
+import hashlib
+import threading
 import pandas as pd
-import unicodedata
 from modules.json_handler import load_json
 from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+from modules.token_counter import estimate_tokens
+from modules.payload_encoders import get_payload_encoder
+from modules.text_normaliser import normalise_text
 
 PROMPT_DIR = "data/prompts"
+STATUS_MAPPING_FILE = os.path.join(PROMPT_DIR, "status_mapping.json")
 os.makedirs(PROMPT_DIR, exist_ok=True)
 
 def normalize_smart_punctuation(text: str) -> str:
     """
     Replace broken UTF-8 characters (e.g., Â–, â€“) with safe equivalents.
     Keep content meaning intact while ensuring all characters are valid.
+
+    Single-pass implementation in `modules.text_normaliser`; use `normalise_texts` for whole columns.
     """
-    replacements = {
-        # Quotes
-        "“": '"', "”": '"', "‘": "'", "’": "'",
-        # Dashes and ellipsis
-        "–": "-", "—": "-", "…": "...",
-        # Windows encoding artifacts
-        "Â–": "-", "â€“": "-", "â€”": "-", "â€•": "-", "â€”": "-",
-        "Ã©": "é", "Ã¼": "ü", "Ã": "a",
-        # Odd invisible characters
-        "\u0096": "-", "\u0092": "'", "\u0093": '"', "\u0094": '"',
-        "\xa0": " ", "\u00a0": " ",
-        "\u2026": "...", "\u200b": "",  # ellipsis, zero-width space
-    }
-
-    # Step 1: Replace known bad sequences
-    for bad, good in replacements.items():
-        text = text.replace(bad, good)
-
-    # Step 2: Normalize and remove control characters (C0 and C1)
-    text = unicodedata.normalize("NFKC", text)
-    text = ''.join(ch for ch in text if unicodedata.category(ch)[0] != "C")
-
-    return text.strip()
+    return normalise_text(text)
 
 def clean_scan_text(text: str) -> str:
     return normalize_smart_punctuation(text)
 
 
+def load_status_mapping(path=STATUS_MAPPING_FILE) -> dict:
+    """Load the {"progress": {id: label}, "final_status": {id: label}} status lists."""
+    mapping = load_json(path)
+    if not mapping:
+        logger.error(f"🚨 Status mapping not found or empty: {path}")
+        return {"progress": {}, "final_status": {}}
+    return mapping
+
+
 def load_prompt_from_json(prompt_file: str) -> str:
     """
     Load system prompt from structured JSON containing a 'content' field.
@@ -72,23 +66,20 @@ def load_prompt_from_json(prompt_file: str) -> str:
     return normalize_smart_punctuation(combined)
 
 
-def generate_scan_prompt(scan_batch, prompt_path, scan_group_csv="data/scan-groups.csv"):
+def render_system_prompt(prompt_path, scan_group_csv=None):
     """
-    Generate structured OpenAI prompt using system JSON and scan groups CSV.
-
-    Args:
-        scan_batch (list): Raw scan messages.
-        prompt_path (str): Path to system prompt JSON file.
-        scan_group_csv (str): Path to scan group list CSV.
+    Load the system prompt JSON and, with `scan_group_csv`, fill its <<scan_groups>> placeholder.
 
     Returns:
-        list: [system_message, user_message] for OpenAI API.
+        str: The system content, or None on failure.
     """
     # ✅ Load and clean system prompt
     raw_prompt = load_prompt_from_json(prompt_path)
     if not raw_prompt:
         logger.error(f"❌ Failed to load or clean system prompt: {prompt_path}")
         return None
+    if not scan_group_csv:
+        return raw_prompt
 
     # ✅ Load and clean scan group names
     try:
@@ -97,23 +88,147 @@ def generate_scan_prompt(scan_batch, prompt_path, scan_group_csv="data/scan-grou
             logger.error("❌ CSV missing 'scan_group' column.")
             return None
         scan_group_list = df["scan_group"].dropna().tolist()
-        formatted_sg_text = "\n".join(f"- {normalize_smart_punctuation(sg)}" for sg in scan_group_list)
     except Exception as e:
         logger.error(f"❌ Failed to load scan groups from CSV: {e}")
         return None
+    return fill_scan_groups(raw_prompt, scan_group_list)
 
-    # ✅ Insert into system prompt
-    if "<<scan_groups>>" in raw_prompt:
-        system_content = raw_prompt.replace("<<scan_groups>>", formatted_sg_text)
-    else:
+def fill_scan_groups(template, scan_group_list):
+    """Insert the scan groups as a "- name" list into the template's <<scan_groups>> placeholder."""
+    if "<<scan_groups>>" not in template:
         logger.warning("⚠️ No <<scan_groups>> placeholder found in prompt template.")
-        system_content = raw_prompt
+        return template
+    formatted_sg_text = "\n".join(f"- {normalize_smart_punctuation(str(sg))}" for sg in scan_group_list)
+    return template.replace("<<scan_groups>>", formatted_sg_text)
+
+def file_signature(path):
+    """(mtime_ns, size) of a file, or None if it is missing."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+class CompiledPrompt:
+    """
+    A rendered system prompt, reused until one of its source files changes.
+
+    The content is byte-identical between calls, so provider-side prompt caching can
+    match the prefix. Token counts are computed once per model.
+    """
+
+    def __init__(self, content, sources):
+        self.content = content
+        self.sources = sources  # ✅ {path: file_signature(path)} at compile time
+        self.digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        self.tokens = {}
+
+    def token_count(self, model=None):
+        model = model or SystemSettings.model_name or "gpt-4o-mini"
+        if model not in self.tokens:
+            self.tokens[model] = estimate_tokens(self.content, model)
+        return self.tokens[model]
+
+_COMPILED = {}
+_COMPILED_LOCK = threading.Lock()
+
+def compile_prompt(prompt_path, scan_group_csv=None):
+    """
+    The `CompiledPrompt` for a prompt file (and scan group CSV), recompiled only when a source
+    file's mtime or size changes.
+
+    Returns:
+        CompiledPrompt: or None if the prompt cannot be rendered (failures are not cached).
+    """
+    key = (prompt_path, scan_group_csv)
+    sources = {path: file_signature(path) for path in key if path}
+    with _COMPILED_LOCK:
+        compiled = _COMPILED.get(key)
+        if compiled and compiled.sources == sources:
+            return compiled
+
+    content = render_system_prompt(prompt_path, scan_group_csv)
+    if not content:
+        return None
+    compiled = CompiledPrompt(content, sources)
+    compiled.token_count()
+    with _COMPILED_LOCK:
+        _COMPILED[key] = compiled
+    logger.info(f"🧩 Compiled system prompt {prompt_path} ({compiled.token_count()} tokens, {compiled.digest[:12]})")
+    return compiled
+
+def generate_scan_prompt(scan_batch, prompt_path, scan_group_csv="data/scan-groups.csv", payload_format=None,
+                         scan_groups=None):
+    """
+    Generate structured OpenAI prompt using system JSON and scan groups CSV.
+
+    The system content is compiled once per prompt/CSV pair (see `compile_prompt`). With
+    `scan_groups` (e.g. retrieval-pruned candidates) only those groups are listed instead.
+
+    Args:
+        scan_batch (list): Raw scan messages.
+        prompt_path (str): Path to system prompt JSON file.
+        scan_group_csv (str): Path to scan group list CSV.
+        payload_format (str): Encoder for the scan list (default: `SystemSettings.payload_format`, else "json").
+        scan_groups (list): Scan group names to list instead of the whole CSV.
+
+    Returns:
+        list: [system_message, user_message] for OpenAI API.
+    """
+    compiled = compile_prompt(prompt_path, None if scan_groups else scan_group_csv)
+    if not compiled:
+        return None
+    system_content = fill_scan_groups(compiled.content, scan_groups) if scan_groups else compiled.content
 
     # ✅ Normalize scans
     cleaned_batch = [clean_scan_text(scan) for scan in scan_batch]
-    user_content = json.dumps({"scans_to_classify": cleaned_batch}, indent=2)
+    user_content = get_payload_encoder(payload_format, default="json").encode_scans(cleaned_batch)
+
+    return [
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": user_content}
+    ]
+
+def clean_shipments(shipments) -> list:
+    """Copies of the shipment dicts with every scan text cleaned."""
+    return [
+        {**shipment, "scans": [{**scan, "scan": clean_scan_text(str(scan["scan"]))} for scan in shipment.get("scans", [])]}
+        for shipment in shipments
+    ]
+
+def format_shipments(shipments, payload_format=None) -> str:
+    """Render a list of shipment dicts (tracking number, carrier, scans) as prompt text in the configured payload format."""
+    return get_payload_encoder(payload_format).encode_shipments(clean_shipments(shipments))
+
+
+def generate_prompt(scan_history, prompt_file, payload_format=None):
+    """
+    Generate [system, user] messages for the prediction pipeline.
+
+    Args:
+        scan_history (str | list): A single scan history string (CSV flow) or a
+            list of shipment dicts (Mongo flow).
+        prompt_file (str): Path to the system prompt JSON file.
+        payload_format (str): Encoder for shipment lists (see `payload_encoders`).
+
+    Returns:
+        list: [system_message, user_message] for OpenAI API, or None on failure.
+    """
+    compiled = compile_prompt(prompt_file)
+    if not compiled:
+        return None
+    system_content = compiled.content
+
+    if isinstance(scan_history, str):
+        user_content = scan_history
+    else:
+        user_content = format_shipments(scan_history, payload_format)
+
+    if not user_content:
+        logger.warning("⚠️ Empty scan history, skipping prompt generation.")
+        return None
 
     return [
         {"role": "system", "content": system_content},
         {"role": "user", "content": user_content}
-    ]
\ No newline at end of file
+    ]
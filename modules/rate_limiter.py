@@ -0,0 +1,144 @@
+import time
+import asyncio
+import threading
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+from modules.token_counter import count_message_tokens
+
+# ✅ Conservative per-model defaults (requests/tokens per minute); override via `rate_limits` in settings.json
+DEFAULT_RATE_LIMITS = {
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200000},
+    "gpt-4o": {"rpm": 500, "tpm": 30000},
+    "gpt-4-turbo": {"rpm": 500, "tpm": 30000},
+    "gpt-4": {"rpm": 500, "tpm": 10000},
+    "gpt-3.5-turbo": {"rpm": 3500, "tpm": 200000},
+}
+FALLBACK_RATE_LIMIT = {"rpm": 500, "tpm": 30000}
+DEFAULT_COMPLETION_ESTIMATE = 256  # ✅ Budgeted output tokens when a request sets no max_tokens
+
+class TokenBucket:
+    """A bucket that refills continuously up to `capacity` units per minute."""
+
+    def __init__(self, capacity):
+        self.capacity = float(capacity)
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+
+    @property
+    def refill_rate(self):
+        return self.capacity / 60.0
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units are available (0 if they already are)."""
+        amount = min(amount, self.capacity)  # ✅ Oversized requests wait for a full bucket, never forever
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.refill_rate
+
+    def resize(self, capacity):
+        if capacity > 0 and capacity != self.capacity:
+            self.level = min(self.level, float(capacity))
+            self.capacity = float(capacity)
+
+class RateLimiter:
+    """
+    Paces requests against both a requests-per-minute and a tokens-per-minute budget.
+
+    Callers reserve capacity before each request with `acquire` (threads) or
+    `acquire_async` (asyncio), then feed the `x-ratelimit-*` response headers back
+    through `update_from_headers` so the buckets track the provider's view.
+    """
+
+    def __init__(self, rpm, tpm, name="default"):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens):
+        """Reserve one request and `tokens` tokens if possible; otherwise return how long to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if wait == 0:
+                self.requests.level -= 1
+                self.tokens.level -= min(tokens, self.tokens.capacity)
+            return wait
+
+    def acquire(self, tokens):
+        """Block the calling thread until the request fits within both budgets."""
+        while (wait := self._reserve(tokens)) > 0:
+            logger.debug(f"⏳ [{self.name}] Rate limit pacing: waiting {wait:.2f}s for {tokens} tokens.")
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens):
+        """Await until the request fits within both budgets without blocking the event loop."""
+        while (wait := self._reserve(tokens)) > 0:
+            logger.debug(f"⏳ [{self.name}] Rate limit pacing: waiting {wait:.2f}s for {tokens} tokens.")
+            await asyncio.sleep(wait)
+
+    def update_from_headers(self, headers):
+        """Adjust limits and remaining capacity from OpenAI `x-ratelimit-*` response headers."""
+        if not headers:
+            return
+
+        def header_number(name):
+            value = headers.get(name)
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        limit_requests = header_number("x-ratelimit-limit-requests")
+        limit_tokens = header_number("x-ratelimit-limit-tokens")
+        remaining_requests = header_number("x-ratelimit-remaining-requests")
+        remaining_tokens = header_number("x-ratelimit-remaining-tokens")
+
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            if limit_requests:
+                self.requests.resize(limit_requests)
+            if limit_tokens:
+                self.tokens.resize(limit_tokens)
+            # ✅ The server's remaining count is authoritative when it is lower than our estimate
+            if remaining_requests is not None:
+                self.requests.level = min(self.requests.level, remaining_requests)
+            if remaining_tokens is not None:
+                self.tokens.level = min(self.tokens.level, remaining_tokens)
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+def get_limits_for_model(model):
+    """Resolve RPM/TPM for a model: settings override first, then the longest matching default prefix."""
+    overrides = SystemSettings.rate_limits or {}
+    if model in overrides:
+        return {**FALLBACK_RATE_LIMIT, **overrides[model]}
+
+    for prefix in sorted(DEFAULT_RATE_LIMITS, key=len, reverse=True):
+        if model.startswith(prefix):
+            return DEFAULT_RATE_LIMITS[prefix]
+    return FALLBACK_RATE_LIMIT
+
+def get_rate_limiter(model):
+    """Return the process-wide limiter for a model, so every caller shares one budget."""
+    with _LIMITERS_LOCK:
+        if model not in _LIMITERS:
+            limits = get_limits_for_model(model)
+            _LIMITERS[model] = RateLimiter(limits["rpm"], limits["tpm"], name=model)
+            logger.info(f"🚦 Rate limiter for {model}: {limits['rpm']} RPM / {limits['tpm']} TPM")
+        return _LIMITERS[model]
+
+def estimate_request_tokens(request):
+    """Estimate the tokens a chat completion request counts against TPM (prompt + max output)."""
+    prompt_tokens = count_message_tokens(request.get("messages", []), request.get("model", "gpt-4o-mini"))
+    max_output = request.get("max_completion_tokens") or request.get("max_tokens") or DEFAULT_COMPLETION_ESTIMATE
+    return prompt_tokens + max_output
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+
+EVICT_EVERY_N_PUTS = 100  # ✅ Size/age checks run periodically, not on every write
+
+def make_cache_key(request):
+    """
+    Content-address a chat completion request.
+
+    The key is a SHA-256 of the canonical JSON of the whole request (model, messages,
+    temperature, response_format and any other generation parameters), so two
+    requests share an entry only if the API would see exactly the same input.
+    """
+    canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Disk-backed (SQLite) LLM response cache with LRU eviction by entry count, total size and age.
+
+    Values are stored as the serialised API response; `hits`/`misses` count lookups
+    for the lifetime of the object.
+    """
+
+    def __init__(self, path, max_entries=100_000, max_bytes=512 * 1024 * 1024, max_age_seconds=30 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")  # ✅ Lets parallel runs share one cache file
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        self._conn.commit()
+        self.evict()
+
+    def get(self, key):
+        """Return the cached response text for `key`, or None (expired entries count as misses)."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.max_age_seconds and now - row[1] > self.max_age_seconds):
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response, model=None):
+        """Store a response text under `key`, evicting old entries every few writes."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode("utf-8")), now, now),
+            )
+            self._conn.commit()
+            self._puts += 1
+            due = self._puts % EVICT_EVERY_N_PUTS == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least-recently-used ones until count and size fit the limits."""
+        with self._lock:
+            removed = 0
+            if self.max_age_seconds:
+                cursor = self._conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_seconds,)
+                )
+                removed += cursor.rowcount
+
+            count, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            if count > self.max_entries or total_bytes > self.max_bytes:
+                to_free = total_bytes - self.max_bytes
+                to_drop = count - self.max_entries
+                freed = dropped = 0
+                victims = []
+                for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+                    if dropped >= to_drop and freed >= to_free:
+                        break
+                    victims.append((key,))
+                    freed += size
+                    dropped += 1
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+                removed += len(victims)
+
+            self._conn.commit()
+        if removed:
+            logger.info(f"🧹 Response cache evicted {removed} entries.")
+        return removed
+
+    def stats(self):
+        """Return entry count, stored bytes and hit/miss counters."""
+        with self._lock:
+            count, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "bytes": total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(
+            f"💾 Response cache: {stats['hits']} hits / {stats['misses']} misses "
+            f"(hit rate {stats['hit_rate']:.1%}), {stats['entries']} entries, {stats['bytes'] / 1024:.0f} KiB"
+        )
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+def get_response_cache():
+    """Return the process-wide response cache configured in `SystemSettings`."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = ResponseCache(
+                SystemSettings.response_cache_path,
+                max_entries=SystemSettings.response_cache_max_entries,
+                max_bytes=SystemSettings.response_cache_max_mb * 1024 * 1024,
+                max_age_seconds=SystemSettings.response_cache_max_age_days * 24 * 3600,
+            )
+            logger.info(f"💾 Response cache opened at {SystemSettings.response_cache_path}")
+        return _CACHE
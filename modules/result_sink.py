@@ -0,0 +1,152 @@
+import os
+import csv
+import json
+import time
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # ✅ Parquet output is optional (`pip install pyarrow`)
+    pa = pq = None
+
+class ResultSink:
+    """
+    Append-only results writer.
+
+    Rows are buffered in memory and appended to disk when `flush_rows` rows are waiting
+    or `flush_seconds` have passed since the last flush. Every flush is a checkpoint:
+    only the new rows are written, then the file is fsynced, so checkpoint cost stays
+    constant no matter how long the run is.
+    """
+
+    def __init__(self, path, mode="w", flush_rows=None, flush_seconds=None):
+        self.path = path
+        self.mode = mode
+        self.flush_rows = flush_rows or SystemSettings.results_flush_rows
+        self.flush_seconds = SystemSettings.results_flush_seconds if flush_seconds is None else flush_seconds
+        self.rows_written = 0
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def write(self, record):
+        """Queue one record, flushing if the row or time threshold is reached."""
+        self._buffer.append(record)
+        if len(self._buffer) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        """Append buffered rows and fsync (a checkpoint)."""
+        if self._buffer:
+            self._append(self._buffer)
+            self.rows_written += len(self._buffer)
+            self._buffer = []
+            self._sync()
+            logger.info(f"💾 Checkpoint: {self.rows_written} rows written to {self.path}")
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _append(self, records):
+        raise NotImplementedError
+
+    def _sync(self):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+class _TextFileSink(ResultSink):
+    """Shared open/fsync/close for line-oriented text formats."""
+
+    def __init__(self, path, mode="w", flush_rows=None, flush_seconds=None):
+        super().__init__(path, mode, flush_rows, flush_seconds)
+        self._file = open(path, mode, encoding="utf-8", newline="")
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _close(self):
+        self._file.close()
+
+class CsvSink(_TextFileSink):
+    """CSV back end. The header comes from the first record (or the existing file when appending)."""
+
+    def __init__(self, path, mode="w", flush_rows=None, flush_seconds=None):
+        self._fieldnames = None
+        if mode == "a" and os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                self._fieldnames = next(csv.reader(f), None)
+        super().__init__(path, mode, flush_rows, flush_seconds)
+        self._writer = None
+
+    def _append(self, records):
+        if self._writer is None:
+            if self._fieldnames is None:
+                self._fieldnames = list(records[0].keys())
+                self._writer = csv.DictWriter(self._file, fieldnames=self._fieldnames, extrasaction="ignore")
+                self._writer.writeheader()
+            else:
+                self._writer = csv.DictWriter(self._file, fieldnames=self._fieldnames, extrasaction="ignore")
+        self._writer.writerows(records)
+
+class JsonlSink(_TextFileSink):
+    """JSON Lines back end: one JSON object per line."""
+
+    def _append(self, records):
+        self._file.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+class ParquetSink(ResultSink):
+    """
+    Parquet back end (requires `pyarrow`). Each flush appends one row group.
+
+    Parquet cannot be reopened for appending, and the file is only readable once the sink is closed.
+    """
+
+    def __init__(self, path, mode="w", flush_rows=None, flush_seconds=None):
+        if pq is None:
+            raise ImportError("❌ Parquet output needs `pyarrow` (pip install pyarrow).")
+        if mode != "w":
+            raise ValueError("❌ Parquet files cannot be appended to. Use a CSV or JSONL sink to resume.")
+        super().__init__(path, mode, flush_rows, flush_seconds)
+        self._file = open(path, "wb")
+        self._writer = None
+
+    def _append(self, records):
+        table = pa.Table.from_pylist(records, schema=self._writer.schema if self._writer else None)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._file, table.schema)
+        self._writer.write_table(table)
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._file.close()
+
+SINKS = {".csv": CsvSink, ".jsonl": JsonlSink, ".parquet": ParquetSink}
+
+def open_sink(path, mode="w", flush_rows=None, flush_seconds=None):
+    """Open the sink matching the file extension (.csv, .jsonl or .parquet)."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SINKS:
+        raise ValueError(f"❌ Unsupported results format `{extension}`. Use one of: {', '.join(SINKS)}")
+    return SINKS[extension](path, mode, flush_rows, flush_seconds)
@@ -0,0 +1,206 @@
+import time
+import json
+import random
+import asyncio
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import openai
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+
+# ✅ Error kinds returned by `classify_error`
+RATE_LIMIT = "rate_limit"
+QUOTA = "quota"
+TIMEOUT = "timeout"
+CONNECTION = "connection"
+SERVER = "server"
+CONFLICT = "conflict"
+INVALID_RESPONSE = "invalid_response"
+INVALID_REQUEST = "invalid_request"
+AUTH = "auth"
+UNKNOWN = "unknown"
+
+RETRYABLE_ERRORS = {RATE_LIMIT, TIMEOUT, CONNECTION, SERVER, CONFLICT, INVALID_RESPONSE}
+OUTAGE_ERRORS = {TIMEOUT, CONNECTION, SERVER}  # ✅ Only these count towards opening the circuit breaker
+
+class InvalidResponseError(ValueError):
+    """A response that arrived but cannot be used (wrong JSON shape); retried like malformed JSON."""
+
+def classify_error(error):
+    """Sort an exception into one of the error kinds above."""
+    if isinstance(error, openai.RateLimitError):
+        # ✅ An exhausted quota also comes back as a 429, but waiting won't fix it
+        return QUOTA if getattr(error, "code", None) == "insufficient_quota" else RATE_LIMIT
+    if isinstance(error, openai.APITimeoutError):
+        return TIMEOUT
+    if isinstance(error, openai.APIConnectionError):
+        return CONNECTION
+    if isinstance(error, (openai.AuthenticationError, openai.PermissionDeniedError)):
+        return AUTH
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code == 408:
+            return TIMEOUT
+        if error.status_code == 409:
+            return CONFLICT
+        if error.status_code >= 500:
+            return SERVER
+        return INVALID_REQUEST
+    if isinstance(error, (json.JSONDecodeError, InvalidResponseError, openai.APIResponseValidationError)):
+        return INVALID_RESPONSE
+    return UNKNOWN
+
+def get_retry_after(error):
+    """Seconds the server asked us to wait (`retry-after-ms` or `retry-after`), or None."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            # ✅ HTTP-date form
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    """
+    Process-wide circuit breaker shared by every thread and coroutine calling one service.
+
+    After `failure_threshold` consecutive outage errors (timeouts, connection errors, 5xx)
+    the circuit opens and every caller waits `reset_seconds` instead of retrying on its own.
+    Then a single probe request goes through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_seconds=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _wait_time(self):
+        """How long the caller must wait before sending (0 = go ahead)."""
+        with self._lock:
+            if self.state == "closed":
+                return 0
+            if self.state == "open":
+                remaining = self._opened_at + self.reset_seconds - time.monotonic()
+                if remaining > 0:
+                    return remaining
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if not self._probe_in_flight:
+                self._probe_in_flight = True  # ✅ This caller is the probe
+                return 0
+            return min(1.0, self.reset_seconds)  # ✅ Wait for the probe's verdict
+
+    def wait(self):
+        while (delay := self._wait_time()) > 0:
+            time.sleep(delay)
+
+    async def wait_async(self):
+        while (delay := self._wait_time()) > 0:
+            await asyncio.sleep(delay)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"🟢 Circuit `{self.name}` closed again.")
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                logger.error(f"🔴 Circuit `{self.name}` opened after {self.failures} failures. "
+                             f"Pausing all requests for {self.reset_seconds}s.")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(name="openai"):
+    """Return the process-wide circuit breaker for a service."""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, SystemSettings.breaker_failure_threshold,
+                                             SystemSettings.breaker_reset_seconds)
+        return _breakers[name]
+
+class RetryPolicy:
+    """
+    Retries retryable errors with full-jitter exponential backoff, honouring `Retry-After`,
+    behind a shared circuit breaker. Non-retryable errors (bad requests, auth, quota) raise at once.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=60.0, breaker=None):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or get_circuit_breaker()
+
+    def backoff(self, attempt, retry_after=None):
+        """Full jitter: uniform(0, min(max_delay, base * 2^(attempt-1))); the server's Retry-After wins if longer."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def _on_error(self, error, attempt):
+        """Update the breaker and return the delay before the next attempt, or re-raise."""
+        kind = classify_error(error)
+        if kind in OUTAGE_ERRORS:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()  # ✅ The service answered, it just rejected or throttled this request
+
+        if kind not in RETRYABLE_ERRORS or attempt >= self.max_attempts:
+            logger.error(f"❌ Giving up after attempt {attempt} ({kind}): {error}")
+            raise error
+
+        delay = self.backoff(attempt, get_retry_after(error))
+        logger.warning(f"⚠️ Attempt {attempt} failed ({kind}): {error}. Retrying in {delay:.1f}s...")
+        return delay
+
+    def call(self, fn, *args, **kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            self.breaker.wait()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                time.sleep(self._on_error(e, attempt))
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def call_async(self, fn, *args, **kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            await self.breaker.wait_async()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                await asyncio.sleep(self._on_error(e, attempt))  # ✅ Only this request waits
+                continue
+            self.breaker.record_success()
+            return result
+
+def get_retry_policy(max_attempts=None):
+    """A retry policy with the configured backoff, sharing the process-wide OpenAI circuit breaker."""
+    return RetryPolicy(
+        max_attempts=max_attempts or SystemSettings.retry_max_attempts,
+        base_delay=SystemSettings.retry_base_delay_seconds,
+        max_delay=SystemSettings.retry_max_delay_seconds,
+        breaker=get_circuit_breaker("openai"),
+    )
@@ -0,0 +1,113 @@
+import os
+import random
+from datetime import datetime
+from modules.logging_utils import logger
+from modules.json_handler import load_json
+from modules.system_settings import SystemSettings
+from modules.prompt_generator import PROMPT_DIR, load_status_mapping
+from modules.scan_dedup import parse_scan_history, normalise_scan_text
+from modules.model_cascade import normalise_label, extract_label
+
+RULES_FILE = os.path.join(PROMPT_DIR, "scan_group_status_rules.json")
+RULE_TIER = "rules"  # ✅ `Model_Tier` of rows decided without the model
+
+def resolve_status(value, mapping, status_field="progress"):
+    """A status id from status_mapping.json (e.g. "4") becomes its label; anything else is used as-is."""
+    return mapping.get(status_field, {}).get(str(value), value)
+
+class RuleEngine:
+    """
+    Decides the status of shipments whose history ends in an unambiguous terminal scan.
+
+    A rule fires when every scan at the latest timestamp maps to the same terminal status
+    and no action-required scan (damage, claim, investigation...) appears anywhere in the
+    history. Anything else, including histories without parseable timestamps, is left to the model.
+    """
+
+    tier = RULE_TIER
+
+    def __init__(self, terminal, action_required=()):
+        self.terminal = {normalise_scan_text(scan): status for scan, status in terminal.items()}
+        self.action_required = {normalise_scan_text(scan) for scan in action_required}
+
+    def prepare(self, values):
+        """Nothing to precompute: each history is decided on its own."""
+
+    def decide(self, value):
+        """The status for a scan history (CSV string or Mongo list), or None if no confident rule matches."""
+        entries = []
+        for timestamp, scan in parse_scan_history(value):
+            try:
+                entries.append((datetime.fromisoformat(timestamp.strip()), normalise_scan_text(scan)))
+            except ValueError:
+                return None  # ✅ Without timestamps we can't tell which scan is the latest
+
+        if not entries or any(scan in self.action_required for _, scan in entries):
+            return None
+
+        latest = max(timestamp for timestamp, _ in entries)
+        statuses = {self.terminal.get(scan) for timestamp, scan in entries if timestamp == latest}
+        if len(statuses) != 1 or None in statuses:
+            return None
+        return statuses.pop()
+
+def load_rule_engine(path=None):
+    """Build the rule engine from the scan-group → status table, or None if it can't be loaded."""
+    path = path or SystemSettings.rule_file or RULES_FILE
+    rules = load_json(path)
+    if not rules or not rules.get("terminal"):
+        logger.error(f"🚨 Status rules not found or empty: {path}")
+        return None
+
+    mapping = load_status_mapping()
+    status_field = rules.get("status_field", "progress")
+    terminal = {scan: resolve_status(status, mapping, status_field) for scan, status in rules["terminal"].items()}
+    known = {normalise_label(label) for label in mapping.get(status_field, {}).values()}
+    unknown = sorted({status for status in terminal.values() if normalise_label(status) not in known})
+    if unknown:
+        logger.warning(f"⚠️ Rule statuses not in status_mapping.json `{status_field}`: {unknown}")
+
+    logger.info(f"📏 Loaded {len(terminal)} terminal scan rules from {path}")
+    return RuleEngine(terminal, rules.get("action_required", []))
+
+def get_audit_sampler(rate=None, seed=None):
+    """
+    Returns a function that picks rule-decided rows to send to the model as well.
+
+    The seed is fixed so a resumed run audits the same rows.
+    """
+    rate = SystemSettings.rule_audit_rate if rate is None else rate
+    rng = random.Random(SystemSettings.rule_audit_seed if seed is None else seed)
+    return lambda: rate > 0 and rng.random() < rate
+
+def audit_disagreements(audit, records):
+    """
+    Compare rule decisions with the model's answers on the audit rows.
+
+    Args:
+        audit (dict): {row_key: rule status}
+        records (dict): {row_key: prediction record} as stored in the run ledger
+
+    Returns:
+        tuple: (number of audit rows the model answered, [(row_key, rule status, model answer), ...])
+    """
+    answered, disagreements = 0, []
+    for row_key, status in audit.items():
+        answer = str(records.get(row_key, {}).get("Predicted_Status", ""))
+        if not answer or answer.startswith("Error:"):
+            continue
+        answered += 1
+        if normalise_label(extract_label(answer)) != normalise_label(status):
+            disagreements.append((row_key, status, answer))
+    return answered, disagreements
+
+def log_rule_report(total, decided, audited, disagreements, source=RULE_TIER):
+    """Log how many rows `source` decided and the disagreement rate on the audit sample."""
+    coverage = decided / total if total else 0
+    logger.info(f"📏 {source} decided {decided} of {total} rows ({coverage:.1%}) without the model.")
+    if not audited:
+        return
+    logger.info(f"🔎 {source} audit: model disagreed on {len(disagreements)} of {audited} sampled rows "
+                f"({len(disagreements) / audited:.1%}).")
+    for row_key, status, answer in disagreements[:10]:
+        logger.warning(f"⚠️ {source} said `{status}` but the model said `{answer}` for {row_key}")
@@ -0,0 +1,128 @@
+import os
+import json
+import glob
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+
+class RunLedger:
+    """
+    Crash-safe (SQLite) record of every row a prediction run has finished.
+
+    Each row key (tracking number or row index) holds its latest prediction record, token
+    usage and error. Every write is committed straight away, so a run that dies keeps
+    everything it paid for and `--resume` only re-sends unfinished or failed rows.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")  # ✅ Cheap per-row commits that survive a crash
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            " row_key TEXT PRIMARY KEY, status TEXT NOT NULL, record TEXT, token_input INTEGER NOT NULL,"
+            " token_output INTEGER NOT NULL, error TEXT, attempts INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    def set_meta(self, **values):
+        """Store run details (input file, column, prompt, mode) to check on resume."""
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                                   [(name, json.dumps(value)) for name, value in values.items()])
+            self._conn.commit()
+
+    def get_meta(self):
+        with self._lock:
+            return {name: json.loads(value) for name, value in self._conn.execute("SELECT name, value FROM meta")}
+
+    def record(self, row_key, record=None, error=None):
+        """
+        Record the outcome of one row. A row is failed when `error` is given or its
+        `Predicted_Status` starts with "Error:" (how `get_openai_response` reports failures).
+        """
+        record = record or {}
+        status = str(record.get("Predicted_Status", ""))
+        if error is None and status.startswith("Error:"):
+            error = status
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO rows (row_key, status, record, token_input, token_output, error, attempts, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, 1, ?)"
+                " ON CONFLICT(row_key) DO UPDATE SET status = excluded.status, record = excluded.record,"
+                " token_input = excluded.token_input, token_output = excluded.token_output,"
+                " error = excluded.error, attempts = rows.attempts + 1, updated_at = excluded.updated_at",
+                (str(row_key), "error" if error else "ok", json.dumps(record, ensure_ascii=False, default=str),
+                 int(record.get("Token_Input", 0) or 0), int(record.get("Token_Output", 0) or 0), error, time.time()),
+            )
+            self._conn.commit()
+
+    def completed(self):
+        """{row_key: record} for every row that finished without an error."""
+        with self._lock:
+            rows = self._conn.execute("SELECT row_key, record FROM rows WHERE status = 'ok'").fetchall()
+        return {row_key: json.loads(record) for row_key, record in rows}
+
+    def failed(self):
+        """{row_key: error} for every row whose last attempt failed."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT row_key, error FROM rows WHERE status = 'error'").fetchall())
+
+    def summary(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COALESCE(SUM(status = 'ok'), 0), COALESCE(SUM(status = 'error'), 0),"
+                " COALESCE(SUM(token_input), 0), COALESCE(SUM(token_output), 0) FROM rows"
+            ).fetchone()
+        return {"completed": row[0], "failed": row[1], "token_input": row[2], "token_output": row[3]}
+
+    def log_summary(self):
+        s = self.summary()
+        logger.info(f"📒 Run ledger {self.path}: {s['completed']} completed, {s['failed']} failed, "
+                    f"{s['token_input']} input / {s['token_output']} output tokens.")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def ledger_path(run_id):
+    return os.path.join(SystemSettings.run_ledger_dir, f"{run_id}.sqlite")
+
+def latest_run_id():
+    """The most recently updated run in `SystemSettings.run_ledger_dir`, or None."""
+    paths = glob.glob(os.path.join(SystemSettings.run_ledger_dir, "*.sqlite"))
+    if not paths:
+        return None
+    return os.path.splitext(os.path.basename(max(paths, key=os.path.getmtime)))[0]
+
+def open_run_ledger(run_id=None, resume=False):
+    """
+    Open the ledger for a run.
+
+    A new run gets a timestamped id unless `run_id` is given. Resuming without a
+    `run_id` picks up the most recent run.
+
+    Returns:
+        tuple: (run_id, RunLedger)
+    """
+    if resume and not run_id:
+        run_id = latest_run_id()
+        if run_id is None:
+            logger.warning("⚠️ No previous run found to resume. Starting a new run.")
+    run_id = run_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    path = ledger_path(run_id)
+    if resume and os.path.exists(path):
+        logger.info(f"🔁 Resuming run `{run_id}` from {path}")
+    else:
+        logger.info(f"📒 Recording run `{run_id}` in {path}")
+    return run_id, RunLedger(path)
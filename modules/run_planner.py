@@ -0,0 +1,155 @@
+import math
+import numpy as np
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+from modules.token_counter import count_tokens_batch, TOKENS_PER_MESSAGE, TOKENS_PER_REPLY
+from modules.file_handler import get_model_pricing
+from modules.rate_limiter import get_limits_for_model, DEFAULT_COMPLETION_ESTIMATE
+from modules.token_packer import get_token_budget, completion_tokens_per_shipment
+from modules.scan_dedup import dedup_scan_histories
+
+BATCH_DISCOUNT = 0.5  # ✅ The Batch API bills half the synchronous price
+PERCENTILES = (50, 90, 99)
+
+class RunPlan:
+    """
+    Projected tokens, cost and duration of the requests a run will send.
+
+    `prompt_tokens` holds one entry per request (system prompt, scan history and chat
+    overhead). Time is projected from the model's RPM/TPM limits (`rate_limiter`), which
+    reserve `DEFAULT_COMPLETION_ESTIMATE` output tokens per request, and from
+    `SystemSettings.seconds_per_request` spread over the concurrency.
+
+    Requests to other models (stage-1 scan group alignment, cascade escalations) are added
+    with `add_stage` and count towards `cost`.
+    """
+
+    def __init__(self, model, mode, rows, prompt_tokens, system_tokens=0, completion_tokens=None, concurrency=None):
+        self.model = model
+        self.mode = mode
+        self.rows = rows
+        self.prompt_tokens = np.asarray(prompt_tokens, dtype=np.int64)
+        self.system_tokens = system_tokens
+        self.completion_per_request = SystemSettings.expected_completion_tokens if completion_tokens is None \
+            else completion_tokens
+        self.concurrency = concurrency or (SystemSettings.max_concurrency if mode == "async" else 1)
+        self.stages = []
+
+    def add_stage(self, name, model, requests, prompt_tokens, completion_tokens, mode="sync"):
+        """Add `requests` to another model to the projected cost (Batch API at half price)."""
+        pricing = get_model_pricing(model)
+        cost = (prompt_tokens / 1000) * pricing["input_cost"] + (completion_tokens / 1000) * pricing["output_cost"]
+        self.stages.append({
+            "name": name, "model": model, "requests": int(requests), "prompt_tokens": int(prompt_tokens),
+            "completion_tokens": int(completion_tokens), "cost_usd": cost * BATCH_DISCOUNT if mode == "batch" else cost,
+        })
+
+    @property
+    def requests(self):
+        return len(self.prompt_tokens)
+
+    @property
+    def total_prompt_tokens(self):
+        return int(self.prompt_tokens.sum())
+
+    @property
+    def total_completion_tokens(self):
+        return self.requests * self.completion_per_request
+
+    @property
+    def cost(self):
+        """Projected USD cost from `PRICING_TABLE` (Batch API at half price)."""
+        pricing = get_model_pricing(self.model)
+        cost = (self.total_prompt_tokens / 1000) * pricing["input_cost"] \
+            + (self.total_completion_tokens / 1000) * pricing["output_cost"]
+        cost = cost * BATCH_DISCOUNT if self.mode == "batch" else cost
+        return cost + sum(stage["cost_usd"] for stage in self.stages)
+
+    def percentiles(self):
+        """{"p50": ..., "p90": ..., "p99": ..., "max": ...} prompt tokens per request."""
+        if not self.requests:
+            return {f"p{p}": 0 for p in PERCENTILES} | {"max": 0}
+        values = np.percentile(self.prompt_tokens, PERCENTILES)
+        return {f"p{p}": int(math.ceil(v)) for p, v in zip(PERCENTILES, values)} | {"max": int(self.prompt_tokens.max())}
+
+    def projected_seconds(self):
+        """Wall-clock estimate: the slower of the rate limits and request latency (None for the Batch API)."""
+        if self.mode == "batch":
+            return None  # ✅ Up to the 24h completion window, not rate-limited
+        limits = get_limits_for_model(self.model)
+        rate_bound = 60 * max(self.requests / limits["rpm"],
+                              (self.total_prompt_tokens + self.requests * DEFAULT_COMPLETION_ESTIMATE) / limits["tpm"])
+        latency_bound = self.requests * SystemSettings.seconds_per_request / max(1, self.concurrency)
+        return max(rate_bound, latency_bound)
+
+    def recommended_batch_size(self):
+        """
+        Shipments per multi-shipment request: as many p90-sized histories as fit the model's
+        prompt/completion budgets and a single minute of its TPM limit, up to `max_shipments_per_request`.
+        """
+        budget = get_token_budget(self.model)
+        limits = get_limits_for_model(self.model)
+        per_item = max(1, self.percentiles()["p90"] - self.system_tokens)
+        by_prompt = (min(budget["prompt"], limits["tpm"]) - self.system_tokens) // per_item
+        by_completion = budget["completion"] // completion_tokens_per_shipment(self.model)
+        by_count = SystemSettings.max_shipments_per_request or by_completion
+        return max(1, min(by_prompt, by_completion, by_count, self.requests or 1))
+
+    def exceeds_budget(self, budget_usd=None):
+        budget_usd = SystemSettings.run_budget_usd if budget_usd is None else budget_usd
+        return budget_usd is not None and self.cost > budget_usd
+
+    def as_dict(self):
+        return {
+            "model": self.model, "mode": self.mode, "rows": self.rows, "requests": self.requests,
+            "prompt_tokens": self.total_prompt_tokens, "completion_tokens": self.total_completion_tokens,
+            "cost_usd": round(self.cost, 4), "projected_seconds": self.projected_seconds(),
+            "recommended_batch_size": self.recommended_batch_size(), **self.percentiles(),
+            "stages": [{**stage, "cost_usd": round(stage["cost_usd"], 4)} for stage in self.stages],
+        }
+
+    def log(self):
+        seconds = self.projected_seconds()
+        duration = "up to 24h (Batch API)" if seconds is None else f"~{seconds / 60:.1f} min"
+        spread = ", ".join(f"{name} {value}" for name, value in self.percentiles().items())
+        logger.info(f"🧮 Run plan ({self.model}, {self.mode}): {self.requests} requests for {self.rows} rows, "
+                    f"{self.total_prompt_tokens} prompt + ~{self.total_completion_tokens} completion tokens, "
+                    f"~${self.cost:.4f}, {duration}.")
+        for stage in self.stages:
+            logger.info(f"🧮   incl. {stage['name']} ({stage['model']}): {stage['requests']} requests, "
+                        f"{stage['prompt_tokens']} prompt + ~{stage['completion_tokens']} completion tokens, "
+                        f"~${stage['cost_usd']:.4f}.")
+        logger.info(f"🧮 Prompt tokens per request: {spread}. "
+                    f"Recommended multi-shipment batch size: {self.recommended_batch_size()}.")
+
+def plan_jobs(jobs, model, mode="sync", concurrency=None, completion_tokens=None):
+    """
+    Plan the (row_key, scan_history, prompt_messages) jobs `process_csv` would send.
+
+    Rows without a prompt (decided locally) cost nothing, and rows with a duplicate
+    scan history are counted once, as they are sent once. All user messages are tokenised
+    in one `encode_batch` call; each distinct system prompt is tokenised once.
+
+    With `SystemSettings.use_model_cascade`, `model` is the cheap tier and a
+    `cascade_escalation_estimate` share of the requests is added again for the strong model.
+    """
+    prompted = [job for job in jobs if job[2] is not None]
+    if SystemSettings.dedup_scan_histories and prompted:
+        representatives, _ = dedup_scan_histories([scan_history for _, scan_history, _ in prompted])
+        prompted = [prompted[index] for index in representatives]
+
+    systems = sorted({messages[0]["content"] for _, _, messages in prompted})
+    system_tokens = dict(zip(systems, count_tokens_batch(systems, model, SystemSettings.planner_threads)))
+    user_tokens = count_tokens_batch([messages[-1]["content"] for _, _, messages in prompted], model,
+                                     SystemSettings.planner_threads)
+
+    overhead = TOKENS_PER_REPLY + 2 * TOKENS_PER_MESSAGE
+    prompt_tokens = [system_tokens[messages[0]["content"]] + tokens + overhead
+                     for (_, _, messages), tokens in zip(prompted, user_tokens)]
+    plan = RunPlan(model, mode, len(jobs), prompt_tokens, max(system_tokens.values(), default=0) + overhead,
+                   completion_tokens, concurrency)
+    if SystemSettings.use_model_cascade and plan.requests:
+        share = SystemSettings.cascade_escalation_estimate
+        plan.add_stage("cascade escalation", SystemSettings.cascade_models[-1], math.ceil(share * plan.requests),
+                       share * plan.total_prompt_tokens, share * plan.total_completion_tokens, mode)
+    return plan
@@ -0,0 +1,145 @@
+import re
+from datetime import datetime
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+from modules.scan_dedup import parse_scan_history
+from modules.token_counter import estimate_tokens, count_tokens_batch, get_optional_encoding
+
+# ✅ Each level includes everything below it
+COMPACTION_LEVELS = {
+    0: "unchanged",
+    1: "drop duplicate entries, collapse consecutive repeats",
+    2: "timestamps as deltas from the first scan",
+    3: "strip carrier and facility boilerplate",
+}
+
+# ✅ (pattern, replacement) pairs for level 3; they only remove words that carry no status information
+# (locations such as "EAST MIDLANDS-UNITED KINGDOM" are kept)
+BOILERPLATE_PATTERNS = [
+    (re.compile(r"\s*Note - The Customs clearance process may start while the shipment is in transit to the destination\.",
+                re.IGNORECASE), ""),
+    (re.compile(r"\s*Once (?:received|they release it),? [^.]*\.", re.IGNORECASE), ""),
+    (re.compile(r"\b(?:FedEx|UPS|DHL|Evri)\s+", re.IGNORECASE), ""),
+    (re.compile(r"^(?:your|the) (parcel|package|shipment)\b", re.IGNORECASE), r"\1"),
+    (re.compile(r"\s{2,}"), " "),
+]
+
+# ✅ Notation each level introduces, explained to the model only when it is used
+COMPACTION_NOTES = {
+    1: "- (x3) after a scan means the same scan was repeated 3 times in a row; (<first>..<last>) before it "
+       "gives the times of the earliest and latest repeat.",
+    2: "- A first line \"Start <timestamp>\" gives the time of the earliest scan, and each scan shows its offset "
+       "from it: (+2d4h) is 2 days 4 hours later, (+45m) is 45 minutes later, (+0) is the start time itself.",
+}
+
+def compaction_instructions(level=None):
+    """System prompt lines explaining the notation of a compaction level ("" at level 0)."""
+    level = SystemSettings.scan_compaction_level if level is None else level
+    notes = [note for note_level, note in sorted(COMPACTION_NOTES.items()) if note_level <= level]
+    return "\n".join(["Scan histories are compacted:", *notes]) if notes else ""
+
+def add_compaction_notes(prompt_messages, level=None):
+    """Copy of `prompt_messages` with the compaction notation appended to the system message (unchanged at level 0)."""
+    instructions = compaction_instructions(level)
+    if not instructions:
+        return prompt_messages
+    messages = [dict(message) for message in prompt_messages]
+    messages[0]["content"] = f"{messages[0]['content']}\n\n{instructions}"
+    return messages
+
+def collapse_repeats(entries):
+    """
+    Drop entries repeated verbatim (same timestamp and scan) and merge runs of the same scan.
+
+    Returns:
+        list: [(timestamps, scan, count)] where `timestamps` holds the first and, for a run,
+        the last timestamp of the run in input order
+    """
+    seen, collapsed = set(), []
+    for timestamp, scan in entries:
+        if (timestamp, scan) in seen:
+            continue
+        seen.add((timestamp, scan))
+        if collapsed and collapsed[-1][1] == scan:
+            collapsed[-1] = ((collapsed[-1][0][0], timestamp), scan, collapsed[-1][2] + 1)
+        else:
+            collapsed.append(((timestamp,), scan, 1))
+    return collapsed
+
+def format_delta(delta):
+    """Compact time offset: "+3d4h", "+4h12m", "+12m" or "+0"."""
+    minutes = int(delta.total_seconds() // 60)
+    sign = "-" if minutes < 0 else "+"
+    days, rest = divmod(abs(minutes), 24 * 60)
+    hours, minutes = divmod(rest, 60)
+    if days:
+        return f"{sign}{days}d{hours}h" if hours else f"{sign}{days}d"
+    if hours:
+        return f"{sign}{hours}h{minutes}m" if minutes else f"{sign}{hours}h"
+    return f"{sign}{minutes}m" if minutes else "+0"
+
+def strip_boilerplate(scan):
+    for pattern, replacement in BOILERPLATE_PATTERNS:
+        scan = pattern.sub(replacement, scan)
+    return scan.strip()
+
+def parse_timestamp(timestamp):
+    try:
+        return datetime.fromisoformat(timestamp.strip())
+    except ValueError:
+        return None
+
+def compact_scan_history(value, level=None):
+    """
+    Compact a "(ts) scan,(ts) scan" history (or Mongo scan list) for the prompt.
+
+    Level 0 returns the text unchanged; see `COMPACTION_LEVELS` for the others. A run of the
+    same scan keeps its earliest and latest timestamp, "(first..last) scan (xN)". From level 2
+    the history starts with "Start <first timestamp>" and every scan carries its offset from it.
+    `add_compaction_notes` explains the notation to the model.
+    """
+    level = SystemSettings.scan_compaction_level if level is None else level
+    if not level:
+        return value if isinstance(value, str) else ",".join(f"({ts}) {scan}" for ts, scan in parse_scan_history(value))
+
+    entries = [(timestamp.strip(), scan.strip()) for timestamp, scan in parse_scan_history(value)]
+    if level >= 3:
+        entries = [(timestamp, strip_boilerplate(scan)) for timestamp, scan in entries]
+    collapsed = collapse_repeats(entries)
+
+    parsed = [time for time in (parse_timestamp(timestamp) for timestamp, _ in entries) if time is not None]
+    start = min(parsed) if level >= 2 and parsed else None
+
+    parts = []
+    for timestamps, scan, count in collapsed:
+        times = [parse_timestamp(timestamp) for timestamp in timestamps]
+        if None not in times:
+            timestamps = [timestamp for _, timestamp in sorted(zip(times, timestamps))]  # ✅ Earliest first
+            if start is not None:
+                timestamps = [format_delta(time - start) for time in sorted(times)]
+        label = "..".join(dict.fromkeys(timestamps))  # ✅ One timestamp if the run shares it
+        entry = f"({label}) {scan}" if label else scan  # ✅ Text without timestamps stays as it was
+        parts.append(entry + (f" (x{count})" if count > 1 else ""))
+
+    text = ",".join(parts)
+    return f"Start {start.isoformat()}\n{text}" if start is not None else text
+
+def measure_compaction(value, level=None, model="gpt-4o-mini"):
+    """(tokens before, tokens after, compacted text) for one scan history."""
+    raw = value if isinstance(value, str) else compact_scan_history(value, 0)
+    compacted = compact_scan_history(value, level)
+    return estimate_tokens(raw, model), estimate_tokens(compacted, model), compacted
+
+def log_compaction_savings(raw_texts, compacted_texts, level, model="gpt-4o-mini"):
+    """
+    Log total scan-history tokens before/after compaction for a run.
+
+    Takes the texts already compacted for the prompts, so nothing is compacted twice; both
+    sides are tokenised in one `count_tokens_batch` call each.
+    """
+    before = sum(count_tokens_batch(raw_texts, model))
+    after = sum(count_tokens_batch(compacted_texts, model))
+    share = (before - after) / before if before else 0
+    estimated = " (estimated, tokenizer unavailable)" if get_optional_encoding(model) is None else ""
+    logger.info(f"🗜️ Scan compaction level {level}: {before} -> {after} scan-history tokens{estimated} "
+                f"over {len(raw_texts)} rows (saved {share:.0%}).")
@@ -0,0 +1,71 @@
+import re
+import hashlib
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+from modules.prompt_generator import clean_scan_text
+
+# ✅ One "(timestamp) scan text" entry; the scan text runs until the next ",(" or the end
+SCAN_ENTRY_PATTERN = re.compile(r"\((?P<timestamp>[^()]*)\)\s*(?P<scan>.*?)\s*(?=,\s*\(|$)", re.DOTALL)
+
+def parse_scan_history(value):
+    """
+    Split a scan history into (timestamp, scan) pairs.
+
+    Accepts the CSV format "(ts) scan,(ts) scan" (any prefix such as "Scan History:" is ignored)
+    or a Mongo-style list of {"timestamp": ..., "scan": ...} dicts. Text without timestamps
+    becomes a single entry with an empty timestamp.
+    """
+    if isinstance(value, (list, tuple)):
+        return [(str(scan.get("timestamp", "")), str(scan.get("scan", ""))) for scan in value]
+
+    text = "" if value is None else str(value)
+    entries = [(m.group("timestamp"), m.group("scan")) for m in SCAN_ENTRY_PATTERN.finditer(text)]
+    if not entries and text.strip():
+        entries = [("", text)]
+    return entries
+
+def normalise_scan_text(text):
+    """Clean, lower-case and collapse whitespace so cosmetic differences don't defeat the dedup."""
+    return " ".join(clean_scan_text(text).lower().split())
+
+def normalise_scan_history(value, include_timestamps=None):
+    """Return the normalised scan history as a tuple of entries (with timestamps only if requested)."""
+    include_timestamps = SystemSettings.dedup_include_timestamps if include_timestamps is None else include_timestamps
+    entries = []
+    for timestamp, scan in parse_scan_history(value):
+        scan = normalise_scan_text(scan)
+        entries.append(f"{timestamp.strip()} {scan}" if include_timestamps else scan)
+    return tuple(entries)
+
+def scan_history_key(value, include_timestamps=None):
+    """Stable SHA-256 hash of a normalised scan history."""
+    normalised = normalise_scan_history(value, include_timestamps)
+    return hashlib.sha256("\n".join(normalised).encode("utf-8")).hexdigest()
+
+def dedup_scan_histories(values, include_timestamps=None):
+    """
+    Group identical normalised scan histories.
+
+    Returns:
+        tuple: (representatives, assignments) where `representatives` holds the index of the
+            first item of each unique history and `assignments[i]` is the slot in
+            `representatives` that answers item `i`.
+    """
+    slots = {}
+    representatives, assignments = [], []
+    for index, value in enumerate(values):
+        key = scan_history_key(value, include_timestamps)
+        if key not in slots:
+            slots[key] = len(representatives)
+            representatives.append(index)
+        assignments.append(slots[key])
+
+    log_dedup_savings(len(assignments), len(representatives))
+    return representatives, assignments
+
+def log_dedup_savings(total, unique):
+    """Log how many model calls the dedup saved."""
+    saved = total - unique
+    share = (saved / total * 100) if total else 0
+    logger.info(f"♻️ Dedup: {total} scan histories, {unique} unique. Saved {saved} API calls ({share:.1f}%).")
+    return saved
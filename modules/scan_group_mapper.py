@@ -0,0 +1,319 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import openai
+import pandas as pd
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+from modules.prompt_generator import PROMPT_DIR, generate_scan_prompt, compile_prompt, clean_scan_text
+from modules.scan_group_retriever import get_scan_group_retriever
+from modules.token_counter import estimate_tokens, count_tokens_batch
+from modules.token_packer import get_token_budget, pack_items
+from modules.scan_dedup import normalise_scan_text
+from modules.ai_model import create_chat_completion
+from modules.openai_client import get_client
+from modules.retry_policy import get_retry_policy, InvalidResponseError
+
+SCAN_GROUPS_FILE = os.path.join("data", "pvr_config_data", "scan-groups.csv")
+SCAN_GROUP_PROMPT_FILE = os.path.join(PROMPT_DIR, "pvr_matcher_prompt", "scan_group_prompt.json")
+TOKENS_PER_LISTED_SCAN = 4  # ✅ Quotes, comma and indent around each scan in the JSON scan list
+UNCERTAIN_ANSWERS = ("not_clear", "unclear__")  # ✅ "Don't know" answers: asked again next run, never cached
+
+def load_scan_groups(path=SCAN_GROUPS_FILE):
+    """The scan group names from the scan groups CSV."""
+    return pd.read_csv(path)["scan_group"].dropna().astype(str).tolist()
+
+def build_match_request(messages, model=None):
+    """Chat completion request for one batch of the scan group alignment prompt."""
+    return {
+        "model": model or SystemSettings.scan_group_model,
+        "messages": messages,
+        "temperature": 0.0,
+        "response_format": {"type": "json_object"},
+    }
+
+def parse_match_response(response):
+    """
+    Proposed matches, raw text, finish reason and token usage of an alignment response.
+
+    Raises on malformed JSON (unless the answer was cut off), so the retry policy asks again.
+    """
+    choice = response.choices[0]
+    content = choice.message.content.strip()
+    usage = response.usage
+    finish_reason = getattr(choice, "finish_reason", None)
+    try:
+        parsed = json.loads(content)
+        if not isinstance(parsed, dict) or not isinstance(parsed.get("proposed_matches", []), list):
+            raise InvalidResponseError("expected {\"proposed_matches\": [...]}")
+        proposed_matches = parsed.get("proposed_matches", [])
+    except ValueError:
+        if finish_reason != "length":
+            raise
+        proposed_matches = []  # ✅ Cut-off JSON: the caller splits the batch and retries
+    return {
+        "proposed_matches": proposed_matches,
+        "response_text": content,
+        "finish_reason": finish_reason,
+        "token_usage": {
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "total_tokens": usage.total_tokens
+        }
+    }
+
+class ScanGroupCache:
+    """
+    Disk-backed (SQLite) map of normalised scan text → scan group.
+
+    Each distinct carrier scan text is aligned once; every later run and every
+    shipment repeating the text reads the answer from here.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scan_groups ("
+            " scan_text TEXT PRIMARY KEY, scan_group TEXT NOT NULL, source TEXT, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, scan_texts):
+        """{scan_text: scan_group} for the cached texts among `scan_texts`."""
+        scan_texts = list(scan_texts)
+        found = {}
+        with self._lock:
+            for start in range(0, len(scan_texts), 500):  # ✅ Stay under SQLite's bound-parameter limit
+                chunk = scan_texts[start:start + 500]
+                found.update(self._conn.execute(
+                    f"SELECT scan_text, scan_group FROM scan_groups WHERE scan_text IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall())
+        return found
+
+    def put_many(self, mapping, source):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO scan_groups (scan_text, scan_group, source, updated_at) VALUES (?, ?, ?, ?)",
+                [(scan_text, scan_group, source, time.time()) for scan_text, scan_group in mapping.items()],
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_cache = None
+
+def get_scan_group_cache():
+    """Return the process-wide scan group cache at `SystemSettings.scan_group_cache_path`."""
+    global _cache
+    if _cache is None:
+        _cache = ScanGroupCache(SystemSettings.scan_group_cache_path)
+    return _cache
+
+def scan_token_costs(scan_texts, model):
+    """(prompt tokens, expected completion tokens) of each scan as listed in an alignment batch."""
+    scan_tokens = [tokens + TOKENS_PER_LISTED_SCAN
+                   for tokens in count_tokens_batch([clean_scan_text(text) for text in scan_texts], model)]
+    return scan_tokens, [tokens + SystemSettings.scan_group_completion_tokens_per_match for tokens in scan_tokens]
+
+def pack_scan_batches(scan_texts, model=None, system_prompt_tokens=0, max_scans=None):
+    """
+    Split scan texts into alignment batches that fill the model's token budget.
+
+    Each scan is measured as it is listed in the prompt; its expected answer is the echoed
+    scan text plus `SystemSettings.scan_group_completion_tokens_per_match`. Budgets come from
+    `get_token_budget(model)`, `max_scans` optionally caps the scans per batch.
+
+    Returns:
+        list[list[str]]: Scan texts per batch, in input order.
+    """
+    model = model or SystemSettings.scan_group_model
+    budget = get_token_budget(model)
+    scan_tokens, completion = scan_token_costs(scan_texts, model)
+    packs = pack_items(scan_tokens, budget["prompt"], budget["completion"], completion, system_prompt_tokens,
+                       max_items=max_scans)
+    packs.sort(key=lambda pack: pack[0])
+
+    for number, pack in enumerate(packs, start=1):
+        logger.info(f"📦 Alignment batch {number}: {len(pack)} scans, "
+                    f"{system_prompt_tokens + sum(scan_tokens[i] for i in pack)}/{budget['prompt']} prompt tokens, "
+                    f"~{sum(completion[i] for i in pack)}/{budget['completion']} completion tokens expected")
+    return [[scan_texts[i] for i in pack] for pack in packs]
+
+def align_batch(client, scan_batch, prompt_path, scan_groups_path, retriever=None, model=None, on_result=None):
+    """
+    Align one batch, splitting it in half and retrying while the answer is cut off
+    (`finish_reason == "length"`) or does not cover every scan.
+
+    Scans already matched are kept; only the missing ones are resent. A single scan that
+    still gets no usable answer is given up on. `on_result(messages, result)` is called
+    for every response (e.g. to log it).
+
+    Returns:
+        tuple: (list of proposed match dicts for scans in the batch, token usage dict)
+    """
+    model = model or SystemSettings.scan_group_model
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "requests": 0}
+    candidates = retriever.candidates(scan_batch) if retriever else None
+    messages = generate_scan_prompt(scan_batch, prompt_path=prompt_path, scan_group_csv=scan_groups_path,
+                                    scan_groups=candidates)
+    if not messages:
+        logger.error(f"❌ Prompt generation failed for a batch of {len(scan_batch)} scans. Skipping.")
+        return [], usage
+    try:
+        response = create_chat_completion(client, retry_policy=get_retry_policy(), validate=parse_match_response,
+                                          **build_match_request(messages, model))
+        result = parse_match_response(response)
+    except (openai.OpenAIError, ValueError) as e:
+        logger.error(f"❌ Scan group alignment failed for a batch of {len(scan_batch)} scans: {e}")
+        return [], usage
+
+    if on_result:
+        on_result(messages, result)
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        usage[key] += result["token_usage"][key]
+    usage["requests"] += 1
+
+    wanted = {normalise_scan_text(text): text for text in scan_batch}
+    matches = {}
+    for match in result["proposed_matches"]:
+        key = normalise_scan_text(str(match.get("original") or ""))
+        if key in wanted and match.get("proposed_sg"):
+            matches[key] = match
+    missing = [text for key, text in wanted.items() if key not in matches]
+    logger.info(f"📦 Aligned {len(matches)}/{len(scan_batch)} scans: {result['token_usage']['prompt_tokens']} prompt + "
+                f"{result['token_usage']['completion_tokens']} completion tokens (finish: {result['finish_reason']})")
+
+    if missing and len(scan_batch) > 1:
+        reason = "answer cut off" if result["finish_reason"] == "length" else f"{len(missing)} scans unmatched"
+        halves = [missing[:len(missing) // 2], missing[len(missing) // 2:]] if len(missing) > 1 else [missing]
+        logger.warning(f"✂️ {reason}; resending {len(missing)} scans as {len(halves)} smaller batch(es).")
+        for half in halves:
+            retried, retried_usage = align_batch(client, half, prompt_path, scan_groups_path, retriever, model, on_result)
+            matches.update((normalise_scan_text(str(match["original"])), match) for match in retried)
+            for key in usage:
+                usage[key] += retried_usage[key]
+    elif missing:
+        logger.warning(f"⚠️ No scan group proposed for {scan_batch[0]!r} ({result['finish_reason']}).")
+    return list(matches.values()), usage
+
+def align_scan_texts(scan_texts, scan_groups_path=SCAN_GROUPS_FILE, prompt_path=SCAN_GROUP_PROMPT_FILE,
+                     batch_size=None):
+    """
+    Ask the model for the scan group of each text with the `gpt_scan_matcher` alignment prompt.
+
+    Scans are packed into batches by token count (see `pack_scan_batches`; `batch_size` or
+    `SystemSettings.scan_group_batch_size` caps the scans per batch) and a batch whose answer
+    is cut off or incomplete is split and retried (see `align_batch`).
+
+    With `SystemSettings.scan_group_top_k`, each batch's prompt only lists the scan groups
+    retrieved for its scans (see `modules.scan_group_retriever`).
+
+    Returns:
+        tuple: ({normalised scan text: proposed scan group}, total tokens used)
+    """
+    client = get_client(SystemSettings.api_key)
+    if client is None:
+        return {}, 0
+
+    model = SystemSettings.scan_group_model
+    retriever = get_scan_group_retriever(scan_groups_path)
+    full_prompt = compile_prompt(prompt_path, scan_groups_path)
+    full_tokens = full_prompt.token_count(model) if full_prompt else 0
+    batches = pack_scan_batches(scan_texts, model, full_tokens, batch_size or SystemSettings.scan_group_batch_size)
+
+    proposed, tokens, requests, system_tokens = {}, 0, 0, [0, 0]  # ✅ [full list, sent] system prompt tokens
+
+    def count_system_tokens(messages, result):
+        system_tokens[0] += full_tokens
+        system_tokens[1] += estimate_tokens(messages[0]["content"], model) if retriever else full_tokens
+
+    for batch in batches:
+        matches, usage = align_batch(client, batch, prompt_path, scan_groups_path, retriever, model, count_system_tokens)
+        tokens += usage["total_tokens"]
+        requests += usage["requests"]
+        for match in matches:
+            proposed[normalise_scan_text(match["original"])] = str(match["proposed_sg"])
+
+    if scan_texts:
+        logger.info(f"📊 Alignment: {len(scan_texts)} scans in {len(batches)} batches, {requests} requests, "
+                    f"{tokens} tokens ({tokens / max(1, requests):.0f} per request).")
+    if retriever and system_tokens[0]:
+        logger.info(f"✂️ Scan group pruning: {system_tokens[1]} of {system_tokens[0]} system prompt tokens sent "
+                    f"({1 - system_tokens[1] / system_tokens[0]:.0%} saved).")
+    return proposed, tokens
+
+def lookup_scan_texts(scan_texts, scan_groups_path=SCAN_GROUPS_FILE, cache=None):
+    """
+    Scan groups known without the model: texts that are a scan group name, then cached texts.
+
+    Returns:
+        tuple: (sorted unique normalised texts, {text: scan group}, number of exact scan group names)
+    """
+    cache = cache or get_scan_group_cache()
+    unique = sorted({normalise_scan_text(text) for text in scan_texts} - {""})
+
+    known_groups = {normalise_scan_text(group): group for group in load_scan_groups(scan_groups_path)}
+    mapping = {text: known_groups[text] for text in unique if text in known_groups}
+    mapping.update(cache.get_many(text for text in unique if text not in mapping))
+    return unique, mapping, sum(text in known_groups for text in unique)
+
+def plan_alignment(scan_texts, scan_groups_path=SCAN_GROUPS_FILE, prompt_path=SCAN_GROUP_PROMPT_FILE, cache=None):
+    """
+    Projected alignment requests for the texts `map_scan_texts` would send, without sending anything.
+
+    Every batch is counted with the full scan group list in its prompt, an upper bound when
+    `SystemSettings.scan_group_top_k` trims it. Splits of cut-off answers are not counted.
+
+    Returns:
+        tuple: (requests, prompt tokens, completion tokens)
+    """
+    unique, mapping, _ = lookup_scan_texts(scan_texts, scan_groups_path, cache)
+    missing = [text for text in unique if text not in mapping]
+    if not missing:
+        return 0, 0, 0
+
+    model = SystemSettings.scan_group_model
+    full_prompt = compile_prompt(prompt_path, scan_groups_path)
+    full_tokens = full_prompt.token_count(model) if full_prompt else 0
+    scan_tokens, completion = scan_token_costs(missing, model)
+    requests = len(pack_scan_batches(missing, model, full_tokens, SystemSettings.scan_group_batch_size))
+    return requests, requests * full_tokens + sum(scan_tokens), sum(completion)
+
+def map_scan_texts(scan_texts, scan_groups_path=SCAN_GROUPS_FILE, prompt_path=SCAN_GROUP_PROMPT_FILE, cache=None):
+    """
+    Map every distinct scan text to a scan group.
+
+    Texts that already are a scan group name map to themselves, cached texts come from
+    the scan group cache and only the rest are sent to the model (then cached).
+    Answers such as "not_clear" or "unclear__[...]" are returned as-is but not cached.
+
+    Returns:
+        dict: {normalised scan text: scan group}
+    """
+    cache = cache or get_scan_group_cache()
+    unique, mapping, exact = lookup_scan_texts(scan_texts, scan_groups_path, cache)
+    cached = len(mapping)
+
+    missing = [text for text in unique if text not in mapping]
+    tokens = 0
+    if missing:
+        proposed, tokens = align_scan_texts(missing, scan_groups_path, prompt_path)
+        aligned = {text: proposed[text] for text in missing if text in proposed}
+        cache.put_many({text: group for text, group in aligned.items() if not str(group).startswith(UNCERTAIN_ANSWERS)},
+                       SystemSettings.scan_group_model)
+        mapping.update(aligned)
+
+    logger.info(f"🧭 Scan groups: {len(unique)} unique scan texts, {exact} exact names, {cached - exact} cached, "
+                f"{len(missing)} sent to the model ({tokens} tokens), {len(unique) - len(mapping)} unmapped.")
+    return mapping
@@ -0,0 +1,95 @@
+import threading
+import numpy as np
+import pandas as pd
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+from modules.prompt_generator import clean_scan_text, file_signature
+from modules.scan_dedup import normalise_scan_text
+from modules.embeddings import load_text_encoder
+from modules.similarity_search import nearest_neighbours
+from modules.embedding_store import get_embedding_store
+
+class ScanGroupRetriever:
+    """
+    Prunes the scan group list of an alignment prompt to the groups a batch plausibly matches.
+
+    Scan groups are embedded once; each batch of scan texts is embedded (with `query_encoder`,
+    default: `encoder`) and the union of every scan's top-k groups (by cosine similarity) is
+    kept, in the CSV's order. If any scan's best match is below `min_similarity` the batch
+    gets the full list instead.
+    """
+
+    def __init__(self, scan_groups, encoder, top_k=None, min_similarity=None, query_encoder=None):
+        self.scan_groups = list(scan_groups)
+        self.encoder = encoder
+        self.query_encoder = query_encoder or encoder
+        self.top_k = top_k or SystemSettings.scan_group_top_k
+        self.min_similarity = SystemSettings.scan_group_min_similarity if min_similarity is None else min_similarity
+        self.group_vectors = encoder([clean_scan_text(group) for group in self.scan_groups])
+
+    def rank(self, scan_texts, k):
+        """
+        Top-k scan group indices and similarities per scan text, best first.
+
+        Returns:
+            tuple: (indices [len(scan_texts), k], similarities [len(scan_texts), k])
+        """
+        k = min(k, len(self.scan_groups))
+        neighbours = nearest_neighbours(self.query_encoder([clean_scan_text(text) for text in scan_texts]),
+                                        self.group_vectors, k=k, normalised=True)
+        return neighbours.indices.reshape(-1, k), neighbours.scores.reshape(-1, k)
+
+    def candidates(self, scan_texts):
+        """The pruned scan group list for a batch, or None to send the full list."""
+        if not scan_texts or self.top_k >= len(self.scan_groups):
+            return None
+        indices, scores = self.rank(scan_texts, self.top_k)
+        if (scores[:, 0] < self.min_similarity).any():
+            return None  # ✅ Safety fallback: a scan with no close group might need any of them
+        return [self.scan_groups[i] for i in sorted(set(indices.ravel().tolist()))]
+
+def recall_at_k(retriever, pairs, ks):
+    """
+    Share of (scan text, expected scan group) pairs whose group is in the scan's top-k.
+
+    Pairs whose expected group is not in the retriever's list are skipped.
+
+    Returns:
+        dict: {k: recall}
+    """
+    positions = {normalise_scan_text(group): index for index, group in enumerate(retriever.scan_groups)}
+    pairs = [(text, positions[normalise_scan_text(group)]) for text, group in pairs if normalise_scan_text(group) in positions]
+    if not pairs:
+        return {k: 0.0 for k in ks}
+    indices, _ = retriever.rank([text for text, _ in pairs], max(ks))
+    expected = np.array([position for _, position in pairs])[:, None]
+    return {k: float((indices[:, :k] == expected).any(axis=1).mean()) for k in ks}
+
+def load_alignment_pairs(paths):
+    """(scan_name, proposed_scan_group) pairs from historical alignment logs, without duplicates."""
+    frames = [pd.read_csv(path, usecols=["scan_name", "proposed_scan_group"]) for path in paths]
+    df = pd.concat(frames).dropna().drop_duplicates()
+    return list(df.itertuples(index=False, name=None))
+
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+
+def get_scan_group_retriever(scan_groups_path):
+    """
+    The shared retriever for a scan groups CSV (rebuilt if the file changes), or None if
+    pruning is off or no embedding model is available.
+    """
+    if not SystemSettings.scan_group_top_k:
+        return None
+    encoder = load_text_encoder()
+    if encoder is None:
+        return None
+
+    key = (scan_groups_path, file_signature(scan_groups_path))
+    with _retrievers_lock:
+        if key not in _retrievers:
+            scan_groups = pd.read_csv(scan_groups_path)["scan_group"].dropna().astype(str).tolist()
+            # ✅ Group vectors come from the store; per-batch scan texts are encoded directly, not persisted
+            _retrievers[key] = ScanGroupRetriever(scan_groups, get_embedding_store().encode, query_encoder=encoder)
+            logger.info(f"🔎 Scan group retriever ready: {len(scan_groups)} groups, top {SystemSettings.scan_group_top_k} per scan")
+        return _retrievers[key]
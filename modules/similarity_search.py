@@ -0,0 +1,119 @@
+import numpy as np
+from modules.embeddings import normalise_rows
+
+try:
+    from scipy import sparse
+except ImportError:  # ✅ Only needed for `Neighbours.to_csr()`
+    sparse = None
+
+BLOCK_BYTES = 64 * 1024 * 1024  # ✅ Similarity block size: queries per block × corpus size × 4 bytes stays under this
+
+class Neighbours:
+    """
+    Sparse neighbour lists in CSR layout: row i's neighbours are
+    `indices[indptr[i]:indptr[i + 1]]` with cosine similarities in `scores`, best first
+    (or in corpus order for threshold-only searches).
+    """
+
+    def __init__(self, indptr, indices, scores, shape):
+        self.indptr = indptr
+        self.indices = indices
+        self.scores = scores
+        self.shape = shape
+
+    def __len__(self):
+        return self.shape[0]
+
+    def row(self, i):
+        """(corpus indices, similarities) of query i."""
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.scores[start:end]
+
+    def counts(self):
+        """Number of neighbours per query."""
+        return np.diff(self.indptr)
+
+    def best(self):
+        """(index, similarity) of each query's best neighbour for top-k searches; (-1, nan) where there is none."""
+        has = self.counts() > 0
+        index = np.full(len(self), -1, dtype=np.int64)
+        score = np.full(len(self), np.nan, dtype=np.float32)
+        index[has] = self.indices[self.indptr[:-1][has]]
+        score[has] = self.scores[self.indptr[:-1][has]]
+        return index, score
+
+    def pairs(self):
+        """(query, corpus index, similarity) triples."""
+        rows = np.repeat(np.arange(len(self)), self.counts())
+        return zip(rows.tolist(), self.indices.tolist(), self.scores.tolist())
+
+    def to_csr(self):
+        """The neighbour lists as a `scipy.sparse.csr_matrix` of similarities (requires scipy)."""
+        if sparse is None:
+            raise ImportError("scipy is required for Neighbours.to_csr()")
+        return sparse.csr_matrix((self.scores, self.indices, self.indptr), shape=self.shape)
+
+def block_rows(corpus_size, block_bytes=BLOCK_BYTES):
+    """Queries per similarity block so one float32 block of scores fits into `block_bytes`."""
+    return max(1, block_bytes // (4 * max(1, corpus_size)))
+
+def nearest_neighbours(queries, corpus=None, k=None, threshold=None, block_size=None, normalised=False):
+    """
+    Cosine-similarity neighbours of every query row in `corpus`, computed block by block.
+
+    Vectors are L2-normalised once; each block of queries is scored against the whole corpus
+    with one matrix multiply, so memory stays at one block of scores however large the inputs.
+    Without `corpus` the queries are searched against themselves and self-matches are skipped.
+
+    Args:
+        queries: Embedding matrix [n, d].
+        corpus: Embedding matrix [m, d] (default: `queries`).
+        k (int): Keep each query's k best neighbours.
+        threshold (float): Keep neighbours with similarity >= threshold (combined with `k`: the k best above it).
+        block_size (int): Queries per block (default: sized by `BLOCK_BYTES`).
+        normalised (bool): The inputs are already L2-normalised.
+
+    Returns:
+        Neighbours: Sparse neighbour lists, one row per query.
+    """
+    if k is None and threshold is None:
+        raise ValueError("nearest_neighbours needs `k`, `threshold` or both")
+    self_search = corpus is None
+    queries = np.asarray(queries, dtype=np.float32) if normalised else normalise_rows(queries)
+    corpus = queries if self_search else (np.asarray(corpus, dtype=np.float32) if normalised else normalise_rows(corpus))
+    block_size = block_size or block_rows(len(corpus))
+    k = min(k, len(corpus) - self_search) if k is not None else None
+
+    counts, indices, scores = [], [], []
+    for start in range(0, len(queries), block_size):
+        similarities = queries[start:start + block_size] @ corpus.T
+        rows = np.arange(len(similarities))
+        if self_search:
+            similarities[rows, start + rows] = -np.inf
+
+        if k is not None and k > 0:
+            top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(similarities, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+            keep = top_scores >= threshold if threshold is not None else np.isfinite(top_scores)
+            counts.append(keep.sum(axis=1))
+            indices.append(top[keep])
+            scores.append(top_scores[keep])
+        elif k is None:
+            hit_rows, columns = np.nonzero(similarities >= threshold)
+            counts.append(np.bincount(hit_rows, minlength=len(similarities)))
+            indices.append(columns)
+            scores.append(similarities[hit_rows, columns])
+        else:
+            counts.append(np.zeros(len(similarities), dtype=np.int64))
+
+    indptr = np.zeros(len(queries) + 1, dtype=np.int64)
+    if counts:
+        np.cumsum(np.concatenate(counts), out=indptr[1:])
+    return Neighbours(
+        indptr,
+        np.concatenate(indices).astype(np.int64) if indices else np.zeros(0, dtype=np.int64),
+        np.concatenate(scores).astype(np.float32) if scores else np.zeros(0, dtype=np.float32),
+        (len(queries), len(corpus)),
+    )
@@ -0,0 +1,160 @@
+import os
+from datetime import datetime
+import pandas as pd
+from modules.logging_utils import logger
+from modules.json_handler import load_json
+from modules.prompt_generator import PROMPT_DIR, load_status_mapping
+from modules.scan_dedup import parse_scan_history, normalise_scan_text
+from modules.scan_group_mapper import SCAN_GROUPS_FILE, map_scan_texts, plan_alignment
+from modules.compact_schema import format_status_answer
+
+PROGRESS_RULES_FILE = os.path.join(PROMPT_DIR, "scan_group_progress.json")
+STATE_MACHINE_TIER = "state_machine"  # ✅ `Model_Tier` of rows resolved from their scan groups
+
+# ✅ status_mapping.json progress ids the transitions below are written against
+MANIFESTED, COLLECTED, IN_TRANSIT, DELIVERED, PARTIALLY_DELIVERED, BEING_RETURNED, RETURNED = range(1, 8)
+TERMINAL = {DELIVERED, RETURNED}
+
+class StatusStateMachine:
+    """
+    Derives shipment progress (and, before collection, the final status) from a time-ordered
+    scan-group sequence.
+
+    Each scan group moves the shipment along status_mapping.json's progress ids: forwards
+    through Manifested → Collected → InTransit → Delivered, or into the return branch, where
+    transit scans keep it BeingReturned. Groups without a progress id leave it unchanged.
+    The sequence is unresolved (None) when it contains an unknown group or an action-required
+    one (damage, claims, ...), contradicts a terminal status, or never reaches a progress id.
+    """
+
+    def __init__(self, progress, final_status, group_progress, group_final_status, group_tags=None,
+                 tag_progress=None, unresolved_tags=()):
+        self.progress = {int(k): v for k, v in progress.items()}
+        self.final_status = {int(k): v for k, v in final_status.items()}
+        self.group_progress = {group: int(k) for group, k in group_progress.items()}
+        self.group_final_status = {group: int(k) for group, k in group_final_status.items()}
+        self.group_tags = group_tags or {}
+        self.tag_progress = {tag: int(k) for tag, k in (tag_progress or {}).items()}
+        self.unresolved_tags = set(unresolved_tags)
+
+    def progress_of(self, group):
+        """Progress id of a scan group, 0 for groups that don't move the shipment, or None if unresolvable."""
+        if group in self.group_progress:
+            return self.group_progress[group]
+        if group not in self.group_tags:
+            return None  # ✅ "new__...", "unclear__[...]", "not_clear" or unmapped text
+        tags = self.group_tags[group]
+        for tag, progress in self.tag_progress.items():
+            if tag in tags:
+                return progress
+        return None if self.unresolved_tags & set(tags) else 0
+
+    @staticmethod
+    def step(state, progress):
+        """Next progress id, or None if the scan contradicts the current state."""
+        if state is None:
+            return progress
+        if state in TERMINAL:
+            return state if progress == state else None
+        if state == BEING_RETURNED:
+            if progress in (DELIVERED, PARTIALLY_DELIVERED):
+                return None
+            return RETURNED if progress == RETURNED else BEING_RETURNED
+        return max(state, progress)
+
+    def resolve(self, groups):
+        """
+        Resolve a time-ordered list of scan groups.
+
+        Returns:
+            tuple: (progress label, final status label or None), or None if unresolved
+        """
+        state, final_status = None, None
+        for group in groups:
+            progress = self.progress_of(group)
+            if progress is None:
+                return None
+            if progress:
+                state = self.step(state, progress)
+                if state is None:
+                    return None
+            if group in self.group_final_status:
+                final_status = self.group_final_status[group]
+
+        if state is None:
+            return None
+        final_label = self.final_status.get(final_status) if state == MANIFESTED else None
+        return self.progress[state], final_label
+
+def load_status_state_machine(path=PROGRESS_RULES_FILE, scan_groups_path=SCAN_GROUPS_FILE):
+    """Build the state machine from status_mapping.json, the scan group tags and the progress table."""
+    rules = load_json(path)
+    if not rules:
+        logger.error(f"🚨 Scan group progress table not found or empty: {path}")
+        return None
+
+    mapping = load_status_mapping()
+    groups = pd.read_csv(scan_groups_path).dropna(subset=["scan_group"])
+    group_tags = {group: [tag.strip() for tag in str(tags).split(",") if tag.strip()] if pd.notna(tags) else []
+                  for group, tags in zip(groups["scan_group"], groups["tags"])}
+
+    return StatusStateMachine(
+        mapping.get("progress", {}), mapping.get("final_status", {}),
+        rules.get("progress_scan_groups", {}), rules.get("final_status_scan_groups", {}), group_tags,
+        rules.get("progress_tags", {}), rules.get("unresolved_tags", []),
+    )
+
+def order_scan_entries(value):
+    """
+    (timestamp, scan) entries sorted oldest first, or None if any timestamp can't be parsed.
+
+    Scans sharing a timestamp keep their chronological order whether the history is
+    listed oldest or newest first.
+    """
+    try:
+        entries = [(datetime.fromisoformat(timestamp.strip()), scan) for timestamp, scan in parse_scan_history(value)]
+    except ValueError:
+        return None
+    if entries and entries[0][0] > entries[-1][0]:
+        entries.reverse()  # ✅ Carrier exports usually list the newest scan first
+    return sorted(entries, key=lambda entry: entry[0])
+
+class TwoStageResolver:
+    """
+    Stage 1 maps every distinct scan text to a scan group once (`map_scan_texts`, cached);
+    stage 2 runs each shipment's scan-group sequence through the `StatusStateMachine`.
+
+    Implements the rule engine interface (`prepare`, `decide`, `tier`) so `process_csv` only
+    sends shipments the state machine cannot resolve to the model.
+    """
+
+    tier = STATE_MACHINE_TIER
+
+    def __init__(self, machine, scan_groups_path=SCAN_GROUPS_FILE):
+        self.machine = machine
+        self.scan_groups_path = scan_groups_path
+        self.scan_groups = {}
+
+    def prepare(self, values):
+        """Stage 1: map the scan texts of every history in `values` to scan groups."""
+        self.scan_groups = map_scan_texts(self.scan_texts(values), self.scan_groups_path)
+
+    def plan(self, values):
+        """(requests, prompt tokens, completion tokens) `prepare(values)` would send (see `plan_alignment`)."""
+        return plan_alignment(self.scan_texts(values), self.scan_groups_path)
+
+    @staticmethod
+    def scan_texts(values):
+        return {scan for value in values for _, scan in parse_scan_history(value)}
+
+    def decide(self, value):
+        """Stage 2: the status of one scan history, or None to send it to the model."""
+        entries = order_scan_entries(value)
+        if not entries:
+            return None
+        resolved = self.machine.resolve([self.scan_groups.get(normalise_scan_text(scan)) for _, scan in entries])
+        return format_status_answer(*resolved) if resolved else None
+
+def load_two_stage_resolver(path=PROGRESS_RULES_FILE, scan_groups_path=SCAN_GROUPS_FILE):
+    machine = load_status_state_machine(path, scan_groups_path)
+    return TwoStageResolver(machine, scan_groups_path) if machine else None
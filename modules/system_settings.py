@@ -16,11 +16,122 @@ class SystemSettings:
     selected_column = settings.get("selected_column", None)
     prompt_file = settings.get("prompt_file", None)
 
+    # Execution mode for `process_csv`: "sync" (row by row), "async" (concurrent requests), "batch" or "two_stage"
+    execution_mode = settings.get("execution_mode", "sync")
+    max_concurrency = settings.get("max_concurrency", 8)
+
+    # Optional per-model {"rpm": ..., "tpm": ...} overrides for the shared rate limiter
+    rate_limits = settings.get("rate_limits", {})
+
+    # Disk-backed LLM response cache (deterministic, temperature=0 requests by default)
+    use_response_cache = settings.get("use_response_cache", True)
+    response_cache_path = settings.get("response_cache_path", os.path.join("output", "cache", "llm_responses.sqlite"))
+    response_cache_max_entries = settings.get("response_cache_max_entries", 100000)
+    response_cache_max_mb = settings.get("response_cache_max_mb", 512)
+    response_cache_max_age_days = settings.get("response_cache_max_age_days", 30)
+
+    # Batch API execution ("openai" submits real batches, "local" uses the file-based stand-in)
+    batch_service = settings.get("batch_service", "openai")
+    batch_work_dir = settings.get("batch_work_dir", os.path.join("output", "batches"))
+    batch_poll_seconds = settings.get("batch_poll_seconds", 60)
+    batch_timeout_seconds = settings.get("batch_timeout_seconds", 6 * 60 * 60)  # ✅ Then the batch is cancelled
+
+    # Optional per-model {"prompt": ..., "completion": ...} token budgets for multi-shipment requests
+    token_budgets = settings.get("token_budgets", {})
+    max_shipments_per_request = settings.get("max_shipments_per_request", 100)  # ✅ Keep between 50 and 200
+
+    # Pooled OpenAI HTTP client (keep-alive connections shared by every module)
+    http_max_connections = settings.get("http_max_connections", 100)
+    http_max_keepalive = settings.get("http_max_keepalive", 20)
+    http_keepalive_seconds = settings.get("http_keepalive_seconds", 30)
+    http_timeout_seconds = settings.get("http_timeout_seconds", 60)
+    http_connect_timeout_seconds = settings.get("http_connect_timeout_seconds", 10)
+    use_http2 = settings.get("use_http2", True)
+    client_max_retries = settings.get("client_max_retries", 0)  # ✅ Retries are handled by `modules.retry_policy`
+
+    # Send one request per unique normalised scan history and copy the answer to duplicates
+    dedup_scan_histories = settings.get("dedup_scan_histories", True)
+    dedup_include_timestamps = settings.get("dedup_include_timestamps", False)
+
+    # Results sink checkpoints: append new rows every N rows or N seconds, whichever comes first
+    results_flush_rows = settings.get("results_flush_rows", 50)
+    results_flush_seconds = settings.get("results_flush_seconds", 30)
+
+    # Per-run ledger for `--resume`; rows are keyed by this column (auto-detects a tracking number) or row index
+    run_ledger_dir = settings.get("run_ledger_dir", os.path.join("output", "runs"))
+    row_key_column = settings.get("row_key_column", None)
+
+    # Retry policy (full-jitter exponential backoff) and the circuit breaker shared by every OpenAI caller
+    retry_max_attempts = settings.get("retry_max_attempts", 4)
+    retry_base_delay_seconds = settings.get("retry_base_delay_seconds", 1.0)
+    retry_max_delay_seconds = settings.get("retry_max_delay_seconds", 60.0)
+    breaker_failure_threshold = settings.get("breaker_failure_threshold", 5)
+    breaker_reset_seconds = settings.get("breaker_reset_seconds", 30)
+
+    # Model cascade: ask the cheap model first, re-ask the strong one for low-confidence or unknown labels
+    use_model_cascade = settings.get("use_model_cascade", False)
+    cascade_models = settings.get("cascade_models", ["gpt-4o-mini", "gpt-4o"])
+    cascade_threshold = settings.get("cascade_threshold", 0.9)
+    cascade_allowed_labels = settings.get("cascade_allowed_labels", [])  # ✅ Empty = the status enum of the prompt schema
+    cascade_label_field = settings.get("cascade_label_field", "shipmentStatus")  # ✅ Label field of each `shipments` item
+    cascade_escalation_estimate = settings.get("cascade_escalation_estimate", 0.3)  # ✅ Share of rows the run planner expects to escalate
+
+    # Rule fast path: decide unambiguous terminal histories locally, audit a sample against the model
+    use_rule_engine = settings.get("use_rule_engine", False)
+    rule_file = settings.get("rule_file", None)  # ✅ None = data/prompts/scan_group_status_rules.json
+    rule_scan_group_column = settings.get("rule_scan_group_column", None)  # ✅ None = the selected column
+    rule_audit_rate = settings.get("rule_audit_rate", 0.05)
+    rule_audit_seed = settings.get("rule_audit_seed", 0)
+
+    # Two-stage mode: map each distinct scan text to a scan group once, derive statuses locally
+    scan_group_model = settings.get("scan_group_model", "gpt-4o-mini")
+    scan_group_batch_size = settings.get("scan_group_batch_size")  # ✅ Optional cap; batches are packed by token budget
+    scan_group_completion_tokens_per_match = settings.get("scan_group_completion_tokens_per_match", 30)  # ✅ Plus the echoed scan
+    scan_group_cache_path = settings.get("scan_group_cache_path", os.path.join("output", "cache", "scan_groups.sqlite"))
+    two_stage_fallback_mode = settings.get("two_stage_fallback_mode", "sync")  # ✅ How unresolved rows are sent
+
+    # Retrieval-pruned scan group lists in alignment prompts (0 = always list every group)
+    embedding_model = settings.get("embedding_model")  # ✅ sentence-transformers model (default all-MiniLM-L6-v2)
+    scan_group_top_k = settings.get("scan_group_top_k", 0)
+    scan_group_min_similarity = settings.get("scan_group_min_similarity", 0.3)  # ✅ Below this a batch gets the full list
+
+    # Embedding store and nearest-neighbour indexes used by the scan group analysis scripts
+    embedding_store_dir = settings.get("embedding_store_dir", os.path.join("output", "cache", "embeddings"))
+    embedding_store_dtype = settings.get("embedding_store_dtype", "float32")  # ✅ "float16" halves the store's size
+    ann_backend = settings.get("ann_backend", "auto")  # ✅ "hnsw" (needs hnswlib), "ivf" (NumPy) or "auto"
+    ann_index_dir = settings.get("ann_index_dir", os.path.join("output", "cache", "ann"))
+    ann_nprobe = settings.get("ann_nprobe", 8)  # ✅ IVF lists searched per query
+    ann_ef = settings.get("ann_ef", 64)  # ✅ HNSW search breadth
+
+    # Local embedding server (scripts/run_embedding_server.py); scripts load models in-process when it isn't running
+    embedding_server_url = settings.get("embedding_server_url", "http://127.0.0.1:8765")
+    embedding_server_timeout = settings.get("embedding_server_timeout", 60)
+    embedding_server_probe_timeout = settings.get("embedding_server_probe_timeout", 1)  # ✅ Health check before each load
+    embedding_server_max_batch = settings.get("embedding_server_max_batch", 64)  # ✅ Texts per micro-batch
+    embedding_server_max_wait_ms = settings.get("embedding_server_max_wait_ms", 10)  # ✅ Wait for more requests to batch
+
+    # Response mode: "labels" (full status strings) or "codes" (status_mapping.json codes under a strict JSON schema)
+    response_mode = settings.get("response_mode", "labels")
+
+    # Scan history compaction before prompting: 0 = raw, 1 = collapse repeats, 2 = + relative times, 3 = + strip boilerplate
+    scan_compaction_level = settings.get("scan_compaction_level", 0)
+
+    # User message encoding for multi-shipment and scan list prompts: text, json, json_min, tsv, csv or lines.
+    # Either one name or {model prefix: name}; unset keeps each prompt's original format.
+    payload_format = settings.get("payload_format")
+
+    # Pre-flight run planner: refuse runs projected above `run_budget_usd` (None = no limit)
+    run_budget_usd = settings.get("run_budget_usd")
+    expected_completion_tokens = settings.get("expected_completion_tokens", 20)  # ✅ Average answer length
+    seconds_per_request = settings.get("seconds_per_request", 1.5)  # ✅ Typical latency, for sync/async time projections
+    planner_threads = settings.get("planner_threads")  # ✅ `encode_batch` threads (default: CPU count)
+
     @classmethod
     def log_settings(cls):
         """Log the current system settings for debugging."""
         logger.info(f"🔧 System Settings Updated - Model: {cls.model_name}, "
-                    f"CSV: {cls.input_file}, Column: {cls.selected_column}, Prompt: {cls.prompt_file}")
+                    f"CSV: {cls.input_file}, Column: {cls.selected_column}, Prompt: {cls.prompt_file}, "
+                    f"Mode: {cls.execution_mode} (concurrency {cls.max_concurrency})")
 
     @classmethod
     def reset(cls):
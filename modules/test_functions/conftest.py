@@ -0,0 +1,56 @@
+import sys
+import os
+import json
+import pytest
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import prediction_processor
+
+
+class FakeConversation:
+    """Stands in for `ConversationHandler`, which loads a tiktoken encoding (network on first use)."""
+
+    token_count = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def count_tokens(self, text):
+        return 0
+
+    def add_to_history(self, role, message):
+        pass
+
+
+@pytest.fixture
+def prompt_file(tmp_path):
+    """Path of a one-line system prompt file."""
+    path = tmp_path / "prompt.json"
+    path.write_text(json.dumps({"content": ["Classify the shipment."]}), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def run_process_csv(tmp_path, monkeypatch, prompt_file):
+    """
+    Run `process_csv` offline on a DataFrame with a "Scans" column.
+
+    No conversation tokenizer, response cache or JSON snapshot; the run ledger lives in
+    `tmp_path`. `respond` replaces `get_openai_response`; outputs go to `tmp_path / output`.
+    """
+    monkeypatch.setattr(prediction_processor, "ConversationHandler", FakeConversation)
+    monkeypatch.setattr(prediction_processor, "save_json", lambda *a, **k: None)
+    monkeypatch.setattr(prediction_processor.SystemSettings, "use_response_cache", False)
+    monkeypatch.setattr(prediction_processor.SystemSettings, "run_ledger_dir", str(tmp_path / "runs"))
+
+    def run(df, respond=None, output="out.csv", mode="sync", **kwargs):
+        csv_file = tmp_path / "input.csv"
+        df.to_csv(csv_file, index=False)
+        if respond:
+            monkeypatch.setattr(prediction_processor, "get_openai_response", respond)
+        return prediction_processor.process_csv(str(csv_file), str(tmp_path / output), str(tmp_path / "out.json"),
+                                                "Scans", prompt_file, mode=mode, **kwargs)
+
+    return run
@@ -0,0 +1,73 @@
+import sys
+import os
+import numpy as np
+import pytest
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import ann_index
+from modules.embeddings import normalise_rows
+from modules.system_settings import SystemSettings
+from modules.ann_index import build_ann_index, save_ann_index, load_ann_index
+from modules.embedding_store import EmbeddingStore
+
+BACKENDS = ["ivf"] + (["hnsw"] if ann_index.hnswlib is not None else [])
+
+def clustered(rows, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(rows // 10, dim))
+    return normalise_rows(centres[rng.integers(0, len(centres), rows)] + 0.2 * rng.normal(size=(rows, dim)))
+
+def exact_top_k(queries, corpus, k):
+    return np.argsort(-(normalise_rows(queries) @ corpus.T), axis=1)[:, :k]
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_top_k_recall_and_scores(backend):
+    corpus, queries = clustered(2000), clustered(200, seed=1)
+    index = build_ann_index(corpus, backend=backend)
+    ids, scores = index.query(queries, k=5)
+    expected = exact_top_k(queries, corpus, 5)
+    recall = np.mean([len(set(found) & set(wanted)) / 5 for found, wanted in zip(ids, expected)])
+    assert recall > 0.9
+    assert np.allclose(scores[:, 0], np.sum(normalise_rows(queries) * corpus[ids[:, 0]], axis=1), atol=1e-4)
+
+def test_ivf_probing_every_list_is_exact(monkeypatch):
+    monkeypatch.setattr(SystemSettings, "ann_nprobe", 10_000)
+    corpus, queries = clustered(500), clustered(50, seed=2)
+    ids, _ = build_ann_index(corpus, backend="ivf").query(queries, k=3)
+    assert (ids == exact_top_k(queries, corpus, 3)).all()
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_incremental_updates_survive_a_reload(tmp_path, backend):
+    corpus = clustered(300)
+    index = build_ann_index(corpus[:200], np.arange(200) + 1000, backend=backend)
+    index.add(corpus[200:], np.arange(200, 300) + 1000)
+    index.remove([1000, 1001])
+    save_ann_index(index, str(tmp_path / "index"))
+
+    reloaded = load_ann_index(str(tmp_path / "index"), backend=backend)
+    assert len(reloaded) == 298
+    ids, scores = reloaded.query(corpus[[0, 250]], k=1)
+    assert ids[0, 0] != 1000 and ids[1, 0] == 1250 and scores[1, 0] > 0.999
+
+def test_queries_beyond_the_index_size_are_padded():
+    ids, scores = build_ann_index(clustered(20)[:3], backend="ivf").query(clustered(20)[:2], k=5)
+    assert (ids[:, 3:] == -1).all() and np.isnan(scores[:, 3:]).all()
+
+def test_persisted_index_follows_the_text_list(tmp_path, monkeypatch):
+    def encoder(texts):
+        return normalise_rows([[text.count(c) for c in "aeiou"] + [len(text)] for text in texts])
+
+    store = EmbeddingStore("test-model", str(tmp_path / "store"), encoder=encoder)
+    monkeypatch.setattr(ann_index, "get_embedding_store", lambda model_name=None: store)
+    monkeypatch.setattr(SystemSettings, "ann_index_dir", str(tmp_path / "ann"))
+
+    index, rows = ann_index.get_ann_index("groups", ["Delivered", "Held at depot", "Returned"], backend="ivf")
+    assert sorted(index.indexed_ids().tolist()) == sorted(rows.tolist())
+
+    edited = ["Delivered", "Held at the depot", "Returned"]
+    index, rows = ann_index.get_ann_index("groups", edited, backend="ivf")
+    assert len(index) == 3 and sorted(index.indexed_ids().tolist()) == sorted(rows.tolist())
+    ids, _ = index.query(store.encode(["Held at the depot"]), k=1)
+    assert ids[0, 0] == rows[1]
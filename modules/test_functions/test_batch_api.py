@@ -0,0 +1,77 @@
+import sys
+import os
+import json
+import pandas as pd
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import prediction_processor
+from modules.batch_api import LocalBatchService, run_batch
+
+
+def echo_responder(body):
+    content = body["messages"][-1]["content"]
+    if "fail" in content:
+        raise ValueError("simulated model error")
+    return {"content": content.upper(), "prompt_tokens": 7, "completion_tokens": 2}
+
+
+def test_local_batch_round_trip(tmp_path):
+    service = LocalBatchService(str(tmp_path / "service"), responder=echo_responder, polls_until_complete=2)
+    requests = [
+        (f"req-{i}", {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": text}], "temperature": 0})
+        for i, text in enumerate(["delivered", "fail me", "in transit"])
+    ]
+
+    results = run_batch(requests, service, work_dir=str(tmp_path / "work"), poll_interval=0, use_cache=False)
+
+    assert results["req-0"]["response"].choices[0].message.content == "DELIVERED"
+    assert results["req-2"]["response"].usage.prompt_tokens == 7
+    assert results["req-1"]["response"] is None and "simulated model error" in results["req-1"]["error"]
+
+    input_files = os.listdir(tmp_path / "work")
+    assert len(input_files) == 1
+    lines = [json.loads(line) for line in open(tmp_path / "work" / input_files[0], encoding="utf-8")]
+    assert [line["custom_id"] for line in lines] == ["req-0", "req-1", "req-2"]
+    assert lines[0]["url"] == "/v1/chat/completions"
+
+
+def test_timed_out_batch_is_cancelled(tmp_path):
+    service = LocalBatchService(str(tmp_path / "service"), responder=echo_responder, polls_until_complete=1000)
+    requests = [("req-0", {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "delivered"}]})]
+
+    results = run_batch(requests, service, work_dir=str(tmp_path / "work"), poll_interval=0, timeout=0, use_cache=False)
+
+    assert results["req-0"] == {"response": None, "error": "No result (batch cancelled)"}
+    batch_file = os.listdir(tmp_path / "service" / "batches")[0]
+    assert json.load(open(tmp_path / "service" / "batches" / batch_file, encoding="utf-8"))["status"] == "cancelled"
+
+
+def test_process_csv_batch_mode_merges_by_custom_id(tmp_path, run_process_csv, monkeypatch):
+
+    service = LocalBatchService(str(tmp_path / "service"), responder=echo_responder)
+    monkeypatch.setattr(prediction_processor, "get_batch_service", lambda client: service)
+    monkeypatch.setattr(prediction_processor.SystemSettings, "batch_service", "local")
+    monkeypatch.setattr(prediction_processor.SystemSettings, "batch_work_dir", str(tmp_path / "work"))
+    monkeypatch.setattr(prediction_processor.SystemSettings, "batch_poll_seconds", 0)
+
+    df = pd.DataFrame({"Scans": ["(t1) Delivered", None, "(t2) fail", "(t3) Out for delivery"]})
+    predictions = run_process_csv(df, mode="batch")
+
+    assert [p["Predicted_Status"] for p in predictions] == [
+        "SCAN HISTORY:\n(T1) DELIVERED",
+        "Error: {\"message\": \"simulated model error\"}",
+        "SCAN HISTORY:\n(T3) OUT FOR DELIVERY",
+    ]
+
+    # ✅ A batch still running after `batch_timeout_seconds` is cancelled and its rows marked failed
+    stuck = LocalBatchService(str(tmp_path / "stuck"), responder=echo_responder, polls_until_complete=1000)
+    monkeypatch.setattr(prediction_processor, "get_batch_service", lambda client: stuck)
+    monkeypatch.setattr(prediction_processor.SystemSettings, "batch_timeout_seconds", 0)
+
+    predictions = run_process_csv(df, output="stuck.csv", mode="batch")
+
+    assert [p["Predicted_Status"] for p in predictions] == ["Error: No result (batch cancelled)"] * 3
+    batch_file = os.listdir(tmp_path / "stuck" / "batches")[0]
+    assert json.load(open(tmp_path / "stuck" / "batches" / batch_file, encoding="utf-8"))["status"] == "cancelled"
@@ -0,0 +1,64 @@
+import sys
+import os
+import json
+import pytest
+import pandas as pd
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import prediction_processor, compact_schema
+from modules.compact_schema import build_code_schema, decode_codes, CodeDecoder
+
+MAPPING = {"progress": {"1": "Manifested", "4": "Delivered"},
+           "final_status": {"12": "Collection Failed - No Info"}}
+
+
+def test_code_schema_is_strict():
+    schema = build_code_schema(MAPPING)["json_schema"]
+    assert schema["strict"] and schema["schema"]["additionalProperties"] is False
+    assert schema["schema"]["properties"]["p"]["enum"] == ["1", "4"]
+    multi = build_code_schema(MAPPING, multi=True)["json_schema"]["schema"]
+    assert multi["properties"]["shipments"]["items"]["required"] == ["tracking_number", "p", "s"]
+
+
+def test_decode_codes():
+    assert decode_codes('{"p": "4", "s": null}', MAPPING) == ("Delivered", None)
+    assert decode_codes({"p": 1, "s": "12"}, MAPPING) == ("Manifested", "Collection Failed - No Info")
+    with pytest.raises(ValueError):
+        decode_codes('{"p": "9", "s": null}', MAPPING)
+    with pytest.raises(ValueError):
+        decode_codes("Delivered", MAPPING)
+
+
+def test_decoder_counts_savings_and_flags_bad_answers(monkeypatch):
+    monkeypatch.setattr(compact_schema, "estimate_tokens", lambda text, model=None: len(text) // 4 + 1)
+    decoder = CodeDecoder(MAPPING)
+
+    prediction = decoder.decode_prediction({"Predicted_Status": '{"p": "1", "s": "12"}', "Token_Output": 12})
+    assert json.loads(prediction["Predicted_Status"]) == {"status": "Manifested",
+                                                          "final_status": "Collection Failed - No Info"}
+    assert decoder.completion_tokens == 12 and decoder.label_tokens > 12
+
+    bad = decoder.decode_prediction({"Predicted_Status": "Delivered", "Token_Output": 3})
+    assert bad["Predicted_Status"].startswith("Error:")  # ✅ Recorded as failed, so `--resume` re-sends it
+
+    shipments = decoder.decode_shipments([{"tracking_number": "A", "p": "4", "s": None},
+                                          {"tracking_number": "B", "p": "x", "s": None}], 20)
+    assert shipments == [{"tracking_number": "A", "progress": "Delivered", "final_status": None}]
+
+
+def test_process_csv_in_codes_mode(tmp_path, run_process_csv, monkeypatch):
+
+    def fake_response(prompt_messages):
+        assert "p is the progress code" in prompt_messages[0]["content"]
+        return ('{"p": "4", "s": null}' if "Delivered" in prompt_messages[1]["content"] else '{"p": "1", "s": "12"}'), 50, 9
+
+    monkeypatch.setattr(compact_schema, "load_status_mapping", lambda: MAPPING)
+    monkeypatch.setattr(compact_schema, "estimate_tokens", lambda text, model=None: len(text) // 4 + 1)
+    monkeypatch.setattr(prediction_processor.SystemSettings, "response_mode", "codes")
+
+    df = pd.DataFrame({"Scans": ["(2024-09-01T10:00:00) Delivered", "(2024-09-01T10:00:00) Manifested"]})
+    predictions = run_process_csv(df, fake_response)
+    assert [json.loads(p["Predicted_Status"])["status"] for p in predictions] == ["Delivered", "Manifested"]
+    assert pd.read_csv(tmp_path / "out.csv")["Predicted_Status"].str.contains("Delivered").iloc[0]
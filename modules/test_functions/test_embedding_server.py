@@ -0,0 +1,99 @@
+import sys
+import os
+import json
+import socket
+import threading
+import urllib.request
+import numpy as np
+import pytest
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import embeddings
+from modules.embeddings import normalise_rows, load_text_encoder
+from modules.embedding_server import EmbeddingServer
+from modules.system_settings import SystemSettings
+
+def fake_encoder(texts):
+    return normalise_rows([[len(text), text.count("e") + 1] for text in texts])
+
+@pytest.fixture
+def server_url(monkeypatch):
+    server = EmbeddingServer(("127.0.0.1", 0), max_wait_ms=50,
+                             load_encoder=lambda name: fake_encoder if name == "fake-model" else None)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(SystemSettings, "embedding_server_url", url)
+    embeddings._servers_with_model.clear()
+    yield url
+    server.shutdown()
+    server.server_close()
+    embeddings._servers_with_model.clear()
+
+def test_remote_encoding_is_micro_batched(server_url):
+    encode = load_text_encoder("fake-model")
+    texts = [[f"scan {i}", "Delivered"] for i in range(8)]
+    results = [None] * len(texts)
+
+    def call(i):
+        results[i] = encode(texts[i])
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(texts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for batch, vectors in zip(texts, results):
+        assert np.allclose(vectors, fake_encoder(batch))
+    with urllib.request.urlopen(f"{server_url}/metrics") as response:
+        metrics = json.load(response)["fake-model"]
+    assert metrics["requests"] == 8 and metrics["texts"] == 16
+    assert metrics["batches"] < 8 and metrics["queue_depth"] == 0
+
+def test_health_check_never_loads_a_model(server_url):
+    def health(model_name):
+        with urllib.request.urlopen(f"{server_url}/health?model={model_name}", timeout=1) as response:
+            return json.load(response)["model_available"]
+
+    assert health("fake-model") is None  # ✅ Cold: answered at once, loaded on the first encode
+    load_text_encoder("fake-model")(["Delivered"])
+    assert health("fake-model") is True
+
+def test_unknown_model_on_the_server_loads_in_process(server_url, monkeypatch):
+    def in_process(texts):
+        return np.ones((len(texts), 2), dtype=np.float32)
+
+    monkeypatch.setattr(embeddings, "load_encoder", lambda name: in_process)
+    encode = load_text_encoder("other-model")
+    assert np.allclose(encode(["Delivered"]), 1)  # ✅ The server could not load it: encoded in-process instead
+    embeddings._servers_with_model.clear()
+    assert load_text_encoder("other-model") is in_process  # ✅ Now the server reports it unavailable
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]  # ✅ Free port, nothing listening once closed
+
+def test_falls_back_to_in_process_without_a_server(monkeypatch):
+    port = free_port()
+    monkeypatch.setattr(SystemSettings, "embedding_server_url", f"http://127.0.0.1:{port}")
+    monkeypatch.setattr(embeddings, "load_encoder", lambda name: "in-process")
+    embeddings._servers_with_model.clear()
+    assert load_text_encoder("fake-model") == "in-process"
+
+    # ✅ A missing server is not remembered: one started later is used
+    server = EmbeddingServer(("127.0.0.1", port), load_encoder=lambda name: fake_encoder)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        assert load_text_encoder("fake-model") != "in-process"
+    finally:
+        server.shutdown()
+        server.server_close()
+        embeddings._servers_with_model.clear()
+
+def test_remote_failure_mid_run_switches_to_in_process(monkeypatch):
+    monkeypatch.setattr(embeddings, "load_encoder", lambda name: fake_encoder)
+    encode = embeddings.remote_encoder(f"http://127.0.0.1:{free_port()}", "fake-model")
+    assert np.allclose(encode(["Delivered"]), fake_encoder(["Delivered"]))
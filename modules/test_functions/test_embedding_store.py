@@ -0,0 +1,57 @@
+import sys
+import os
+import numpy as np
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules.embeddings import normalise_rows
+from modules.embedding_store import EmbeddingStore
+
+class CountingEncoder:
+    """Deterministic stand-in for a sentence-transformers model that records what it encodes."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def __call__(self, texts):
+        self.encoded.extend(texts)
+        return normalise_rows([[len(text), text.count("e") + 1, sum(map(ord, text)) % 7 + 1] for text in texts])
+
+def test_only_new_texts_are_encoded_across_runs(tmp_path):
+    names = ["Delivered", "Out for delivery", "Returned to sender"]
+    first = CountingEncoder()
+    vectors = np.array(EmbeddingStore("test-model", str(tmp_path), encoder=first).encode(names))
+    assert first.encoded == names
+
+    second = CountingEncoder()
+    store = EmbeddingStore("test-model", str(tmp_path), encoder=second)
+    edited = names[:2] + ["Returned  to sender ", "Held at depot"]  # ✅ Whitespace edits hit the same key
+    again = store.encode(edited)
+    assert second.encoded == ["Held at depot"]
+    assert np.allclose(again[:3], vectors) and len(store) == 4
+
+def test_consecutive_rows_are_a_view_of_the_memory_map(tmp_path):
+    store = EmbeddingStore("test-model", str(tmp_path), encoder=CountingEncoder(), batch_size=2)
+    store.encode(["a", "b", "c", "d", "e"])
+    assert isinstance(store.encode(["b", "c", "d"]), np.memmap)
+    assert not isinstance(store.encode(["d", "a"]), np.memmap)
+
+def test_two_stores_on_one_directory_share_rows(tmp_path):
+    first_encoder, second_encoder = CountingEncoder(), CountingEncoder()
+    first = EmbeddingStore("test-model", str(tmp_path), encoder=first_encoder)
+    second = EmbeddingStore("test-model", str(tmp_path), encoder=second_encoder)  # ✅ As in another process
+
+    first.encode(["Delivered", "Held"])
+    second.encode(["Held", "Returned"])
+    assert second_encoder.encoded == ["Returned"]
+    assert len(second) == 3 and set(second.rows(["Delivered", "Held", "Returned"]).tolist()) == {0, 1, 2}
+    assert np.allclose(first.encode(["Returned"]), second.encode(["Returned"]))
+    assert first_encoder.encoded == ["Delivered", "Held"]
+
+def test_float16_store(tmp_path):
+    encoder = CountingEncoder()
+    store = EmbeddingStore("test-model", str(tmp_path), dtype="float16", encoder=encoder)
+    vectors = store.encode(["Delivered", "Held"])
+    assert vectors.dtype == np.float16
+    assert np.allclose(vectors, encoder(["Delivered", "Held"]), atol=1e-3)
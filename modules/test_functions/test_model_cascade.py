@@ -0,0 +1,99 @@
+import sys
+import os
+import math
+from openai.types.chat import ChatCompletion
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import model_cascade
+from modules.model_cascade import (
+    normalise_label, sequence_probability, label_probability, escalation_reason, extract_label, extract_labels,
+    load_allowed_labels
+)
+
+PROMPT_FILE = os.path.join(os.path.dirname(__file__), "..", "..", "data", "prompts", "system_prompt.json")
+
+
+def completion(model, content, token_logprobs=None, prompt_tokens=100, completion_tokens=3, tokens=None):
+    logprobs = None
+    if token_logprobs is not None:
+        tokens = tokens or [f"t{i}" for i in range(len(token_logprobs))]
+        logprobs = {"content": [{"token": token, "logprob": lp, "bytes": None, "top_logprobs": []}
+                                for token, lp in zip(tokens, token_logprobs)]}
+    return ChatCompletion.model_validate({
+        "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "logprobs": logprobs,
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    })
+
+
+def test_sequence_probability_and_label_helpers():
+    response = completion("gpt-4o-mini", "In Transit", [math.log(0.9), math.log(0.5)])
+    assert math.isclose(sequence_probability(response), 0.45)
+    assert sequence_probability(completion("gpt-4o-mini", "x")) is None
+    assert normalise_label('"In Transit"') == normalise_label("InTransit")
+    assert extract_label('{"status": "Delivered", "reason": "signed"}') == "Delivered"
+
+
+def test_labels_and_probability_of_the_prompt_answer_shape():
+    answer = ('{"shipments":[{"shipmentStatus":"OutForDelivery","CollectionStatus":1,'
+              '"CollectionAttemptCount":1,"CollectionSchedulingStatus":"NotAttempted"}]}')
+    tokens = ['{"', 'ship', 'ments', '":[{"', 'shipment', 'Status', '":"', 'Out', 'For', 'Delivery', '","',
+              'Collection', 'Status', '":', '1', ',"', 'CollectionAttemptCount', '":', '1', ',"',
+              'CollectionSchedulingStatus', '":"', 'NotAttempted', '"}]}']
+    assert "".join(tokens) == answer
+    logprobs = [math.log(0.5)] * len(tokens)
+    logprobs[7:10] = [math.log(0.99), math.log(0.98), math.log(0.97)]  # ✅ Only these spell the label
+    response = completion("gpt-4o-mini", answer, logprobs, tokens=tokens)
+
+    assert extract_labels(answer) == ["OutForDelivery"]
+    assert math.isclose(label_probability(response), 0.99 * 0.98 * 0.97)
+    assert sequence_probability(response) < 1e-5  # ✅ The whole answer would always escalate
+
+    allowed = load_allowed_labels(PROMPT_FILE)  # ✅ The prompt's shipmentStatus enum
+    assert {normalise_label("OutForDelivery"), normalise_label("CollectionFailed")} <= allowed
+    assert escalation_reason(extract_labels(answer), label_probability(response), 0.9, allowed) is None
+    assert escalation_reason(["Delivered", "Lost"], 0.99, 0.9, allowed) == "label not in allowed list"
+
+
+def test_escalation_reason():
+    allowed = {normalise_label("Delivered"), normalise_label("InTransit")}
+    assert escalation_reason("Delivered", 0.97, 0.9, allowed) is None
+    assert escalation_reason("Delivered", 0.6, 0.9, allowed).startswith("confidence")
+    assert escalation_reason("Lost in space", 0.99, 0.9, allowed) == "label not in allowed list"
+
+
+def test_cascade_only_escalates_uncertain_rows(monkeypatch):
+    answers = {
+        "easy": completion("gpt-4o-mini", "Delivered", [math.log(0.99)]),
+        "hard": completion("gpt-4o-mini", "Delivered", [math.log(0.4)]),
+    }
+    calls = []
+
+    def fake_create(client, retry_policy=None, **request):
+        calls.append(request["model"])
+        if request["model"] == "gpt-4o":
+            assert "logprobs" not in request
+            return completion("gpt-4o", "In Transit", prompt_tokens=100, completion_tokens=2)
+        assert request["logprobs"] is True
+        return answers[request["messages"][1]["content"]]
+
+    monkeypatch.setattr(model_cascade, "create_chat_completion", fake_create)
+    monkeypatch.setattr(model_cascade, "get_client", lambda api_key: object())
+    monkeypatch.setattr(model_cascade.SystemSettings, "cascade_models", ["gpt-4o-mini", "gpt-4o"])
+    monkeypatch.setattr(model_cascade.SystemSettings, "cascade_threshold", 0.9)
+    allowed = {normalise_label("Delivered"), normalise_label("In Transit")}
+
+    def messages(text):
+        return [{"role": "system", "content": "Classify."}, {"role": "user", "content": text}]
+
+    easy = model_cascade.get_cascade_response(messages("easy"), allowed_labels=allowed)
+    assert easy[0] == "Delivered" and easy[3] == "gpt-4o-mini" and calls == ["gpt-4o-mini"]
+
+    hard = model_cascade.get_cascade_response(messages("hard"), allowed_labels=allowed)
+    assert hard[0] == "In Transit" and hard[3] == "gpt-4o"
+    assert hard[1:3] == (200, 5)  # ✅ Both tiers' tokens are counted
+    assert calls == ["gpt-4o-mini", "gpt-4o-mini", "gpt-4o"]
@@ -0,0 +1,52 @@
+import sys
+import os
+import asyncio
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import openai_client
+from modules.openai_client import get_client, get_async_client, close_async_client, close_clients
+
+
+def test_one_client_per_api_key():
+    try:
+        first = get_client("sk-test-a")
+        assert get_client("sk-test-a") is first
+        assert get_client("sk-test-b") is not first
+        assert first.timeout.connect == openai_client.SystemSettings.http_connect_timeout_seconds
+    finally:
+        close_clients()
+
+
+def test_async_client_is_shared_within_a_loop_only():
+    async def grab():
+        return get_async_client("sk-test-a"), get_async_client("sk-test-a")
+
+    first_a, first_b = asyncio.run(grab())
+    second_a, _ = asyncio.run(grab())
+
+    assert first_a is first_b
+    assert second_a is not first_a
+    close_clients()
+
+
+def test_async_clients_are_closed():
+    async def grab(close):
+        client = get_async_client("sk-test-a")
+        if close:
+            await close_async_client("sk-test-a")
+        return client
+
+    closed = asyncio.run(grab(close=True))
+    assert closed.is_closed() and "sk-test-a" not in openai_client._async_clients
+
+    left_open = asyncio.run(grab(close=False))  # ✅ Closed at exit instead
+    close_clients()
+    assert left_open.is_closed()
+
+
+def test_missing_key_returns_none(monkeypatch):
+    monkeypatch.setattr(openai_client.SystemSettings, "api_key", None)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    assert get_client() is None
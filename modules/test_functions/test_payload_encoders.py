@@ -0,0 +1,55 @@
+import sys
+import os
+import csv
+import io
+import json
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import payload_encoders
+from modules.payload_encoders import PAYLOAD_ENCODERS, get_payload_encoder, resolve_payload_format, measure_payload_tokens
+from modules.prompt_generator import format_shipments
+
+SHIPMENTS = [
+    {"tracking_number": "TN1", "shipment_id": 7, "carrier": "Evri",
+     "scans": [{"timestamp": "2024-09-01T10:00:00", "scan": "Manifested"},
+               {"timestamp": "2024-09-02T10:00:00", "scan": "Delivered, left with neighbour"}]},
+    {"tracking_number": "TN2", "shipment_id": None, "carrier": None, "scans": []},
+]
+
+
+def test_default_shipment_format_is_unchanged():
+    text = format_shipments(SHIPMENTS)
+    assert text.startswith("\nShipment Start\nTracking Number: TN1\nShipment ID: 7\nCarrier: Evri\nScans:\n"
+                           "- 2024-09-01T10:00:00: Manifested\n")
+
+
+def test_encoders_keep_every_id_and_scan():
+    minified = json.loads(PAYLOAD_ENCODERS["json_min"].encode_shipments(SHIPMENTS))
+    assert minified["shipments"][0]["scans"][1]["scan"] == "Delivered, left with neighbour"
+
+    rows = list(csv.reader(io.StringIO(PAYLOAD_ENCODERS["csv"].encode_shipments(SHIPMENTS))))
+    assert rows[0] == ["tracking_number", "shipment_id", "carrier", "timestamp", "scan"]
+    assert rows[1:] == [["TN1", "7", "Evri", "2024-09-01T10:00:00", "Manifested"],
+                        ["", "", "", "2024-09-02T10:00:00", "Delivered, left with neighbour"],
+                        ["TN2", "", "", "", ""]]
+
+    for name, encoder in PAYLOAD_ENCODERS.items():
+        text = encoder.encode_shipments(SHIPMENTS)
+        assert "TN1" in text and "TN2" in text and "left with neighbour" in text, name
+        assert "Manifested" in encoder.encode_scans(["Manifested", "Delivered"]), name
+
+
+def test_payload_format_can_be_chosen_per_model(monkeypatch):
+    monkeypatch.setattr(payload_encoders.SystemSettings, "payload_format", {"gpt-4o": "tsv", "gpt-4o-mini": "lines"})
+    assert resolve_payload_format("gpt-4o-mini-2024-07-18") == "lines"
+    assert resolve_payload_format("gpt-4o") == "tsv"
+    assert resolve_payload_format("gpt-3.5-turbo") == "text"
+    assert get_payload_encoder("yaml").name == "text"  # ✅ Unknown names fall back
+
+
+def test_measure_payload_tokens_shares_headers(monkeypatch):
+    monkeypatch.setattr(payload_encoders, "estimate_tokens", lambda text, model=None: len(text.split()))
+    results = measure_payload_tokens(SHIPMENTS * 10, ["gpt-4o-mini"], per_request=20)
+    assert results["gpt-4o-mini"]["tsv"] < results["gpt-4o-mini"]["text"]
@@ -0,0 +1,33 @@
+import sys
+import os
+import random
+import asyncio
+import pandas as pd
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import prediction_processor
+
+
+def test_async_mode_keeps_input_order(tmp_path, run_process_csv, monkeypatch):
+    df = pd.DataFrame({"Scans": [f"(2024-09-0{i % 9 + 1}T10:00:00) Scan {i}" for i in range(120)]})
+    client = object()  # ✅ Stands in for the pooled `AsyncOpenAI` client
+    in_flight = {"now": 0, "peak": 0}
+
+    async def fake_response(prompt_messages, client):
+        in_flight["now"] += 1
+        in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        await asyncio.sleep(random.uniform(0, 0.01))  # ✅ Finish out of order on purpose
+        in_flight["now"] -= 1
+        return prompt_messages[1]["content"].split()[-1], 10, 2
+
+    monkeypatch.setattr(prediction_processor, "get_openai_response_async", fake_response)
+    monkeypatch.setattr(prediction_processor, "get_async_client", lambda: client)
+
+    predictions = run_process_csv(df, mode="async", concurrency=8)
+
+    assert [p["Predicted_Status"] for p in predictions] == [str(i) for i in range(120)]
+    assert 1 < in_flight["peak"] <= 8
+    written = pd.read_csv(tmp_path / "out.csv")
+    assert written["Predicted_Status"].astype(str).tolist() == [str(i) for i in range(120)]  # ✅ Sink keeps input order
@@ -0,0 +1,51 @@
+import sys
+import os
+import json
+import pandas as pd
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import prompt_generator
+from modules.prompt_generator import compile_prompt, generate_scan_prompt
+
+
+def write_sources(tmp_path, groups):
+    prompt_file = tmp_path / "prompt.json"
+    prompt_file.write_text(json.dumps({"content": ["Match scans to:", "<<scan_groups>>"]}), encoding="utf-8")
+    groups_csv = tmp_path / "scan-groups.csv"
+    pd.DataFrame({"scan_group": groups}).to_csv(groups_csv, index=False)
+    return str(prompt_file), str(groups_csv)
+
+
+def test_scan_prompt_is_compiled_once(tmp_path, monkeypatch):
+    prompt_file, groups_csv = write_sources(tmp_path, ["Delivered", "In Transit"])
+    reads = []
+    read_csv = pd.read_csv
+    monkeypatch.setattr(prompt_generator.pd, "read_csv", lambda *a, **k: reads.append(a) or read_csv(*a, **k))
+
+    first = generate_scan_prompt(["Parcel delivered"], prompt_file, groups_csv)
+    second = generate_scan_prompt(["Out for delivery"], prompt_file, groups_csv)
+
+    assert len(reads) == 1
+    assert first[0]["content"] == second[0]["content"]  # ✅ Byte-identical prefix for prompt caching
+    assert first[0]["content"].endswith("- Delivered\n- In Transit")
+    assert compile_prompt(prompt_file, groups_csv).token_count("gpt-4o-mini") > 0
+
+
+def test_changed_source_file_recompiles(tmp_path):
+    prompt_file, groups_csv = write_sources(tmp_path, ["Delivered"])
+    before = compile_prompt(prompt_file, groups_csv)
+
+    pd.DataFrame({"scan_group": ["Delivered", "Returned to sender"]}).to_csv(groups_csv, index=False)
+    after = compile_prompt(prompt_file, groups_csv)
+
+    assert after is not before and after.digest != before.digest
+    assert "Returned to sender" in after.content
+
+
+def test_missing_prompt_is_not_cached(tmp_path):
+    missing = str(tmp_path / "missing.json")
+    assert compile_prompt(missing) is None
+    (tmp_path / "missing.json").write_text(json.dumps({"content": "Classify."}), encoding="utf-8")
+    assert compile_prompt(missing).content == "Classify."
@@ -0,0 +1,92 @@
+import sys
+import os
+import asyncio
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import rate_limiter, token_counter
+from modules.rate_limiter import RateLimiter, get_limits_for_model
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_budget_paces_requests(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limiter.time, "sleep", clock.sleep)
+
+    limiter = RateLimiter(rpm=600, tpm=6000)  # ✅ 100 tokens/second refill
+    limiter.acquire(5000)
+    assert clock.now == 1000.0  # ✅ Fits in the initial bucket, no wait
+
+    limiter.acquire(3000)  # ✅ Needs 2000 more tokens -> ~20 seconds
+    assert 19.9 <= clock.now - 1000.0 <= 20.1
+
+
+def test_request_budget_paces_requests(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limiter.time, "sleep", clock.sleep)
+
+    limiter = RateLimiter(rpm=2, tpm=1_000_000)
+    limiter.acquire(10)
+    limiter.acquire(10)
+    limiter.acquire(10)  # ✅ Third request in a 2 RPM budget waits ~30 seconds
+    assert 29.9 <= clock.now - 1000.0 <= 30.1
+
+
+def test_headers_shrink_budget():
+    limiter = RateLimiter(rpm=500, tpm=200000)
+    limiter.update_from_headers({
+        "x-ratelimit-limit-requests": "100",
+        "x-ratelimit-limit-tokens": "50000",
+        "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-remaining-tokens": "1200",
+    })
+    assert limiter.requests.capacity == 100
+    assert limiter.tokens.capacity == 50000
+    assert limiter._reserve(100) > 0  # ✅ Server says no requests left
+
+
+def test_async_acquire_does_not_block_event_loop():
+    limiter = RateLimiter(rpm=6000, tpm=6000)
+
+    async def run():
+        await asyncio.gather(*(limiter.acquire_async(1000) for _ in range(6)))
+
+    asyncio.run(run())
+    assert limiter.tokens.level < 1000
+
+
+def test_model_limits_use_longest_prefix():
+    assert get_limits_for_model("gpt-4o-mini-2024-07-18") == rate_limiter.DEFAULT_RATE_LIMITS["gpt-4o-mini"]
+    assert get_limits_for_model("gpt-4o-2024-08-06") == rate_limiter.DEFAULT_RATE_LIMITS["gpt-4o"]
+    assert get_limits_for_model("o1-preview") == rate_limiter.FALLBACK_RATE_LIMIT
+
+
+def test_offline_request_estimates_warn_once(monkeypatch):
+    warnings = []
+
+    def offline(model):
+        raise OSError("no network")
+
+    monkeypatch.setattr(token_counter, "get_encoding", offline)
+    monkeypatch.setattr(token_counter.logger, "warning", warnings.append)
+    token_counter.get_optional_encoding.cache_clear()
+    try:
+        request = {"model": "test-model", "messages": [{"role": "user", "content": "x" * 40}], "max_tokens": 10}
+        for _ in range(3):
+            assert rate_limiter.estimate_request_tokens(request) > 10
+        assert len(warnings) == 1
+    finally:
+        token_counter.get_optional_encoding.cache_clear()
@@ -0,0 +1,108 @@
+import sys
+import os
+import time
+import json
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from openai.types.chat import ChatCompletion
+from modules import ai_model
+from modules.response_cache import ResponseCache, make_cache_key
+from modules.retry_policy import RetryPolicy, CircuitBreaker, InvalidResponseError
+
+
+def completion_json(content):
+    return ChatCompletion.model_validate({
+        "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 12, "completion_tokens": 3, "total_tokens": 15},
+    }).model_dump_json()
+
+
+def test_key_depends_on_every_request_field():
+    base = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}], "temperature": 0}
+    assert make_cache_key(base) == make_cache_key(dict(reversed(list(base.items()))))
+    assert make_cache_key(base) != make_cache_key({**base, "temperature": 0.2})
+    assert make_cache_key(base) != make_cache_key({**base, "response_format": {"type": "json_object"}})
+
+
+def test_hits_misses_and_lru_eviction(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.put("a", "first")
+    cache.put("b", "second")
+    assert cache.get("a") == "first"  # ✅ "a" is now the most recently used
+    cache.put("c", "third")
+    cache.evict()
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "first" and cache.get("c") == "third"
+    assert cache.stats()["hits"] == 3 and cache.stats()["misses"] == 1
+
+
+def test_age_and_size_limits(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=10, max_age_seconds=60)
+    cache.put("old", "12345")
+    cache._conn.execute("UPDATE responses SET created_at = ?", (time.time() - 120,))
+    assert cache.get("old") is None
+
+    cache.put("x", "123456")
+    cache.put("y", "123456")
+    cache.evict()
+    assert cache.stats()["entries"] == 1
+
+
+def test_create_chat_completion_serves_repeats_from_cache(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(ai_model, "get_response_cache", lambda: cache)
+    calls = []
+
+    def fake_send(client, request, validate=None):
+        calls.append(request)
+        return ChatCompletion.model_validate_json(completion_json("Delivered"))
+
+    monkeypatch.setattr(ai_model, "_send_chat_completion", fake_send)
+    request = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "scans"}], "temperature": 0}
+
+    first = ai_model.create_chat_completion(None, **request)
+    second = ai_model.create_chat_completion(None, **request)
+    ai_model.create_chat_completion(None, **{**request, "temperature": 0.7})  # ✅ Not cached by default
+
+    assert first.choices[0].message.content == second.choices[0].message.content == "Delivered"
+    assert len(calls) == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_invalid_answers_are_retried_inside_the_call_and_not_cached(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(ai_model, "get_response_cache", lambda: cache)
+    answers = ["not json", '{"shipments": "wrong shape"}', '{"shipments": []}']
+
+    class RawResponse:
+        headers = {}
+
+        def __init__(self, content):
+            self.content = content
+
+        def parse(self):
+            return ChatCompletion.model_validate_json(completion_json(self.content))
+
+    class FakeClient:
+        class chat:
+            class completions:
+                class with_raw_response:
+                    @staticmethod
+                    def create(**request):
+                        return RawResponse(answers.pop(0))
+
+    def validate(response):
+        if not isinstance(json.loads(response.choices[0].message.content).get("shipments"), list):
+            raise InvalidResponseError("no shipments list")
+
+    policy = RetryPolicy(max_attempts=3, base_delay=0, breaker=CircuitBreaker("test"))
+    request = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "scans"}], "temperature": 0}
+    response = ai_model.create_chat_completion(FakeClient(), retry_policy=policy, validate=validate, **request)
+
+    assert response.choices[0].message.content == '{"shipments": []}' and not answers
+    assert cache.stats()["entries"] == 1
+    assert ai_model.create_chat_completion(None, **request).choices[0].message.content == '{"shipments": []}'
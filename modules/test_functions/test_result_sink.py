@@ -0,0 +1,62 @@
+import sys
+import os
+import json
+import pytest
+import pandas as pd
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import result_sink
+from modules.result_sink import open_sink, CsvSink, JsonlSink
+
+
+def rows(start, stop):
+    return [{"Input_Text": f"scan {i}", "Predicted_Status": f"status {i}", "Token_Input": i, "Token_Output": 1}
+            for i in range(start, stop)]
+
+
+def test_csv_sink_flushes_only_new_rows_by_row_count(tmp_path, monkeypatch):
+    synced = []
+    path = str(tmp_path / "out" / "predictions.csv")
+    sink = CsvSink(path, flush_rows=3, flush_seconds=3600)
+    original_sync = sink._sync
+    monkeypatch.setattr(sink, "_sync", lambda: (synced.append(sink.rows_written), original_sync()))
+
+    sink.write_many(rows(0, 7))
+    assert synced == [3, 6]  # ✅ fsync at each checkpoint, one per 3 rows
+    assert len(pd.read_csv(path)) == 6  # ✅ 7th row still buffered
+
+    sink.close()
+    df = pd.read_csv(path)
+    assert df["Token_Input"].tolist() == list(range(7))
+
+
+def test_csv_sink_appends_to_existing_file_with_its_header(tmp_path):
+    path = str(tmp_path / "predictions.csv")
+    with open_sink(path) as sink:
+        sink.write_many(rows(0, 2))
+    with open_sink(path, mode="a") as sink:
+        sink.write_many(rows(2, 4))
+
+    df = pd.read_csv(path)
+    assert df["Input_Text"].tolist() == [f"scan {i}" for i in range(4)]
+
+
+def test_jsonl_sink_flushes_on_time(tmp_path, monkeypatch):
+    clock = {"now": 0.0}
+    monkeypatch.setattr(result_sink.time, "monotonic", lambda: clock["now"])
+    path = str(tmp_path / "predictions.jsonl")
+    sink = JsonlSink(path, flush_rows=1000, flush_seconds=10)
+
+    sink.write(rows(0, 1)[0])
+    assert os.path.getsize(path) == 0
+    clock["now"] = 11.0
+    sink.write(rows(1, 2)[0])
+    assert [json.loads(line)["Token_Input"] for line in open(path, encoding="utf-8")] == [0, 1]
+    sink.close()
+
+
+def test_open_sink_rejects_unknown_extension(tmp_path):
+    with pytest.raises(ValueError):
+        open_sink(str(tmp_path / "predictions.xlsx"))
@@ -0,0 +1,110 @@
+import sys
+import os
+import asyncio
+import httpx
+import openai
+import pytest
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import retry_policy
+from modules.retry_policy import (
+    RetryPolicy, CircuitBreaker, classify_error, get_retry_after,
+    RATE_LIMIT, QUOTA, SERVER, TIMEOUT, INVALID_REQUEST, AUTH
+)
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+
+def status_error(cls, status, headers=None, body=None):
+    return cls("boom", response=httpx.Response(status, headers=headers or {}, request=REQUEST), body=body)
+
+
+def test_classify_error():
+    assert classify_error(status_error(openai.RateLimitError, 429)) == RATE_LIMIT
+    assert classify_error(status_error(openai.RateLimitError, 429, body={"code": "insufficient_quota"})) == QUOTA
+    assert classify_error(status_error(openai.InternalServerError, 503)) == SERVER
+    assert classify_error(openai.APITimeoutError(request=REQUEST)) == TIMEOUT
+    assert classify_error(status_error(openai.BadRequestError, 400)) == INVALID_REQUEST
+    assert classify_error(status_error(openai.AuthenticationError, 401)) == AUTH
+
+
+def test_retry_after_headers():
+    assert get_retry_after(status_error(openai.RateLimitError, 429, {"retry-after-ms": "1500"})) == 1.5
+    assert get_retry_after(status_error(openai.RateLimitError, 429, {"retry-after": "7"})) == 7.0
+    assert get_retry_after(status_error(openai.RateLimitError, 429)) is None
+
+
+def test_backoff_is_full_jitter_and_honours_retry_after():
+    policy = RetryPolicy(base_delay=1.0, max_delay=8.0, breaker=CircuitBreaker("test"))
+    assert all(0 <= policy.backoff(attempt) <= min(8.0, 2 ** (attempt - 1)) for attempt in range(1, 10))
+    assert policy.backoff(1, retry_after=20) == 20
+
+
+def test_retries_transient_errors_but_not_bad_requests(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(retry_policy.time, "sleep", sleeps.append)
+    policy = RetryPolicy(max_attempts=4, breaker=CircuitBreaker("test", failure_threshold=10))
+
+    outcomes = [status_error(openai.InternalServerError, 500),
+                status_error(openai.RateLimitError, 429, {"retry-after": "2"}), "ok"]
+
+    def flaky():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert policy.call(flaky) == "ok"
+    assert len(sleeps) == 2 and sleeps[1] >= 2
+
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise status_error(openai.BadRequestError, 400)
+
+    with pytest.raises(openai.BadRequestError):
+        policy.call(bad_request)
+    assert len(calls) == 1
+
+
+def test_circuit_breaker_opens_pauses_and_recovers_through_one_probe(monkeypatch):
+    clock = {"now": 0.0}
+    monkeypatch.setattr(retry_policy.time, "monotonic", lambda: clock["now"])
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_seconds=30)
+
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker._wait_time() == 30  # ✅ Every caller pauses during the outage
+
+    clock["now"] = 31.0
+    assert breaker._wait_time() == 0  # ✅ First caller becomes the probe
+    assert breaker._wait_time() > 0  # ✅ Others wait for its verdict
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    clock["now"] = 62.0
+    assert breaker._wait_time() == 0
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker._wait_time() == 0
+
+
+def test_async_call_uses_the_same_policy(monkeypatch):
+    async def no_sleep(delay):
+        pass
+
+    monkeypatch.setattr(retry_policy.asyncio, "sleep", no_sleep)
+    policy = RetryPolicy(max_attempts=3, breaker=CircuitBreaker("test"))
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise openai.APITimeoutError(request=REQUEST)
+        return "ok"
+
+    assert asyncio.run(policy.call_async(flaky)) == "ok"
+    assert len(attempts) == 3
@@ -0,0 +1,63 @@
+import sys
+import os
+import pandas as pd
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import prediction_processor
+from modules.rule_engine import RuleEngine, load_rule_engine, audit_disagreements
+
+RULES = RuleEngine({"Delivered": "Delivered", "Returned to sender": "Returned"}, ["Claim issued"])
+
+
+def test_rules_fire_only_on_an_unambiguous_latest_scan():
+    assert RULES.decide("(2024-09-26T07:05:00) Delivered,(2024-09-25T10:00:00) Out for delivery") == "Delivered"
+    assert RULES.decide("(2024-09-25T10:00:00) Returned to sender,(2024-09-26T07:05:00) In transit") is None
+    assert RULES.decide("(2024-09-26T07:05:00) Returned to sender,(2024-09-20T07:05:00) Claim issued") is None
+    assert RULES.decide("(2024-09-26T07:05:00) Delivered,(2024-09-26T07:05:00) Delivery attempted") is None
+    assert RULES.decide("Delivered") is None  # ✅ No timestamp, no way to know it's the latest scan
+
+
+def test_default_rules_resolve_status_mapping_ids():
+    rules = load_rule_engine()
+    assert rules.decide("(2024-09-26T07:05:00) Driver release - Delivered to a safe place") == "Delivered"
+    assert rules.decide("(2024-09-26T07:05:00) Returned to sender") == "Returned"
+
+
+def test_audit_disagreements():
+    audit = {"A": "Delivered", "B": "Returned", "C": "Delivered", "D": "Delivered"}
+    records = {"A": {"Predicted_Status": '{"status": "Delivered"}'}, "B": {"Predicted_Status": "Being returned"},
+               "C": {"Predicted_Status": "Error: API request failed"},
+               "D": {"Predicted_Status": '{"shipments": [{"shipmentStatus": "Delivered", "CollectionStatus": 1}]}'}}
+    assert audit_disagreements(audit, records) == (3, [("B", "Returned", "Being returned")])
+
+
+def test_process_csv_skips_the_model_for_rule_decided_rows(run_process_csv, monkeypatch):
+    df = pd.DataFrame({
+        "Tracking_Number": ["TN0", "TN1", "TN2"],
+        "Scans": ["(2024-09-01T10:00:00) In transit", "(2024-09-02T10:00:00) Delivered",
+                  "(2024-09-03T10:00:00) Out for delivery"],
+    })
+
+    sent = []
+
+    def fake_response(prompt_messages):
+        sent.append(prompt_messages[1]["content"])
+        return "In Transit", 10, 2
+
+    monkeypatch.setattr(prediction_processor, "load_rule_engine", lambda: RULES)
+    monkeypatch.setattr(prediction_processor.SystemSettings, "use_rule_engine", True)
+    monkeypatch.setattr(prediction_processor.SystemSettings, "rule_audit_rate", 0)
+
+    predictions = run_process_csv(df, fake_response)
+
+    assert len(sent) == 2 and not any("Delivered" in text for text in sent)
+    assert [p["Predicted_Status"] for p in predictions] == ["In Transit", "Delivered", "In Transit"]
+    assert predictions[1]["Model_Tier"] == "rules" and predictions[1]["Token_Input"] == 0
+
+    # ✅ Audited rows are decided by the rules and answered by the model too
+    sent.clear()
+    monkeypatch.setattr(prediction_processor.SystemSettings, "rule_audit_rate", 1)
+    predictions = run_process_csv(df, output="out2.csv")
+    assert len(sent) == 3 and predictions[1]["Predicted_Status"] == "In Transit"
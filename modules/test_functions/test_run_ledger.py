@@ -0,0 +1,57 @@
+import sys
+import os
+import pytest
+import pandas as pd
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules.run_ledger import RunLedger
+
+
+def test_ledger_tracks_completed_failed_and_retries(tmp_path):
+    ledger = RunLedger(str(tmp_path / "run.sqlite"))
+    ledger.record("A1", {"Predicted_Status": "Delivered", "Token_Input": 10, "Token_Output": 2})
+    ledger.record("B2", {"Predicted_Status": "Error: API request failed", "Token_Input": 0, "Token_Output": 0})
+    assert set(ledger.completed()) == {"A1"}
+    assert ledger.failed() == {"B2": "Error: API request failed"}
+
+    ledger.record("B2", {"Predicted_Status": "In transit", "Token_Input": 8, "Token_Output": 1})
+    assert set(ledger.completed()) == {"A1", "B2"}
+    assert ledger.summary() == {"completed": 2, "failed": 0, "token_input": 18, "token_output": 3}
+    ledger.close()
+
+
+class SimulatedCrash(Exception):
+    pass
+
+
+def test_resume_skips_completed_rows_and_retries_failed(tmp_path, run_process_csv):
+    df = pd.DataFrame({
+        "Tracking_Number": [f"TN{i}" for i in range(6)],
+        "Scans": [f"(2024-09-0{i + 1}T10:00:00) Scan {i}" for i in range(6)],
+    })
+
+    calls, attempts = [], {}
+
+    def flaky_response(prompt_messages):
+        scan = prompt_messages[1]["content"].split()[-1]
+        calls.append(scan)
+        attempts[scan] = attempts.get(scan, 0) + 1
+        if scan == "1" and attempts[scan] == 1:
+            return "Error: API request failed", 0, 0
+        if scan == "4" and attempts[scan] == 1:
+            raise SimulatedCrash  # ✅ The run dies part-way through
+        return f"status {scan}", 10, 2
+
+    with pytest.raises(SimulatedCrash):
+        run_process_csv(df, flaky_response, run_id="nightly")
+    assert calls == ["0", "1", "2", "3", "4"]
+
+    calls.clear()
+    predictions = run_process_csv(df, run_id="nightly", resume=True)
+
+    assert calls == ["1", "4", "5"]  # ✅ Only the failed row and the rows after the crash are re-sent
+    expected = [f"status {i}" for i in range(6)]
+    assert [p["Predicted_Status"] for p in predictions] == expected
+    assert pd.read_csv(tmp_path / "out.csv")["Predicted_Status"].tolist() == expected
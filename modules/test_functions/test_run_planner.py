@@ -0,0 +1,95 @@
+import sys
+import os
+import pandas as pd
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import prediction_processor, run_planner
+from modules.run_planner import RunPlan, plan_jobs
+
+
+def fake_count(texts, model=None, num_threads=None):
+    return [len(str(text).split()) for text in texts]
+
+
+def test_plan_totals_cost_and_percentiles():
+    plan = RunPlan("gpt-4o-mini", "sync", rows=4, prompt_tokens=[100, 200, 300, 400], completion_tokens=10)
+    assert plan.requests == 4 and plan.total_prompt_tokens == 1000 and plan.total_completion_tokens == 40
+    assert plan.percentiles()["p50"] == 250 and plan.percentiles()["max"] == 400
+    assert abs(plan.cost - (1000 / 1000 * 0.00015 + 40 / 1000 * 0.0006)) < 1e-12
+
+    batch = RunPlan("gpt-4o-mini", "batch", rows=4, prompt_tokens=[100, 200, 300, 400], completion_tokens=10)
+    assert batch.cost == plan.cost / 2 and batch.projected_seconds() is None
+    assert plan.exceeds_budget(0.0001) and not plan.exceeds_budget(1)
+
+
+def test_projected_time_is_bound_by_rate_limits_or_latency(monkeypatch):
+    monkeypatch.setattr(run_planner, "get_limits_for_model", lambda model: {"rpm": 60, "tpm": 10_000_000})
+    monkeypatch.setattr(run_planner.SystemSettings, "seconds_per_request", 0.1)
+    plan = RunPlan("gpt-4o-mini", "async", rows=120, prompt_tokens=[10] * 120, concurrency=8)
+    assert plan.projected_seconds() == 120  # ✅ 120 requests at 60 RPM
+
+    monkeypatch.setattr(run_planner.SystemSettings, "seconds_per_request", 10)
+    assert plan.projected_seconds() == 150  # ✅ 120 requests x 10s over 8 in flight
+
+
+def test_plan_jobs_skips_decided_rows_and_duplicates(monkeypatch):
+    monkeypatch.setattr(run_planner, "count_tokens_batch", fake_count)
+    system = {"role": "system", "content": "Classify this shipment"}
+    jobs = [("a", "Delivered", [system, {"role": "user", "content": "Delivered"}]),
+            ("b", "Delivered", [system, {"role": "user", "content": "Delivered"}]),
+            ("c", "In transit now", [system, {"role": "user", "content": "In transit now"}]),
+            ("d", "Delivered", None)]
+    plan = plan_jobs(jobs, "gpt-4o-mini")
+    assert plan.rows == 4 and plan.requests == 2
+    assert plan.total_prompt_tokens == (3 + 1 + 9) + (3 + 3 + 9)
+
+
+def test_process_csv_refuses_runs_over_budget(tmp_path, run_process_csv, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("nothing should be sent")
+
+    monkeypatch.setattr(run_planner, "count_tokens_batch", fake_count)
+    monkeypatch.setattr(prediction_processor.SystemSettings, "run_budget_usd", 0.0)
+
+    assert run_process_csv(pd.DataFrame({"Scans": [f"(2024-09-01T10:00:00) Scan {i}" for i in range(5)]}), fail) == []
+    assert not (tmp_path / "out.csv").exists()
+
+
+def test_cascade_plans_the_cheap_tier_plus_expected_escalations(monkeypatch):
+    monkeypatch.setattr(run_planner, "count_tokens_batch", fake_count)
+    monkeypatch.setattr(run_planner.SystemSettings, "use_model_cascade", True)
+    monkeypatch.setattr(run_planner.SystemSettings, "cascade_models", ["gpt-4o-mini", "gpt-4o"])
+    monkeypatch.setattr(run_planner.SystemSettings, "cascade_escalation_estimate", 0.5)
+    system = {"role": "system", "content": "Classify this shipment"}
+    jobs = [(str(i), f"Scan {i}", [system, {"role": "user", "content": f"Scan {i}"}]) for i in range(4)]
+    plan = plan_jobs(jobs, "gpt-4o-mini", completion_tokens=10)
+
+    escalation = plan.stages[0]
+    assert escalation["model"] == "gpt-4o" and escalation["requests"] == 2
+    assert escalation["prompt_tokens"] == plan.total_prompt_tokens // 2
+    cheap = RunPlan("gpt-4o-mini", "sync", 4, plan.prompt_tokens, completion_tokens=10).cost
+    assert abs(plan.cost - cheap - escalation["cost_usd"]) < 1e-12 and escalation["cost_usd"] > cheap
+
+
+def test_two_stage_checks_the_alignment_cost_before_sending_it(run_process_csv, monkeypatch):
+    df = pd.DataFrame({"Scans": [f"(2024-09-01T10:00:00) Scan {i}" for i in range(5)]})
+
+    class FakeResolver:
+        tier = "state_machine"
+
+        def plan(self, values):
+            return 3, 30_000, 3_000
+
+        def prepare(self, values):
+            raise AssertionError("stage 1 should not be sent")
+
+    monkeypatch.setattr(prediction_processor, "load_two_stage_resolver", FakeResolver)
+    monkeypatch.setattr(prediction_processor.SystemSettings, "run_budget_usd", 0.001)
+    monkeypatch.setattr(prediction_processor.SystemSettings, "scan_group_model", "gpt-4o-mini")
+
+    assert run_process_csv(df, mode="two_stage") == []
+    stage = prediction_processor.plan_alignment_stage(RunPlan("gpt-4o-mini", "sync", 0, []), FakeResolver(),
+                                                      df, "Scans").stages[0]
+    assert stage["requests"] == 3 and abs(stage["cost_usd"] - (30 * 0.00015 + 3 * 0.0006)) < 1e-12
@@ -0,0 +1,79 @@
+import sys
+import os
+import pandas as pd
+from datetime import timedelta
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import scan_compaction
+from modules.scan_compaction import compact_scan_history, measure_compaction, format_delta, add_compaction_notes
+from modules import prediction_processor
+from modules.prediction_processor import prepare_scan_history, build_jobs
+
+HISTORY = ("(2024-09-03T10:00:00) Your parcel is out for delivery,"
+           "(2024-09-03T10:00:00) Your parcel is out for delivery,"
+           "(2024-09-02T06:30:00) Arrived at facility EAST MIDLANDS-UNITED KINGDOM,"
+           "(2024-09-01T06:00:00) Arrived at facility EAST MIDLANDS-UNITED KINGDOM,"
+           "(2024-09-01T05:48:00) Shipment information sent to FedEx")
+
+
+def test_levels_build_on_each_other():
+    assert compact_scan_history(HISTORY, 0) == HISTORY
+    assert compact_scan_history(HISTORY, 1) == (
+        "(2024-09-03T10:00:00) Your parcel is out for delivery,"
+        "(2024-09-01T06:00:00..2024-09-02T06:30:00) Arrived at facility EAST MIDLANDS-UNITED KINGDOM (x2),"
+        "(2024-09-01T05:48:00) Shipment information sent to FedEx")
+    assert compact_scan_history(HISTORY, 2).startswith("Start 2024-09-01T05:48:00\n(+2d4h) Your parcel")
+    assert compact_scan_history(HISTORY, 3) == (
+        "Start 2024-09-01T05:48:00\n(+2d4h) parcel is out for delivery,"
+        "(+12m..+1d) Arrived at facility EAST MIDLANDS-UNITED KINGDOM (x2),"  # ✅ Locations are kept
+        "(+0) Shipment information sent to FedEx")
+
+
+def test_the_notation_is_explained_only_when_compacting():
+    messages = [{"role": "system", "content": "Classify."}, {"role": "user", "content": "Scan History:\n..."}]
+    assert add_compaction_notes(messages, 0) is messages  # ✅ Uncompacted prompts (and their cache keys) are unchanged
+
+    level_1 = add_compaction_notes(messages, 1)[0]["content"]
+    assert "(x3)" in level_1 and "(<first>..<last>)" in level_1 and "Start <timestamp>" not in level_1
+    level_3 = add_compaction_notes(messages, 3)[0]["content"]
+    assert level_3.startswith("Classify.\n\n") and "Start <timestamp>" in level_3 and "(+2d4h)" in level_3
+    assert messages[0]["content"] == "Classify."
+
+
+def test_format_delta():
+    assert format_delta(timedelta(days=3, hours=4, minutes=5)) == "+3d4h"
+    assert format_delta(timedelta(hours=4, minutes=12)) == "+4h12m"
+    assert format_delta(timedelta(minutes=12)) == "+12m"
+    assert format_delta(timedelta(0)) == "+0"
+
+
+def test_text_without_timestamps_is_kept():
+    assert compact_scan_history("Delivered", 3) == "Delivered"
+    assert prepare_scan_history("Delivered", 2) == "Scan History:\nDelivered"
+
+
+def test_measure_compaction_reports_both_counts(monkeypatch):
+    monkeypatch.setattr(scan_compaction, "estimate_tokens", lambda text, model=None: len(text))
+    before, after, text = measure_compaction(HISTORY, 3)
+    assert before == len(HISTORY) and after == len(text) < before
+
+
+def test_run_savings_are_measured_from_the_prompt_texts(prompt_file, monkeypatch):
+    compacted, logged = [], []
+
+    def counting_compact(value, level=None):
+        compacted.append(value)
+        return compact_scan_history(value, level)
+
+    monkeypatch.setattr(prediction_processor, "compact_scan_history", counting_compact)
+    monkeypatch.setattr(prediction_processor, "log_compaction_savings", lambda *args: logged.append(args))
+    monkeypatch.setattr(prediction_processor.SystemSettings, "scan_compaction_level", 3)
+
+    jobs, _ = build_jobs(pd.DataFrame({"Scans": [HISTORY, None]}), "Scans", prompt_file)
+    assert len(compacted) == 1  # ✅ Compacted once, for the prompt
+    raw_texts, compacted_texts, level, _ = logged[0]
+    assert raw_texts == [HISTORY] and compacted_texts == [compact_scan_history(HISTORY, 3)] and level == 3
+    assert jobs[0][1] == "Scan History:\n" + compacted_texts[0]
+    assert "Start <timestamp>" in jobs[0][2][0]["content"]  # ✅ The compacted run's prompt explains the notation
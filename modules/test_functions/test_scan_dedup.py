@@ -0,0 +1,54 @@
+import sys
+import os
+import pandas as pd
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import prediction_processor
+from modules.scan_dedup import parse_scan_history, normalise_scan_history, dedup_scan_histories
+
+
+def test_parse_csv_and_mongo_histories():
+    csv_history = "Scan History:\n(2024-09-26T07:05:00) Unable to deliver, left card,(2024-09-11T01:26:00) Arrived"
+    mongo_history = [{"timestamp": "2024-09-26T07:05:00", "scan": "Unable to deliver, left card"},
+                     {"timestamp": "2024-09-11T01:26:00", "scan": "Arrived"}]
+
+    assert parse_scan_history(csv_history) == [("2024-09-26T07:05:00", "Unable to deliver, left card"),
+                                               ("2024-09-11T01:26:00", "Arrived")]
+    assert parse_scan_history(csv_history) == parse_scan_history(mongo_history)
+
+
+def test_normalisation_ignores_case_spacing_and_timestamps_by_default():
+    a = "(2024-09-01T10:00:00) Parcel  DELIVERED"
+    b = "(2024-10-05T08:30:00) parcel delivered"
+    assert normalise_scan_history(a, include_timestamps=False) == normalise_scan_history(b, include_timestamps=False)
+    assert normalise_scan_history(a, include_timestamps=True) != normalise_scan_history(b, include_timestamps=True)
+
+
+def test_dedup_assigns_duplicates_to_first_occurrence():
+    histories = ["(t1) A", "(t2) A,(t1) B", "(t3) a", "(t4) A,(t5) B"]
+    representatives, assignments = dedup_scan_histories(histories, include_timestamps=False)
+    assert representatives == [0, 1]
+    assert assignments == [0, 1, 0, 1]
+
+
+def test_sync_mode_sends_one_request_per_unique_history(run_process_csv, monkeypatch):
+    scans = ["(2024-09-01T10:00:00) Label created", "(2024-09-02T10:00:00) Label created",
+             "(2024-09-01T10:00:00) Delivered", "(2024-09-03T11:00:00) label  created"]
+
+    calls = []
+
+    def fake_response(prompt_messages):
+        calls.append(prompt_messages[1]["content"])
+        return f"status-{len(calls)}", 10, 2
+
+    monkeypatch.setattr(prediction_processor.SystemSettings, "dedup_scan_histories", True)
+    monkeypatch.setattr(prediction_processor.SystemSettings, "dedup_include_timestamps", False)
+
+    predictions = run_process_csv(pd.DataFrame({"Scans": scans}), fake_response)
+
+    assert len(calls) == 2
+    assert [p["Predicted_Status"] for p in predictions] == ["status-1", "status-1", "status-2", "status-1"]
+    assert [p["Token_Input"] for p in predictions] == [10, 0, 10, 0]  # ✅ Copies cost nothing
+    assert predictions[1]["Input_Text"].endswith(scans[1])  # ✅ Each row keeps its own history
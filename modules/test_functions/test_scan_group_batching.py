@@ -0,0 +1,73 @@
+import sys
+import os
+import json
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import scan_group_mapper
+from modules.system_settings import SystemSettings
+from modules.token_packer import pack_items
+
+class FakeResponse:
+    def __init__(self, matches, finish_reason="stop"):
+        content = json.dumps({"proposed_matches": matches})
+        if finish_reason == "length":
+            content = content[:len(content) // 2]  # ✅ Cut-off JSON, as the API returns it
+        self.choices = [type("Choice", (), {"finish_reason": finish_reason,
+                                            "message": type("Message", (), {"content": content})})]
+        self.usage = type("Usage", (), {"prompt_tokens": 100, "completion_tokens": 10 * len(matches), "total_tokens": 100 + 10 * len(matches)})
+
+def scans_in(request):
+    return json.loads(request["messages"][1]["content"])["scans_to_classify"]
+
+def make_prompt(tmp_path):
+    prompt_file = tmp_path / "prompt.json"
+    prompt_file.write_text(json.dumps({"content": "Groups: <<scan_groups>>"}), encoding="utf-8")
+    groups_csv = tmp_path / "scan-groups.csv"
+    groups_csv.write_text("scan_group\nDelivered\nDamaged\n", encoding="utf-8")
+    return str(prompt_file), str(groups_csv)
+
+def test_pack_items_with_per_item_completion_budget():
+    packs = pack_items([10, 10, 10, 10], prompt_budget=10_000, completion_budget=100,
+                       completion_per_item=[60, 30, 30, 30])
+    assert sorted(map(len, packs)) == [2, 2]
+    assert pack_items([1] * 5, 10_000, 10_000, 1, max_items=2) == [[0, 1], [2, 3], [4]]
+
+def test_pack_scan_batches_fills_the_completion_budget(monkeypatch):
+    monkeypatch.setattr(SystemSettings, "token_budgets", {"test-model": {"prompt": 10_000, "completion": 200}})
+    monkeypatch.setattr(SystemSettings, "scan_group_completion_tokens_per_match", 30)
+    scans = [f"scan {i}" for i in range(10)]
+    batches = scan_group_mapper.pack_scan_batches(scans, "test-model", system_prompt_tokens=50)
+    assert sorted(text for batch in batches for text in batch) == sorted(scans)
+    assert all(len(batch) <= 5 for batch in batches) and len(batches) == 2  # ✅ ~37 completion tokens per scan
+
+def test_cut_off_answers_are_split_and_retried(tmp_path, monkeypatch):
+    prompt_file, groups_csv = make_prompt(tmp_path)
+    sizes = []
+
+    def fake_completion(client, retry_policy=None, **request):
+        scans = scans_in(request)
+        sizes.append(len(scans))
+        matches = [{"original": scan, "proposed_sg": "Delivered"} for scan in scans]
+        return FakeResponse(matches, "length" if len(scans) > 2 else "stop")
+
+    monkeypatch.setattr(scan_group_mapper, "create_chat_completion", fake_completion)
+    scans = [f"scan {i}" for i in range(6)]
+    matches, usage = scan_group_mapper.align_batch(object(), scans, prompt_file, groups_csv)
+    assert sorted(match["original"] for match in matches) == scans
+    assert sizes == [6, 3, 1, 2, 3, 1, 2] and usage["requests"] == 7
+
+def test_only_unmatched_scans_are_resent(tmp_path, monkeypatch):
+    prompt_file, groups_csv = make_prompt(tmp_path)
+    sent = []
+
+    def fake_completion(client, retry_policy=None, **request):
+        scans = scans_in(request)
+        sent.append(scans)
+        return FakeResponse([{"original": scans[0], "proposed_sg": "Damaged"}])  # ✅ Only ever answers the first scan
+
+    monkeypatch.setattr(scan_group_mapper, "create_chat_completion", fake_completion)
+    matches, _ = scan_group_mapper.align_batch(object(), ["a", "b", "c"], prompt_file, groups_csv)
+    assert [match["original"] for match in matches] == ["a", "b", "c"]
+    assert sent == [["a", "b", "c"], ["b"], ["c"]]
@@ -0,0 +1,73 @@
+import sys
+import os
+import json
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import scan_group_mapper
+from modules.embeddings import normalise_rows
+from modules.scan_group_retriever import ScanGroupRetriever, recall_at_k
+
+GROUPS = ["Delivered", "Out for delivery", "Parcel damaged", "Returned to sender", "Customs clearance delay"]
+VOCABULARY = ["delivered", "delivery", "out", "damaged", "returned", "sender", "customs", "delay", "parcel"]
+
+
+def bag_of_words(texts):
+    """Stand-in for a sentence-transformers model: word counts over a tiny vocabulary."""
+    return normalise_rows([[text.lower().count(word) for word in VOCABULARY] + [0.01] for text in texts])
+
+
+def test_candidates_are_the_union_of_each_scans_top_k():
+    retriever = ScanGroupRetriever(GROUPS, bag_of_words, top_k=1, min_similarity=0.1)
+    assert retriever.candidates(["Parcel was damaged", "Your parcel was returned to the sender"]) == [
+        "Parcel damaged", "Returned to sender"]
+
+
+def test_low_similarity_falls_back_to_the_full_list():
+    retriever = ScanGroupRetriever(GROUPS, bag_of_words, top_k=1, min_similarity=0.5)
+    assert retriever.candidates(["Parcel was damaged", "Something unheard of"]) is None
+
+
+def test_scan_texts_go_through_the_query_encoder():
+    stored = []
+
+    def store_encoder(texts):
+        stored.extend(texts)
+        return bag_of_words(texts)
+
+    retriever = ScanGroupRetriever(GROUPS, store_encoder, top_k=1, min_similarity=0.1, query_encoder=bag_of_words)
+    assert retriever.candidates(["Parcel was damaged"]) == ["Parcel damaged"]
+    assert stored == GROUPS  # ✅ Throwaway batch texts never reach the embedding store
+
+
+def test_recall_at_k():
+    retriever = ScanGroupRetriever(GROUPS, bag_of_words, top_k=2)
+    pairs = [("Parcel was damaged", "Parcel damaged"), ("Delivered to neighbour", "delivered"),
+             ("Out for delivery", "Delivered"), ("Held", "Group that no longer exists")]
+    recall = recall_at_k(retriever, pairs, [1, 2, 5])
+    assert recall[1] == 2 / 3 and recall[5] == 1.0
+
+
+def test_alignment_prompt_lists_only_candidates(tmp_path, monkeypatch):
+    prompt_file = tmp_path / "prompt.json"
+    prompt_file.write_text(json.dumps({"content": "Groups: <<scan_groups>>"}), encoding="utf-8")
+    groups_csv = tmp_path / "scan-groups.csv"
+    groups_csv.write_text("scan_group\n" + "\n".join(GROUPS) + "\n", encoding="utf-8")
+    sent = []
+
+    class FakeResponse:
+        choices = [type("Choice", (), {"message": type("Message", (), {"content": json.dumps({"proposed_matches": []})})})]
+        usage = type("Usage", (), {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12})
+
+    def fake_completion(client, retry_policy=None, **request):
+        sent.append(request["messages"][0]["content"])
+        return FakeResponse()
+
+    monkeypatch.setattr(scan_group_mapper, "get_client", lambda api_key: object())
+    monkeypatch.setattr(scan_group_mapper, "create_chat_completion", fake_completion)
+    monkeypatch.setattr(scan_group_mapper, "get_scan_group_retriever",
+                        lambda path: ScanGroupRetriever(GROUPS, bag_of_words, top_k=1, min_similarity=0.1))
+
+    scan_group_mapper.align_scan_texts(["parcel was damaged"], str(groups_csv), str(prompt_file), batch_size=25)
+    assert sent == ["Groups: - Parcel damaged"]
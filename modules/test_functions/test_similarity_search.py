@@ -0,0 +1,38 @@
+import sys
+import os
+import numpy as np
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules.embeddings import normalise_rows
+from modules.similarity_search import nearest_neighbours
+
+def brute_force(queries, corpus):
+    return normalise_rows(queries) @ normalise_rows(corpus).T
+
+def test_threshold_neighbours_match_the_pairwise_loop():
+    vectors = np.random.default_rng(0).normal(size=(50, 8))
+    similarities = brute_force(vectors, vectors)
+    neighbours = nearest_neighbours(vectors, threshold=0.5, block_size=7)
+    for i in range(len(vectors)):
+        expected = [j for j in range(len(vectors)) if i != j and similarities[i, j] >= 0.5]
+        indices, scores = neighbours.row(i)
+        assert indices.tolist() == expected
+        assert np.allclose(scores, similarities[i, expected], atol=1e-5)
+
+def test_top_k_against_a_corpus_is_sorted_best_first():
+    rng = np.random.default_rng(1)
+    queries, corpus = rng.normal(size=(20, 8)), rng.normal(size=(30, 8))
+    neighbours = nearest_neighbours(queries, corpus, k=3, block_size=6)
+    expected = np.argsort(-brute_force(queries, corpus), axis=1)[:, :3]
+    assert (neighbours.indices.reshape(-1, 3) == expected).all()
+    assert (neighbours.best()[0] == expected[:, 0]).all()
+
+def test_top_k_with_threshold_and_self_search():
+    vectors = np.array([[1, 0], [0.99, 0.1], [0, 1], [0.1, 0.99], [-1, 0]])
+    neighbours = nearest_neighbours(vectors, k=2, threshold=0.9)
+    assert neighbours.counts().tolist() == [1, 1, 1, 1, 0]
+    assert neighbours.row(0)[0].tolist() == [1] and neighbours.row(2)[0].tolist() == [3]
+    index, score = neighbours.best()
+    assert index[4] == -1 and np.isnan(score[4])
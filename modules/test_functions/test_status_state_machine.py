@@ -0,0 +1,117 @@
+import sys
+import os
+import json
+import pandas as pd
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import prediction_processor, scan_group_mapper
+from modules.scan_group_mapper import ScanGroupCache, map_scan_texts
+from modules.status_state_machine import StatusStateMachine, TwoStageResolver, order_scan_entries
+
+MACHINE = StatusStateMachine(
+    progress={"1": "Manifested", "3": "InTransit", "4": "Delivered", "6": "BeingReturned", "7": "Returned"},
+    final_status={"12": "Collection Failed - No Info"},
+    group_progress={"Shipment manifested": "1", "Collection failed": "1", "In Transit": "3", "Delivered": "4",
+                    "Returned to sender": "7"},
+    group_final_status={"Collection failed": "12"},
+    group_tags={"Shipment manifested": [], "Collection failed": [], "In Transit": [], "Delivered": [],
+                "Returned to sender": [], "Transit delay": ["transit_delay"], "Shipment to be returned": ["will_be_returned"],
+                "Delivered damaged": ["damage"]},
+    tag_progress={"will_be_returned": "6"},
+    unresolved_tags=["damage"],
+)
+
+
+def test_state_machine_transitions():
+    assert MACHINE.resolve(["Shipment manifested", "In Transit", "Transit delay", "Delivered"]) == ("Delivered", None)
+    assert MACHINE.resolve(["In Transit", "Shipment to be returned", "In Transit"]) == ("BeingReturned", None)
+    assert MACHINE.resolve(["Shipment to be returned", "Returned to sender"]) == ("Returned", None)
+    assert MACHINE.resolve(["Shipment manifested", "Collection failed"]) == ("Manifested", "Collection Failed - No Info")
+    assert MACHINE.resolve(["Delivered", "In Transit"]) is None  # ✅ Contradicts a terminal status
+    assert MACHINE.resolve(["In Transit", "Delivered damaged"]) is None  # ✅ Action required
+    assert MACHINE.resolve(["In Transit", "new__Parcel teleported"]) is None  # ✅ Unknown group
+    assert MACHINE.resolve(["Transit delay"]) is None  # ✅ Never reached a progress state
+
+
+def test_scan_entries_are_ordered_oldest_first():
+    newest_first = "(2024-09-02T10:00:00) Delivered,(2024-09-02T10:00:00) Out for delivery,(2024-09-01T10:00:00) In transit"
+    assert [scan for _, scan in order_scan_entries(newest_first)] == ["In transit", "Out for delivery", "Delivered"]
+    assert order_scan_entries("Delivered") is None
+
+
+def test_each_scan_text_is_aligned_once(tmp_path, monkeypatch):
+    groups_csv = tmp_path / "scan-groups.csv"
+    pd.DataFrame({"scan_group": ["In Transit", "Delivered"], "tags": ["", ""]}).to_csv(groups_csv, index=False)
+    aligned = []
+
+    def fake_align(scan_texts, *args, **kwargs):
+        aligned.extend(scan_texts)
+        return {text: "Delivered" for text in scan_texts}, 100
+
+    monkeypatch.setattr(scan_group_mapper, "align_scan_texts", fake_align)
+    cache = ScanGroupCache(str(tmp_path / "scan_groups.sqlite"))
+
+    first = map_scan_texts(["In  transit", "Parcel handed to resident", "Parcel handed to resident"], str(groups_csv),
+                           cache=cache)
+    assert first == {"in transit": "In Transit", "parcel handed to resident": "Delivered"}
+    assert aligned == ["parcel handed to resident"]  # ✅ Exact scan group names skip the model
+
+    assert map_scan_texts(["Parcel handed to resident"], str(groups_csv), cache=cache) == {
+        "parcel handed to resident": "Delivered"}
+    assert len(aligned) == 1  # ✅ Second time round it comes from the cache
+    cache.close()
+
+
+def test_unclear_answers_are_not_cached(tmp_path, monkeypatch):
+    groups_csv = tmp_path / "scan-groups.csv"
+    pd.DataFrame({"scan_group": ["Delivered"], "tags": [""]}).to_csv(groups_csv, index=False)
+    answers = iter([{"scan a": "not_clear", "scan b": "unclear__['Delivered', 'Held']"},
+                    {"scan a": "Delivered", "scan b": "Delivered"}])
+    aligned = []
+
+    def fake_align(scan_texts, *args, **kwargs):
+        aligned.append(list(scan_texts))
+        return next(answers), 100
+
+    monkeypatch.setattr(scan_group_mapper, "align_scan_texts", fake_align)
+    cache = ScanGroupCache(str(tmp_path / "scan_groups.sqlite"))
+
+    assert map_scan_texts(["Scan A", "Scan B"], str(groups_csv), cache=cache)["scan a"] == "not_clear"
+    assert map_scan_texts(["Scan A", "Scan B"], str(groups_csv), cache=cache) == {"scan a": "Delivered", "scan b": "Delivered"}
+    assert aligned == [["scan a", "scan b"], ["scan a", "scan b"]]  # ✅ Asked again the second time
+    cache.close()
+
+
+def test_two_stage_mode_only_sends_unresolved_rows(run_process_csv, monkeypatch):
+    df = pd.DataFrame({
+        "Tracking_Number": ["TN0", "TN1", "TN2"],
+        "Scans": ["(2024-09-01T10:00:00) Shipment manifested,(2024-09-02T10:00:00) Parcel handed to resident",
+                  "(2024-09-01T10:00:00) In Transit,(2024-09-02T10:00:00) Parcel teleported",
+                  "(2024-09-01T10:00:00) In Transit"],
+    })
+
+    class FakeResolver(TwoStageResolver):  # ✅ Stage 1 without the scan group cache or the model
+        def prepare(self, values):
+            self.scan_groups = {"shipment manifested": "Shipment manifested", "in transit": "In Transit",
+                                "parcel handed to resident": "Delivered", "parcel teleported": "new__Teleported"}
+
+        def plan(self, values):
+            return 0, 0, 0
+
+    sent = []
+
+    def fake_response(prompt_messages):
+        sent.append(prompt_messages[1]["content"])
+        return "In Transit", 10, 2
+
+    monkeypatch.setattr(prediction_processor, "load_two_stage_resolver", lambda: FakeResolver(MACHINE))
+    monkeypatch.setattr(prediction_processor.SystemSettings, "rule_audit_rate", 0)
+    monkeypatch.setattr(prediction_processor.SystemSettings, "two_stage_fallback_mode", "sync")
+
+    predictions = run_process_csv(df, fake_response, mode="two_stage")
+
+    assert len(sent) == 1 and "teleported" in sent[0]
+    assert [json.loads(p["Predicted_Status"])["status"] if p["Model_Tier"] == "state_machine" else p["Predicted_Status"]
+            for p in predictions] == ["Delivered", "In Transit", "InTransit"]
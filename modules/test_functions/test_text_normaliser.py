@@ -0,0 +1,42 @@
+import sys
+import os
+import random
+import pandas as pd
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules.text_normaliser import (
+    SMART_PUNCTUATION_REPLACEMENTS, normalize_smart_punctuation_reference, normalise_text, normalise_texts
+)
+
+# ✅ Replacement keys and their pieces, control/format/private/unassigned characters, NFKC-affected
+# characters (ligatures, full-width, superscripts, combining marks) and plain scan text
+FRAGMENTS = list(SMART_PUNCTUATION_REPLACEMENTS) + [ch for key in SMART_PUNCTUATION_REPLACEMENTS for ch in key] + [
+    "\x00", "\t", "\n", "\r", "\x1f", "\x7f", "\x85", "‎", "﻿", "", "\U000f0000", "͸", "\ud800",
+    " ", "　", " ", "  ", "ﬁ", "Ｆｅｄｅｘ", "²", "é", "́", "Å", "ß", "Ω", "©", "¼",
+    "Delivered", "Parcel", "in transit", "-", "'", '"', "...", "é", "ü", "a",
+]
+
+
+def random_text(rng):
+    return "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 12)))
+
+
+def test_matches_reference_byte_for_byte():
+    rng = random.Random(19)
+    texts = [random_text(rng) for _ in range(5000)] + list(SMART_PUNCTUATION_REPLACEMENTS) + ["", "  ", "Ã​©"]
+    for text in texts:
+        assert normalise_text(text).encode("utf-8", "surrogatepass") == \
+            normalize_smart_punctuation_reference(text).encode("utf-8", "surrogatepass"), repr(text)
+
+
+def test_batch_matches_scalar_and_keeps_missing_values():
+    rng = random.Random(7)
+    texts = [random_text(rng) for _ in range(500)] * 3
+    series = pd.Series(texts + [None], index=range(100, 100 + len(texts) + 1))
+
+    result = normalise_texts(series)
+    assert result.index.equals(series.index) and pd.isna(result.iloc[-1])
+    assert result.iloc[:-1].tolist() == [normalize_smart_punctuation_reference(text) for text in texts]
+    assert normalise_texts(["  “Delivered”\x00 ", None]) == ['"Delivered"', None]
@@ -0,0 +1,104 @@
+import sys
+import os
+import json
+
+# ✅ Add project root to `sys.path` so Python can find `modules/`
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from modules import token_packer
+from modules.token_packer import pack_items, pack_shipments, map_responses_by_id, completion_tokens_for
+from modules.prompt_generator import load_prompt_from_json
+from modules.model_cascade import DEFAULT_PROMPT_FILE
+
+
+def test_packs_respect_prompt_budget_and_cover_every_item():
+    item_tokens = [400, 300, 300, 200, 100, 100, 50]
+    packs = pack_items(item_tokens, prompt_budget=700, completion_budget=10_000, completion_per_item=10,
+                       fixed_prompt_tokens=200)
+
+    assert sorted(i for pack in packs for i in pack) == list(range(len(item_tokens)))
+    assert all(sum(item_tokens[i] for i in pack) <= 500 for pack in packs)
+    assert len(packs) == 3  # ✅ 1450 tokens into 500-token bins
+
+
+def test_completion_budget_caps_items_per_request():
+    packs = pack_items([1] * 10, prompt_budget=10_000, completion_budget=120, completion_per_item=40)
+    assert [len(pack) for pack in packs] == [3, 3, 3, 1]
+
+
+def test_oversized_item_gets_its_own_request():
+    packs = pack_items([50, 5000, 50], prompt_budget=1000, completion_budget=1000, completion_per_item=10)
+    assert [1] in packs and len(packs) == 2
+
+
+def test_pack_shipments_uses_token_counts(monkeypatch):
+    monkeypatch.setattr(token_packer, "count_tokens", lambda text, model: len(text.split()))
+    shipments = [
+        {"tracking_number": f"T{i}", "scans": [{"timestamp": "t", "scan": "word " * (i + 1)}]} for i in range(6)
+    ]
+    packs = pack_shipments(shipments, "gpt-4o-mini", system_prompt_tokens=0, prompt_budget=40)
+    assert sorted(s["tracking_number"] for pack in packs for s in pack) == [f"T{i}" for i in range(6)]
+    assert len(packs) > 1
+
+
+def test_pack_shipments_caps_shipments_per_request(monkeypatch):
+    monkeypatch.setattr(token_packer, "count_tokens", lambda text, model: 1)
+    monkeypatch.setattr(token_packer.SystemSettings, "max_shipments_per_request", 50)
+    shipments = [{"tracking_number": f"T{i}", "scans": []} for i in range(120)]
+
+    packs = pack_shipments(shipments, "gpt-4o-mini", system_prompt_tokens=0)
+
+    assert [len(pack) for pack in packs] == [50, 50, 20]  # ✅ Not one 120-shipment request under the 16k budget
+
+
+def test_max_tokens_follow_the_packed_count():
+    assert completion_tokens_for(10, "gpt-4o-mini", 40) == token_packer.COMPLETION_TOKENS_PER_REQUEST + 10 * 40
+    assert completion_tokens_for(1000, "gpt-4o-mini") == token_packer.get_token_budget("gpt-4o-mini")["completion"]
+
+
+def test_answer_budget_covers_each_response_mode():
+    for mode, answer in token_packer.ANSWER_EXAMPLES.items():
+        measured = token_packer.estimate_tokens(json.dumps(answer, indent=4), "gpt-4o-mini")
+        assert token_packer.completion_tokens_per_shipment("gpt-4o-mini", mode) > measured
+    assert (token_packer.completion_tokens_per_shipment("gpt-4o-mini", "labels")
+            > token_packer.completion_tokens_per_shipment("gpt-4o-mini", "codes"))
+
+    # ✅ A pack filled to the shipment cap still gets room for every answer
+    per_shipment = token_packer.completion_tokens_per_shipment("gpt-4o-mini", "labels")
+    assert completion_tokens_for(100, "gpt-4o-mini", per_shipment) >= token_packer.COMPLETION_TOKENS_PER_REQUEST + 100 * per_shipment
+
+
+def test_responses_map_back_by_id_not_position():
+    shipments = [{"tracking_number": "A"}, {"tracking_number": "B"}, {"shipment_id": 7}]
+    responses = [{"tracking_number": "B", "progress": 4}, {"shipment_id": "7", "progress": 3}, "garbage"]
+
+    matched, missing = map_responses_by_id(shipments, responses)
+
+    assert [(s.get("tracking_number", s.get("shipment_id")), r["progress"]) for s, r in matched] == [("B", 4), (7, 3)]
+    assert missing == [{"tracking_number": "A"}]
+
+
+def test_answers_to_the_labels_prompt_map_back_by_tracking_number():
+    # ✅ Fill the prompt's own "strictly formatted" answer block, one entry per shipment in reverse order
+    prompt = load_prompt_from_json(DEFAULT_PROMPT_FILE)
+    template = prompt.split("strictly formatted as follows:")[1].split("Ensure strict JSON")[0]
+    template = template.replace("<Integer>", "0")
+    shipments = [{"tracking_number": "T1"}, {"tracking_number": "T2"}]
+    entry = json.loads(template)["shipments"][0]
+    answers = [{**entry, "tracking_number": s["tracking_number"], "shipmentStatus": f"status of {s['tracking_number']}"}
+               for s in reversed(shipments)]
+    assert "tracking_number" in entry
+
+    matched, missing = map_responses_by_id(shipments, answers)
+
+    assert [(s["tracking_number"], r["shipmentStatus"]) for s, r in matched] == [("T1", "status of T1"), ("T2", "status of T2")]
+    assert missing == []
+
+
+def test_answers_without_ids_fall_back_to_position():
+    shipments = [{"tracking_number": "A"}, {"tracking_number": "B"}]
+    matched, missing = map_responses_by_id(shipments, [{"shipmentStatus": "Delivered"}, {"shipmentStatus": "InTransit"}])
+    assert [(s["tracking_number"], r["shipmentStatus"]) for s, r in matched] == [("A", "Delivered"), ("B", "InTransit")]
+
+    matched, missing = map_responses_by_id(shipments, [{"shipmentStatus": "Delivered"}])
+    assert matched == [] and missing == shipments  # ✅ Counts differ: position says nothing
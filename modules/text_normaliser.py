@@ -0,0 +1,107 @@
+import re
+import sys
+import unicodedata
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # ✅ Arrow string arrays are optional (`pip install pyarrow`)
+    pa = None
+
+# ✅ Applied in this order by the original `normalize_smart_punctuation`
+SMART_PUNCTUATION_REPLACEMENTS = {
+    # Quotes
+    "“": '"', "”": '"', "‘": "'", "’": "'",
+    # Dashes and ellipsis
+    "–": "-", "—": "-", "…": "...",
+    # Windows encoding artifacts
+    "Â–": "-", "â€“": "-", "â€”": "-", "â€•": "-", "â€”": "-",
+    "Ã©": "é", "Ã¼": "ü", "Ã": "a",
+    # Odd invisible characters
+    "\u0096": "-", "\u0092": "'", "\u0093": '"', "\u0094": '"',
+    "\xa0": " ", "\u00a0": " ",
+    "\u2026": "...", "\u200b": "",  # ellipsis, zero-width space
+}
+
+def normalize_smart_punctuation_reference(text: str) -> str:
+    """
+    The original replace-loop implementation, kept as the reference `normalise_text` must match
+    byte for byte (see test_text_normaliser.py and scripts/normaliser_benchmark.py).
+    """
+    for bad, good in SMART_PUNCTUATION_REPLACEMENTS.items():
+        text = text.replace(bad, good)
+    text = unicodedata.normalize("NFKC", text)
+    text = ''.join(ch for ch in text if unicodedata.category(ch)[0] != "C")
+    return text.strip()
+
+def compile_replacements(replacements):
+    """
+    Turn an ordered replace table into (multi-character pattern, {key: value}, single-character translate table).
+
+    A key containing an earlier key can never match after that earlier replacement ran
+    ("Â–" once "–" became "-"), so it is dropped. The remaining multi-character keys are
+    replaced first, longest first, then single characters through `str.translate`.
+    """
+    live = {}
+    for bad, good in replacements.items():
+        if not any(earlier in bad for earlier in live):
+            live[bad] = good
+    multi = {bad: good for bad, good in live.items() if len(bad) > 1}
+    pattern = re.compile("|".join(re.escape(bad) for bad in sorted(multi, key=len, reverse=True))) if multi else None
+    singles = str.maketrans({bad: good for bad, good in live.items() if len(bad) == 1})
+    return pattern, multi, singles
+
+MULTI_PATTERN, MULTI_REPLACEMENTS, SINGLE_TABLE = compile_replacements(SMART_PUNCTUATION_REPLACEMENTS)
+ASCII_CONTROL_TABLE = str.maketrans("", "", "".join(map(chr, range(32))) + "\x7f")  # ✅ The ASCII "C" category
+
+@lru_cache(maxsize=None)
+def control_pattern():
+    """One character class matching every code point in Unicode category "C" (built once, on first use)."""
+    ranges, start = [], None
+    for code in range(sys.maxunicode + 2):
+        is_control = code <= sys.maxunicode and unicodedata.category(chr(code))[0] == "C"
+        if is_control and start is None:
+            start = code
+        elif not is_control and start is not None:
+            ranges.append(re.escape(chr(start)) if start == code - 1 else f"{re.escape(chr(start))}-{re.escape(chr(code - 1))}")
+            start = None
+    return re.compile(f"[{''.join(ranges)}]+")
+
+def normalise_text(text: str) -> str:
+    """
+    Single-pass equivalent of `normalize_smart_punctuation_reference`.
+
+    ASCII text only needs its control characters removed; anything else gets one regex pass
+    for multi-character artifacts, one `str.translate`, NFKC and one regex pass for "C" characters.
+    """
+    if text.isascii():
+        return (text if text.isprintable() else text.translate(ASCII_CONTROL_TABLE)).strip()
+    if MULTI_PATTERN is not None:
+        text = MULTI_PATTERN.sub(lambda match: MULTI_REPLACEMENTS[match.group()], text)
+    text = unicodedata.normalize("NFKC", text.translate(SINGLE_TABLE))
+    return control_pattern().sub("", text).strip()
+
+def normalise_texts(values):
+    """
+    `normalise_text` over a pandas Series, list or Arrow string array.
+
+    Each distinct value is normalised once and the results are broadcast back, so
+    repetitive scan texts cost one pass per unique string. Missing values stay missing.
+
+    Returns:
+        Same kind as the input: Series (same index), list, or Arrow array.
+    """
+    is_arrow = pa is not None and isinstance(values, (pa.Array, pa.ChunkedArray))
+    series = values.to_pandas() if is_arrow else values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    normalised = np.array([normalise_text(str(value)) for value in uniques], dtype=object)
+    result = series.astype(object)  # ✅ A copy that keeps missing values as they were
+    present = codes >= 0
+    result[present] = normalised[codes[present]]
+
+    if is_arrow:
+        return pa.array(result, type=pa.string())
+    return result if isinstance(values, pd.Series) else result.tolist()
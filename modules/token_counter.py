@@ -1,9 +1,69 @@
+import os
+import json
+from functools import lru_cache
+import pandas as pd
 import tiktoken
+from modules.logging_utils import logger
+
+TOKENS_PER_MESSAGE = 3  # ✅ Chat format overhead per message (role + separators)
+TOKENS_PER_REPLY = 3  # ✅ Every reply is primed with assistant tokens
+
+@lru_cache(maxsize=None)
+def get_encoding(model="gpt-4-turbo"):
+    """Return (and cache) the tiktoken encoding for a model, falling back to `o200k_base` for unknown names."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
 
 def count_tokens(text, model="gpt-4-turbo"):
     """Counts tokens in a given text using OpenAI tokenizer."""
-    tokenizer = tiktoken.encoding_for_model(model)
-    return len(tokenizer.encode(text))
+    return len(get_encoding(model).encode(text))
+
+@lru_cache(maxsize=None)
+def get_optional_encoding(model="gpt-4o-mini"):
+    """`get_encoding`, or None (logged once) if the tokenizer cannot be loaded, e.g. offline."""
+    try:
+        return get_encoding(model)
+    except Exception as e:
+        logger.warning(f"⚠️ Tokenizer unavailable for {model}, estimating tokens from length: {e}")
+        return None
+
+def estimate_tokens(text, model="gpt-4o-mini"):
+    """`count_tokens`, falling back to ~4 characters per token if the tokenizer cannot be loaded."""
+    encoding = get_optional_encoding(model)
+    return len(encoding.encode(text)) if encoding else len(text) // 4 + 1
+
+def count_tokens_batch(texts, model="gpt-4o-mini", num_threads=None):
+    """
+    Token counts for many texts at once with tiktoken's multi-threaded `encode_batch`.
+
+    Falls back to a vectorised ~4 characters-per-token estimate if the tokenizer cannot be loaded.
+
+    Returns:
+        list[int]: One count per text, in order.
+    """
+    texts = [str(text) for text in texts]
+    encoding = get_optional_encoding(model)
+    if encoding is None:
+        return (pd.Series(texts, dtype=object).str.len() // 4 + 1).astype(int).tolist()
+    return [len(tokens) for tokens in encoding.encode_batch(texts, num_threads=num_threads or os.cpu_count() or 1)]
+
+def count_message_tokens(messages, model="gpt-4o-mini"):
+    """
+    Estimate prompt tokens for a list of chat messages.
+
+    Falls back to a ~4 characters-per-token heuristic if the tokenizer cannot be loaded,
+    so pacing/estimates never block a run.
+    """
+    encoding = get_optional_encoding(model)  # ✅ Cached, so an offline run warns once, not per row
+    num_tokens = TOKENS_PER_REPLY
+    for message in messages:
+        num_tokens += TOKENS_PER_MESSAGE
+        for value in message.values():
+            text = value if isinstance(value, str) else json.dumps(value)
+            num_tokens += len(encoding.encode(text)) if encoding else len(text) // 4 + 1
+    return num_tokens
 
 if __name__ == "__main__":
     test_text = "This is a test sentence to check token counting accuracy."
@@ -0,0 +1,156 @@
+import json
+from functools import lru_cache
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+from modules.token_counter import count_tokens, estimate_tokens
+from modules.prompt_generator import format_shipments
+from modules.payload_encoders import resolve_payload_format
+
+# ✅ Per-request prompt/completion budgets, kept well under each model's context and output limits
+MODEL_TOKEN_BUDGETS = {
+    "gpt-4o-mini": {"prompt": 100000, "completion": 16000},
+    "gpt-4o": {"prompt": 100000, "completion": 16000},
+    "gpt-4-turbo": {"prompt": 100000, "completion": 4096},
+    "gpt-4": {"prompt": 6000, "completion": 2000},
+    "gpt-3.5-turbo": {"prompt": 12000, "completion": 4096},
+}
+FALLBACK_TOKEN_BUDGET = {"prompt": 12000, "completion": 4096}
+# ✅ Longest-case answer per shipment in each response mode, as the prompts ask for it
+ANSWER_EXAMPLES = {
+    "labels": {"tracking_number": "JD014600003947601234", "shipmentStatus": "BeingReturned", "CollectionStatus": 14,
+               "CollectionAttemptCount": 3, "CollectionSchedulingStatus": "RescheduledNoDate"},
+    "codes": {"tracking_number": "JD014600003947601234", "p": "10", "s": "12"},
+}
+ANSWER_HEADROOM = 1.5  # ✅ Margin over the measured answer, so a full pack is never cut off mid-JSON
+COMPLETION_TOKENS_PER_REQUEST = 20  # ✅ The {"shipments": [...]} wrapper around the answers
+
+def get_token_budget(model):
+    """Resolve the prompt/completion budget for a model: settings override first, then the longest matching prefix."""
+    overrides = SystemSettings.token_budgets or {}
+    if model in overrides:
+        return {**FALLBACK_TOKEN_BUDGET, **overrides[model]}
+
+    for prefix in sorted(MODEL_TOKEN_BUDGETS, key=len, reverse=True):
+        if model.startswith(prefix):
+            return MODEL_TOKEN_BUDGETS[prefix]
+    return FALLBACK_TOKEN_BUDGET
+
+@lru_cache(maxsize=None)
+def _answer_tokens(model, mode):
+    answer = json.dumps(ANSWER_EXAMPLES.get(mode, ANSWER_EXAMPLES["labels"]), indent=4)
+    return int(estimate_tokens(answer, model) * ANSWER_HEADROOM)
+
+def completion_tokens_per_shipment(model, mode=None):
+    """Expected completion tokens per shipment answer for `mode` (default: `response_mode`), with headroom."""
+    return _answer_tokens(model, mode or SystemSettings.response_mode)
+
+def completion_tokens_for(shipment_count, model, completion_per_shipment=None):
+    """`max_tokens` for a request of `shipment_count` shipments, capped at the model's completion budget."""
+    completion_per_shipment = completion_per_shipment or completion_tokens_per_shipment(model)
+    needed = COMPLETION_TOKENS_PER_REQUEST + shipment_count * completion_per_shipment
+    return min(needed, get_token_budget(model)["completion"])
+
+def pack_items(item_tokens, prompt_budget, completion_budget, completion_per_item, fixed_prompt_tokens=0,
+               max_items=None):
+    """
+    First-fit-decreasing bin packing of items into requests.
+
+    Each request holds items whose prompt tokens fit into `prompt_budget - fixed_prompt_tokens`
+    and whose expected answers fit into `completion_budget`. Items too big for any request get
+    a request of their own.
+
+    Args:
+        item_tokens (list[int]): Prompt tokens per item.
+        prompt_budget (int): Max prompt tokens per request (including the fixed system prompt).
+        completion_budget (int): Max completion tokens per request.
+        completion_per_item (int | list[int]): Expected completion tokens per item (or one value for all).
+        fixed_prompt_tokens (int): Tokens sent once per request (system prompt, wrappers).
+        max_items (int): Optional cap on items per request.
+
+    Returns:
+        list[list[int]]: Item indices per request; each request keeps the items' input order.
+    """
+    capacity = prompt_budget - fixed_prompt_tokens
+    if isinstance(completion_per_item, int):
+        completion_per_item = [completion_per_item] * len(item_tokens)
+    if capacity <= 0:
+        logger.warning("⚠️ System prompt alone exceeds the prompt budget. Sending one item per request.")
+        return [[i] for i in range(len(item_tokens))]
+
+    bins = []  # ✅ [remaining_capacity, remaining_completion, [indices]]
+    for index in sorted(range(len(item_tokens)), key=lambda i: item_tokens[i], reverse=True):
+        tokens, completion = item_tokens[index], completion_per_item[index]
+        for bin_ in bins:
+            if tokens <= bin_[0] and completion <= bin_[1] and (max_items is None or len(bin_[2]) < max_items):
+                bin_[0] -= tokens
+                bin_[1] -= completion
+                bin_[2].append(index)
+                break
+        else:
+            if tokens > capacity:
+                logger.warning(f"⚠️ Item {index} needs {tokens} tokens, over the {capacity} budget. Sending it alone.")
+            bins.append([capacity - tokens, completion_budget - completion, [index]])
+
+    return [sorted(indices) for _, _, indices in bins]
+
+def pack_shipments(shipments, model, system_prompt_tokens, completion_per_shipment=None,
+                   prompt_budget=None, completion_budget=None, payload_format=None, max_shipments=None):
+    """
+    Split shipments into multi-shipment requests that fill the model's token budget.
+
+    Each shipment's scan history is measured with tiktoken in the same format `generate_prompt` sends
+    (`payload_format`, default: the one configured for `model`). Budgets default to `get_token_budget(model)`;
+    requests hold at most `max_shipments` (default: `max_shipments_per_request`), since a large
+    completion budget alone would allow hundreds of answers per call. Answers are budgeted at
+    `completion_tokens_per_shipment(model)` unless `completion_per_shipment` is given.
+
+    Returns:
+        list[list[dict]]: Shipments per request.
+    """
+    budget = get_token_budget(model)
+    prompt_budget = prompt_budget or budget["prompt"]
+    completion_budget = (completion_budget or budget["completion"]) - COMPLETION_TOKENS_PER_REQUEST
+    completion_per_shipment = completion_per_shipment or completion_tokens_per_shipment(model)
+
+    payload_format = payload_format or resolve_payload_format(model)
+    item_tokens = [count_tokens(format_shipments([shipment], payload_format), model) for shipment in shipments]
+    packs = pack_items(item_tokens, prompt_budget, completion_budget, completion_per_shipment, system_prompt_tokens,
+                       max_shipments or SystemSettings.max_shipments_per_request)
+
+    for number, pack in enumerate(packs, start=1):
+        logger.info(f"📦 Pack {number}: {len(pack)} shipments, "
+                    f"{system_prompt_tokens + sum(item_tokens[i] for i in pack)} prompt tokens")
+    return [[shipments[i] for i in pack] for pack in packs]
+
+def map_responses_by_id(shipments, responses, id_keys=("tracking_number", "shipment_id")):
+    """
+    Match AI responses back to shipments by ID rather than by position.
+
+    If no response carries an ID but there is exactly one per shipment, they are matched by position.
+
+    Returns:
+        tuple: ([(shipment, response), ...], [shipments with no response])
+    """
+    responses = [response for response in responses or [] if isinstance(response, dict)]
+    by_id = {}
+    for response in responses:
+        for key in id_keys:
+            if response.get(key) is not None:
+                by_id[str(response[key])] = response
+                break
+
+    if not by_id and responses and len(responses) == len(shipments):
+        logger.warning("⚠️ Answers carry no shipment IDs; matching them by position.")
+        return list(zip(shipments, responses)), []
+
+    matched, missing = [], []
+    for shipment in shipments:
+        response = next(
+            (by_id[str(shipment[key])] for key in id_keys if shipment.get(key) is not None and str(shipment[key]) in by_id),
+            None
+        )
+        if response is None:
+            missing.append(shipment)
+        else:
+            matched.append((shipment, response))
+    return matched, missing
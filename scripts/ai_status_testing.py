@@ -1,10 +1,10 @@
-import openai
 import pandas as pd
 import json
 import os
 import logging
 from datetime import datetime
 from dotenv import load_dotenv
+from modules.openai_client import get_client
 
 # Load environment variables
 load_dotenv()
@@ -22,7 +22,7 @@ if not api_key:
     logging.error("ERROR: OPENAI_API_KEY not found in environment variables.")
     raise ValueError("ERROR: OPENAI_API_KEY not found in environment variables.")
 
-client = openai.OpenAI(api_key=api_key)
+client = get_client(api_key)  # ✅ Pooled keep-alive client shared with the rest of the pipeline
 logging.info(f"Using API Key: {api_key[:10]}********")  # Mask API Key just so we can see what one is being used, sometimes the old key will remain in an environment. 
 
 def load_json(file_path):
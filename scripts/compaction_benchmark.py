@@ -0,0 +1,76 @@
+import sys
+import os
+import argparse
+import pandas as pd
+
+# ✅ Ensure Python finds the 'modules' directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from modules.logging_utils import logger
+from modules.system_settings import SystemSettings
+from modules.scan_compaction import COMPACTION_LEVELS, compact_scan_history, add_compaction_notes
+from modules.token_counter import count_tokens_batch, get_optional_encoding
+from modules.prediction_processor import prepare_scan_history
+from modules.prompt_generator import generate_prompt
+from modules.ai_model import get_openai_response
+from modules.model_cascade import normalise_label, extract_label
+
+parser = argparse.ArgumentParser(description="Measure prompt tokens (and optionally accuracy) per scan compaction level.")
+parser.add_argument("--input", default=os.path.join("data", "test", "Test_dataset.csv"), help="Golden set CSV.")
+parser.add_argument("--column", default="Scans", help="Scan history column.")
+parser.add_argument("--label-column", default="Status", help="Expected status column (comma-separated if several).")
+parser.add_argument("--levels", type=int, nargs="+", default=sorted(COMPACTION_LEVELS), help="Levels to compare.")
+parser.add_argument("--output", default=os.path.join("output", "compaction_benchmark.csv"), help="Per-row token report.")
+parser.add_argument("--predict", action="store_true", help="Also ask the model at each level (costs API calls).")
+parser.add_argument("--prompt", default=SystemSettings.prompt_file, help="Prompt file used with --predict.")
+parser.add_argument("--limit", type=int, help="Only use the first N rows.")
+args = parser.parse_args()
+
+df = pd.read_csv(args.input).dropna(subset=[args.column])
+if args.limit:
+    df = df.head(args.limit)
+model = SystemSettings.model_name or "gpt-4o-mini"
+
+# ✅ Token figures are only exact with the model's tiktoken encoding; otherwise they are labelled as estimates
+exact = get_optional_encoding(model) is not None
+method = "tiktoken" if exact else "estimate (~4 characters per token, tokenizer unavailable)"
+if not exact:
+    logger.warning(f"⚠️ No tiktoken encoding for {model}: token figures below are ESTIMATES.")
+
+# ✅ Step 1: Tokens before/after for every row and level
+raw_texts = [str(value).strip() for value in df[args.column]]
+report = pd.DataFrame({args.column: df[args.column].values, "Token_Count_Method": method})
+report["Tokens_Raw"] = count_tokens_batch(raw_texts, model)
+for level in args.levels:
+    report[f"Tokens_L{level}"] = count_tokens_batch([compact_scan_history(text, level) for text in raw_texts], model)
+
+os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+report.to_csv(args.output, index=False)
+logger.info(f"📂 Per-row token report saved to {args.output}")
+
+raw = report["Tokens_Raw"].sum()
+print(f"\nToken counts: {method}")
+print(f"\n{'Level':<7}{'Tokens' if exact else 'Est. tokens':>12}{'Saved':>9}  Description")
+for level in args.levels:
+    total = report[f"Tokens_L{level}"].sum()
+    print(f"{level:<7}{total:>12}{(raw - total) / raw:>9.1%}  {COMPACTION_LEVELS.get(level, '')}")
+
+# ✅ Step 2 (optional): Accuracy per level, and agreement with the uncompacted answers
+if args.predict:
+    expected = [{normalise_label(label) for label in str(value).split(",")} for value in df[args.label_column]]
+    answers = {}
+    for level in args.levels:
+        answers[level] = []
+        for value in df[args.column]:
+            prompt_messages = generate_prompt(prepare_scan_history(value, level), args.prompt)
+            if prompt_messages:
+                prompt_messages = add_compaction_notes(prompt_messages, level)
+            answer = get_openai_response(prompt_messages)[0] if prompt_messages else ""
+            answers[level].append(normalise_label(extract_label(answer)))
+
+    baseline = answers.get(0, answers[args.levels[0]])
+    print(f"\n{'Level':<7}{'Accuracy':>10}{'Agrees w/ raw':>15}")
+    for level in args.levels:
+        accuracy = sum(answer in labels for answer, labels in zip(answers[level], expected)) / len(expected)
+        agreement = sum(a == b for a, b in zip(answers[level], baseline)) / len(baseline)
+        print(f"{level:<7}{accuracy:>10.1%}{agreement:>15.1%}")
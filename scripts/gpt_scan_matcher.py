@@ -1,12 +1,15 @@
 import os
 import json
-import time
-import openai
 import pandas as pd
 from tqdm import tqdm
 from datetime import datetime
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer, util
+from modules.ai_model import create_chat_completion
+from modules.openai_client import get_client
+from modules.retry_policy import get_retry_policy, InvalidResponseError
+from modules.response_cache import get_response_cache
+from modules.similarity_search import nearest_neighbours
+from modules.embedding_store import encode_texts
 
 # ===== CONFIG =====
 excel_path = r"G:\Shared drives\Tech\PVR analysis\Tracking\PVR Scan Configuration\Scan group analysis\scan_group_analysis.csv"
@@ -18,7 +21,6 @@ model_name = "gpt-4o"
 embed_model_name = "all-MiniLM-L6-v2"
 batch_size = 25
 max_retries = 3
-retry_backoff = 3.0
 
 # ===== Load API Key =====
 def load_api_key():
@@ -26,7 +28,7 @@ def load_api_key():
     load_dotenv(dotenv_path=dotenv_path)
     return os.getenv("OPENAI_API_KEY")
 
-openai.api_key = load_api_key()
+client = get_client(load_api_key())
 
 # ===== Progress States =====
 progress_labels = [
@@ -52,21 +54,29 @@ def build_gpt_prompt(scan_batch: list[str]) -> list[dict]:
     ]
 
 # ===== GPT Call =====
+def parse_structured_names(response):
+    """The `structured_names` list of a response; raises so malformed JSON is retried."""
+    parsed = json.loads(response.choices[0].message.content.strip())
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("structured_names", []), list):
+        raise InvalidResponseError("expected {\"structured_names\": [...]}")
+    return parsed.get("structured_names", [])
+
 def get_structured_names(messages):
-    for attempt in range(1, max_retries + 1):
-        try:
-            response = openai.ChatCompletion.create(
-                model=model_name,
-                messages=messages,
-                temperature=0.2,
-                response_format={"type": "json_object"}
-            )
-            content = response.choices[0].message.content.strip()
-            return json.loads(content).get("structured_names", [])
-        except Exception as e:
-            print(f"GPT failed on attempt {attempt}: {e}")
-            if attempt < max_retries:
-                time.sleep(retry_backoff * attempt)
+    try:
+        # ✅ Cached explicitly: re-runs over the same labels reuse earlier names (key includes temperature)
+        response = create_chat_completion(
+            client,
+            use_cache=True,
+            retry_policy=get_retry_policy(max_retries),  # ✅ Shared backoff + circuit breaker
+            validate=parse_structured_names,  # ✅ Parsed inside the retried call; bad JSON is retried, not cached
+            model=model_name,
+            messages=messages,
+            temperature=0.2,
+            response_format={"type": "json_object"}
+        )
+        return parse_structured_names(response)
+    except Exception as e:
+        print(f"GPT failed after retries: {e}")
     return []
 
 # ===== Main Execution =====
@@ -87,13 +97,12 @@ def main():
         all_structured.extend(result if result else ["REVIEW: " + label for label in batch])
 
     df["Structured Name (AI Ready)"] = all_structured
+    get_response_cache().log_stats()
 
     # Embedding model setup
-    print("🔹 Loading embedding model...")
-    model = SentenceTransformer(embed_model_name)
-    sg_embeddings = model.encode(scan_groups, convert_to_tensor=True)
-    struct_embeddings = model.encode(all_structured, convert_to_tensor=True)
-    progress_embeddings = model.encode(progress_labels, convert_to_tensor=True)
+    print("🔹 Embedding structured names (cached in the embedding store)...")
+    struct_embeddings = encode_texts(all_structured, embed_model_name)
+    progress_embeddings = encode_texts(progress_labels, embed_model_name)
 
     # Duplicate detection
     seen = set()
@@ -106,14 +115,9 @@ def main():
             seen.add(name)
     df["Exact Duplicate"] = duplicates
 
-    # Internal similarity
-    similarity_flags = []
-    for i, emb_i in enumerate(struct_embeddings):
-        similar_count = 0
-        for j, emb_j in enumerate(struct_embeddings):
-            if i != j and float(util.cos_sim(emb_i, emb_j)[0]) >= internal_similarity_threshold:
-                similar_count += 1
-        similarity_flags.append("Yes" if similar_count > 0 else "No")
+    # Internal similarity (blockwise matrix products, see `modules.similarity_search`)
+    near_duplicates = nearest_neighbours(struct_embeddings, threshold=internal_similarity_threshold)
+    similarity_flags = ["Yes" if count > 0 else "No" for count in near_duplicates.counts()]
     df["Very Similar to Another Scan Group"] = similarity_flags
 
     # Progress classification
@@ -121,10 +125,8 @@ def main():
     assigned_progress = []
     similarity_scores = []
     vague_flags = []
-    for i, emb in enumerate(struct_embeddings):
-        scores = util.cos_sim(emb, progress_embeddings)[0]
-        best_idx = scores.argmax()
-        best_score = float(scores[best_idx])
+    best_indices, best_scores = nearest_neighbours(struct_embeddings, progress_embeddings, k=1).best()
+    for best_idx, best_score in zip(best_indices, best_scores.tolist()):
         label = progress_labels[best_idx] if best_score >= similarity_threshold else "Uncertain"
         flag = "Yes" if best_score < similarity_threshold else ""
         assigned_progress.append(label)
@@ -0,0 +1,36 @@
+import sys
+import os
+import time
+import argparse
+import pandas as pd
+
+# ✅ Ensure Python finds the 'modules' directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from modules.scan_dedup import parse_scan_history
+from modules.text_normaliser import normalize_smart_punctuation_reference, normalise_text, normalise_texts, control_pattern
+
+parser = argparse.ArgumentParser(description="Time the scan text normaliser against the original replace loop.")
+parser.add_argument("--input", default=os.path.join("data", "test", "Test_dataset.csv"), help="CSV with scan histories.")
+parser.add_argument("--column", default="Scans", help="Scan history column.")
+parser.add_argument("--rows", type=int, default=500000, help="Scan texts to normalise (the input is repeated to fill).")
+args = parser.parse_args()
+
+scans = [scan for value in pd.read_csv(args.input)[args.column].dropna() for _, scan in parse_scan_history(value)]
+texts = (scans * (args.rows // max(1, len(scans)) + 1))[:args.rows]
+control_pattern()  # ✅ One-off table build, not part of the per-text cost
+
+def timed(label, function):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34}{elapsed:>8.3f}s{len(texts) / elapsed:>14,.0f} texts/s")
+    return result, elapsed
+
+print(f"\n🧪 {len(texts):,} scan texts ({len(set(texts)):,} distinct)")
+reference, base = timed("reference (replace loop)", lambda: [normalize_smart_punctuation_reference(t) for t in texts])
+scalar, single = timed("normalise_text (per text)", lambda: [normalise_text(t) for t in texts])
+batch, vectorised = timed("normalise_texts (Series)", lambda: normalise_texts(pd.Series(texts)).tolist())
+
+assert reference == scalar == batch, "normalised output differs from the reference"
+print(f"\n✅ Identical output. Speed-up: {base / single:.1f}x per text, {base / vectorised:.1f}x batched.")
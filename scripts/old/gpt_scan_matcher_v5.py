@@ -5,13 +5,18 @@ import pandas as pd
 from tqdm import tqdm
 from dotenv import load_dotenv
 from datetime import datetime
-import time
-from openai import OpenAI
 
 from modules.file_handler import apply_proposed_sg_to_csv
 from modules.logging_utils import logger
 from modules.system_settings import SystemSettings
-from modules.prompt_generator import generate_scan_prompt
+from modules.prompt_generator import generate_scan_prompt, compile_prompt
+from modules.openai_client import get_client
+from modules.response_cache import get_response_cache
+from modules.batch_api import run_batch, get_batch_service
+from modules.scan_group_mapper import (  # ✅ Shared with two-stage mode
+    build_match_request, parse_match_response, pack_scan_batches, align_batch
+)
+from modules.scan_dedup import normalise_scan_text
 
 # === Default Paths ===
 DEFAULT_SCAN_GROUPS_PATH = r"C:\Users\Shaalan\tracking_openai\data\pvr_config_data\scan-groups.csv"
@@ -19,9 +24,7 @@ DEFAULT_PROMPT_PATH = r"C:\Users\Shaalan\tracking_openai\data\prompts\pvr_matche
 LOG_BASE_DIR = r"C:\Users\Shaalan\tracking_openai\scripts\logs"
 
 MODEL_NAME = "gpt-4o-mini"
-BATCH_SIZE = 25
-MAX_RETRIES = 3
-RETRY_BACKOFF = 3.0
+MAX_SCANS_PER_BATCH = None  # ✅ Batches are packed by token budget (`pack_scan_batches`); set to cap them
 
 # === API Setup ===
 def load_api_key():
@@ -32,7 +35,7 @@ def load_api_key():
         raise ValueError("❌ OPENAI_API_KEY not found.")
     return api_key
 
-client = OpenAI(api_key=load_api_key())
+client = get_client(load_api_key())
 
 # === File/Column Selectors ===
 def select_csv_file(data_dir: str) -> str:
@@ -65,34 +68,22 @@ def fix_mojibake(text):
         return text
 
 # === GPT Interaction ===
-def get_proposed_matches(messages: list[dict]) -> dict:
-    for attempt in range(1, MAX_RETRIES + 1):
+def get_proposed_matches_batch(batched_messages: dict[int, list[dict]]) -> dict[int, dict]:
+    """Submit every alignment batch through the Batch API and return results keyed by batch number."""
+    requests = [(f"batch-{num}", build_match_request(messages, MODEL_NAME)) for num, messages in batched_messages.items()]
+    results = run_batch(requests, get_batch_service(client))
+
+    gpt_results = {}
+    for num in batched_messages:
+        result = results.get(f"batch-{num}", {"response": None, "error": "missing from batch output"})
         try:
-            logger.info("🔁 Sending batch to GPT...")
-            response = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=messages,
-                temperature=0.0,
-                response_format={"type": "json_object"},
-            )
-            content = response.choices[0].message.content.strip()
-            usage = response.usage
-            token_usage = {
-                "prompt_tokens": usage.prompt_tokens,
-                "completion_tokens": usage.completion_tokens,
-                "total_tokens": usage.total_tokens
-            }
-            logger.info("✅ GPT response received.")
-            return {
-                "proposed_matches": json.loads(content).get("proposed_matches", []),
-                "response_text": content,
-                "token_usage": token_usage
-            }
+            if result["response"] is None:
+                raise ValueError(result["error"])
+            gpt_results[num] = parse_match_response(result["response"])
         except Exception as e:
-            logger.error(f"❌ GPT call failed (attempt {attempt}): {e}")
-            if attempt < MAX_RETRIES:
-                time.sleep(RETRY_BACKOFF * attempt)
-    return {"proposed_matches": [], "response_text": "", "token_usage": {}}
+            logger.error(f"❌ Batch result for alignment batch {num} unusable: {e}")
+            gpt_results[num] = {"proposed_matches": [], "response_text": "", "token_usage": {}}
+    return gpt_results
 
 # === Logging ===
 def log_gpt_batch(batch_num: int, messages: list[dict], response_data: dict, script_name: str = "run_scan_group_alignment"):
@@ -116,7 +107,7 @@ def log_gpt_batch(batch_num: int, messages: list[dict], response_data: dict, scr
         logger.error(f"❌ Could not save GPT log: {e}")
 
 # === Main ===
-def main(scan_groups_path: str, prompt_path: str, max_batches: int = None):
+def main(scan_groups_path: str, prompt_path: str, max_batches: int = None, mode: str = "sync"):
     DATA_DIR = r"C:\Users\Shaalan\tracking_openai\data\pvr_config_data"
     logger.info("🚀 Starting GPT scan group alignment...")
 
@@ -135,20 +126,17 @@ def main(scan_groups_path: str, prompt_path: str, max_batches: int = None):
     df[column_to_use] = df[column_to_use].apply(lambda x: fix_mojibake(x) if isinstance(x, str) else x)
 
     all_scans = df[column_to_use].dropna().tolist()
-    total_batches = len(all_scans) // BATCH_SIZE + int(len(all_scans) % BATCH_SIZE != 0)
+    compiled = compile_prompt(prompt_path, scan_groups_path)
+    system_tokens = compiled.token_count(MODEL_NAME) if compiled else 0
+    scan_batches = pack_scan_batches(all_scans, MODEL_NAME, system_tokens, MAX_SCANS_PER_BATCH)
     if max_batches:
-        total_batches = min(total_batches, max_batches)
+        scan_batches = scan_batches[:max_batches]
 
-    logger.info(f"🔄 Processing {total_batches} batches of {BATCH_SIZE} scans each...\n")
+    logger.info(f"🔄 Processing {len(scan_batches)} token-packed batches of {len(all_scans)} scans...\n")
     all_matches = []
+    batched_messages = {}
 
-    for batch_num in tqdm(range(1, total_batches + 1), desc="Aligning", unit="batch"):
-        start = (batch_num - 1) * BATCH_SIZE
-        end = start + BATCH_SIZE
-        scan_batch = all_scans[start:end]
-
-        print(f"\n📦 Batch {batch_num} — {len(scan_batch)} scans")
-
+    for batch_num, scan_batch in enumerate(scan_batches, start=1):
         messages = generate_scan_prompt(
             scan_batch,
             prompt_path=prompt_path,
@@ -158,14 +146,35 @@ def main(scan_groups_path: str, prompt_path: str, max_batches: int = None):
         if not messages:
             logger.error(f"❌ Prompt generation failed for batch {batch_num}. Skipping.")
             continue
-        
-        gpt_result = get_proposed_matches(messages)
-        log_gpt_batch(batch_num, messages, gpt_result)
-
-        matches = gpt_result["proposed_matches"]
-        print(f"✅ Received {len(matches)} matches")
+        batched_messages[batch_num] = messages
+
+    # ✅ Batch mode: one Batch API submission for every alignment batch, merged back by batch number
+    if mode == "batch":
+        batch_results = get_proposed_matches_batch(batched_messages)
+
+    for batch_num, messages in tqdm(batched_messages.items(), desc="Aligning", unit="batch"):
+        print(f"\n📦 Batch {batch_num}")
+        scan_batch = scan_batches[batch_num - 1]
+        if mode == "batch":
+            gpt_result = batch_results[batch_num]
+            log_gpt_batch(batch_num, messages, gpt_result)
+            matches = gpt_result["proposed_matches"]
+            answered = {normalise_scan_text(str(match.get("original") or "")) for match in matches}
+            missing = [scan for scan in scan_batch if normalise_scan_text(scan) not in answered]
+            if missing:
+                # ✅ Cut-off or incomplete Batch API answers: resend only the missing scans, split as needed
+                logger.warning(f"✂️ Batch {batch_num}: {len(missing)} scans unanswered, resending synchronously.")
+                retried, _ = align_batch(client, missing, prompt_path, scan_groups_path, model=MODEL_NAME,
+                                         on_result=lambda m, r: log_gpt_batch(batch_num, m, r))
+                matches = matches + retried
+        else:
+            matches, _ = align_batch(client, scan_batch, prompt_path, scan_groups_path, model=MODEL_NAME,
+                                     on_result=lambda m, r: log_gpt_batch(batch_num, m, r))
+
+        print(f"✅ Received {len(matches)} matches for {len(scan_batch)} scans")
         all_matches.extend(matches)
 
+    get_response_cache().log_stats()
     logger.info("💾 Writing final aligned CSV...")
     apply_proposed_sg_to_csv(
         mapping_csv_path=mapping_csv_path,
@@ -183,10 +192,13 @@ if __name__ == "__main__":
     parser.add_argument("--scan-groups-path", type=str, default=DEFAULT_SCAN_GROUPS_PATH)
     parser.add_argument("--prompt-path", type=str, default=DEFAULT_PROMPT_PATH)
     parser.add_argument("--max-batches", type=int, help="Limit how many batches to process.")
+    parser.add_argument("--mode", choices=["sync", "batch"], default="sync",
+                        help="Call GPT per batch (sync) or submit everything through the Batch API (batch).")
     args = parser.parse_args()
 
     main(
         scan_groups_path=args.scan_groups_path,
         prompt_path=args.prompt_path,
-        max_batches=args.max_batches
+        max_batches=args.max_batches,
+        mode=args.mode
     )
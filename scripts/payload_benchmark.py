@@ -0,0 +1,48 @@
+import sys
+import os
+import argparse
+import pandas as pd
+
+# ✅ Ensure Python finds the 'modules' directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from modules.json_handler import load_json
+from modules.scan_dedup import parse_scan_history
+from modules.prompt_generator import clean_shipments
+from modules.payload_encoders import measure_payload_tokens
+
+def load_shipments(path, column, id_column):
+    """Shipment dicts from a Mongo export (JSON list) or a CSV with "(ts) scan,..." histories."""
+    if path.endswith(".json"):
+        return load_json(path) or []
+    df = pd.read_csv(path).dropna(subset=[column])
+    return [
+        {"tracking_number": str(row[id_column]) if id_column in df.columns else f"row-{index}",
+         "shipment_id": None, "carrier": row.get("Carrier"),
+         "scans": [{"timestamp": timestamp, "scan": scan} for timestamp, scan in parse_scan_history(row[column])]}
+        for index, row in df.iterrows()
+    ]
+
+parser = argparse.ArgumentParser(description="Compare prompt tokens per shipment for each payload encoder.")
+parser.add_argument("--input", default=os.path.join("data", "test", "Test_dataset.csv"),
+                    help="CSV with scan histories, or a JSON list of shipments exported from MongoDB.")
+parser.add_argument("--column", default="Scans", help="Scan history column (CSV input).")
+parser.add_argument("--id-column", default="Tracking_Number", help="Tracking number column (CSV input).")
+parser.add_argument("--models", nargs="+", default=["gpt-4o-mini", "gpt-4-turbo", "gpt-3.5-turbo"])
+parser.add_argument("--per-request", type=int, default=20, help="Shipments per multi-shipment request.")
+args = parser.parse_args()
+
+shipments = clean_shipments(load_shipments(args.input, args.column, args.id_column))
+print(f"\n📦 {len(shipments)} shipments, {args.per_request} per request")
+
+results = measure_payload_tokens(shipments, args.models, args.per_request)
+best = {}
+for model, tokens in results.items():
+    baseline = tokens["text"]
+    print(f"\n{model}")
+    print(f"  {'Encoder':<10}{'Tokens/shipment':>17}{'vs text':>10}")
+    for name, value in sorted(tokens.items(), key=lambda item: item[1]):
+        print(f"  {name:<10}{value:>17.1f}{(value - baseline) / baseline:>+10.1%}")
+    best[model] = min(tokens, key=tokens.get)
+
+print(f"\n✅ Densest encoder per model (`payload_format` in settings.json): {best}")
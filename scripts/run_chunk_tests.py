@@ -1,73 +1,154 @@
 import os
 import json
-import time
+import argparse
 from dotenv import load_dotenv
-from openai import OpenAI
 from modules.mongo_handler import fetch_filtered_shipments, store_ai_results
-from modules.prompt_generator import generate_prompt
+from modules.prompt_generator import generate_prompt, load_prompt_from_json
 from modules.json_handler import load_json, save_json
 from modules.user_input import select_prompt
+from modules.ai_model import create_chat_completion
+from modules.openai_client import get_client
+from modules.retry_policy import get_retry_policy, InvalidResponseError
+from modules.token_counter import count_message_tokens
+from modules.token_packer import pack_shipments, map_responses_by_id, completion_tokens_for
+from modules.payload_encoders import PAYLOAD_ENCODERS, resolve_payload_format
+from modules.scan_dedup import dedup_scan_histories
+from modules.run_ledger import open_run_ledger
+from modules.system_settings import SystemSettings
+from modules.compact_schema import (
+    CodeDecoder, codes_enabled, add_code_instructions, response_format_kwargs
+)
 
 load_dotenv(dotenv_path=os.path.join("config", ".env"))
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = get_client(os.getenv("OPENAI_API_KEY"))
 
-def get_ai_progress(messages, model="gpt-4o-mini", retries=3):
+def parse_shipments(response):
+    """The `shipments` list of a multi-shipment answer; raises so malformed answers are retried."""
+    response_json = json.loads(response.choices[0].message.content)
+    if not isinstance(response_json, dict) or not isinstance(response_json.get("shipments"), list):
+        raise InvalidResponseError("AI response did not contain expected 'shipments' key.")
+    return response_json["shipments"]
+
+def get_ai_progress(messages, model="gpt-4o-mini", retries=3, max_tokens=None):
     """
     Sends multiple shipments in one request and expects a structured JSON response
-    wrapped in an object.
+    wrapped in an object. Returns (shipments, usage), or (None, None) on failure.
     """
-    for attempt in range(retries):
-        try:
-            print(f"\n🚀 Attempt {attempt + 1}: Sending batch to GPT...")
-            print("🔍 Messages Sent:", messages)  # Debug Print
-
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=0.0,
-                response_format={"type": "json_object"}  # ✅ Ensure JSON object response
-            )
-
-            print(f"✅ Raw OpenAI Response: {response}")  # Debug Print
-
-            # ✅ Correct way to access response
-            response_json = response.choices[0].message.content
-
-            # Convert the response from a string to a JSON object
-            response_json = json.loads(response_json)
-
-            if "shipments" in response_json and isinstance(response_json["shipments"], list):
-                return response_json["shipments"]
+    try:
+        print("\n🚀 Sending batch to GPT...")
+        print("🔍 Messages Sent:", messages)  # Debug Print
 
-            print("AI response did not contain expected 'shipments' key.")
-            return None
+        request = {
+            "model": model,
+            "messages": messages,
+            "temperature": 0.0,
+            "response_format": {"type": "json_object"},  # ✅ Ensure JSON object response
+            **response_format_kwargs(multi=True)  # ✅ Strict code schema instead in codes mode
+        }
+        if max_tokens:
+            request["max_tokens"] = max_tokens  # ✅ Room for one answer per packed shipment
+        # ✅ Retries, jittered backoff and the shared circuit breaker live in `modules.retry_policy`;
+        # the answer is parsed inside the retried call, so malformed JSON is asked again
+        response = create_chat_completion(client, retry_policy=get_retry_policy(retries), validate=parse_shipments,
+                                          **request)
 
-        except Exception as e:
-            print(f"Error on attempt {attempt + 1}: {e}")
-            time.sleep((attempt + 1) * 2)
+        print(f"✅ Raw OpenAI Response: {response}")  # Debug Print
+        return parse_shipments(response), response.usage
 
-    print("GPT API failed after multiple retries. Skipping this batch.")
-    return None
+    except Exception as e:
+        print(f"GPT API failed after retries: {e}. Skipping this batch.")
+    return None, None
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send token-packed multi-shipment requests from MongoDB.")
+    parser.add_argument("--limit", type=int, default=500, help="How many shipments to fetch from MongoDB.")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--run-id", help="Name of the run ledger (default: a timestamp, or the latest run with --resume).")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip shipments the run already stored and retry only unfinished or failed ones.")
+    parser.add_argument("--codes", action="store_true",
+                        help="Answer with status_mapping.json codes under a strict JSON schema and decode them locally.")
+    parser.add_argument("--payload", choices=sorted(PAYLOAD_ENCODERS),
+                        help="Shipment encoding in the prompt (default: `payload_format` for the model, else text).")
+    args = parser.parse_args()
+    payload_format = args.payload or resolve_payload_format(args.model)
+    if args.codes:
+        SystemSettings.response_mode = "codes"
+    decoder = CodeDecoder(model=args.model) if codes_enabled() else None
+
     selected_prompt_file = select_prompt()
     system_prompt_json = load_json(selected_prompt_file)
     if system_prompt_json is None:
         raise FileNotFoundError(f"Prompt file '{selected_prompt_file}' not found or invalid.")
 
-    shipments = fetch_filtered_shipments("your_input_collection", batch_size=5)
+    shipments = fetch_filtered_shipments("your_input_collection", batch_size=args.limit)
     if not shipments:
         print("No valid shipments to process.")
         exit(0)
 
-    messages = generate_prompt(shipments, selected_prompt_file)
-    ai_responses = get_ai_progress(messages)
+    # ✅ Ledger keyed by tracking number, so a resumed run skips shipments already stored
+    run_id, ledger = open_run_ledger(args.run_id, args.resume)
+    if args.resume:
+        completed = ledger.completed()
+        shipments = [s for s in shipments if str(s.get("tracking_number")) not in completed]
+        print(f"\n🔁 Resuming run `{run_id}`: {len(completed)} shipments already stored, {len(shipments)} to send.")
+        if not shipments:
+            exit(0)
+
+    # ✅ Only send one shipment per unique normalised scan history; duplicates reuse its answer
+    representatives, assignments = dedup_scan_histories([shipment["scans"] for shipment in shipments])
+    duplicates = {}
+    for index, slot in enumerate(assignments):
+        if representatives[slot] != index:
+            duplicates.setdefault(representatives[slot], []).append(shipments[index])
+    unique_shipments = [shipments[index] for index in representatives]
+    representative_index = {id(shipments[index]): index for index in representatives}
+
+    # ✅ Fill each request up to the model's token budget instead of a fixed batch size
+    system_tokens = count_message_tokens([{"role": "system", "content": load_prompt_from_json(selected_prompt_file)}], args.model)
+    packs = pack_shipments(unique_shipments, args.model, system_tokens, payload_format=payload_format)
+    print(f"\n📦 {len(unique_shipments)} unique shipments packed into {len(packs)} requests.")
 
-    if ai_responses and len(ai_responses) == len(shipments):
-        for shipment, ai_response in zip(shipments, ai_responses):
+    stored = 0
+    for pack in packs:
+        messages = generate_prompt(pack, selected_prompt_file, payload_format)
+        if decoder:
+            messages = add_code_instructions(messages, multi=True)
+        ai_responses, usage = get_ai_progress(messages, model=args.model, max_tokens=completion_tokens_for(len(pack), args.model))
+        if decoder and ai_responses:
+            # ✅ Map the codes back to labels; answers with unknown codes count as missing
+            ai_responses = decoder.decode_shipments(ai_responses, usage.completion_tokens)
+
+        matched, missing = map_responses_by_id(pack, ai_responses)
+        # ✅ Token usage is per request, so each shipment in the pack is charged an equal share
+        token_input = usage.prompt_tokens // len(pack) if usage else 0
+        token_output = usage.completion_tokens // len(pack) if usage else 0
+        results = []
+        for shipment, ai_response in matched:
             shipment["ai_analysis"] = ai_response  # Attach AI response
+            results.append((shipment, token_input, token_output))
+            for duplicate in duplicates.get(representative_index[id(shipment)], []):
+                # ✅ Copy the answer, pointing it at the duplicate's own tracking number
+                duplicate["ai_analysis"] = {**ai_response, "tracking_number": duplicate.get("tracking_number")}
+                results.append((duplicate, 0, 0))
+
+        if results:
+            store_ai_results("ai_predictions", [shipment for shipment, _, _ in results])
+            stored += len(results)
+            for shipment, tokens_in, tokens_out in results:
+                ledger.record(shipment.get("tracking_number"), {
+                    "tracking_number": shipment.get("tracking_number"), "ai_analysis": shipment["ai_analysis"],
+                    "Token_Input": tokens_in, "Token_Output": tokens_out,
+                })
+        if missing:
+            print(f"\n⚠️ {len(missing)} shipments had no matching AI response in this request.")
+            # ✅ Failed shipments (and their duplicates) are retried by `--resume`
+            for shipment in missing:
+                for failed in [shipment] + duplicates.get(representative_index[id(shipment)], []):
+                    ledger.record(failed.get("tracking_number"), error="no matching AI response")
 
-        store_ai_results("ai_predictions", shipments)
-        print(f"\nSuccessfully processed and stored {len(shipments)} shipments.")
-    else:
-        print("\nAI responses did not match the number of shipments. Skipping storage.")
+    print(f"\nSuccessfully processed and stored {stored} of {len(shipments)} shipments.")
+    if decoder:
+        decoder.log_savings()
+    ledger.log_summary()
+    ledger.close()
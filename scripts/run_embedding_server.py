@@ -0,0 +1,23 @@
+import sys
+import os
+import argparse
+
+# ✅ Ensure Python finds the 'modules' directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from urllib.parse import urlparse
+from modules.system_settings import SystemSettings
+from modules.embedding_server import serve
+
+default_url = urlparse(SystemSettings.embedding_server_url or "http://127.0.0.1:8765")
+
+parser = argparse.ArgumentParser(description="Keep sentence-transformers models warm for the scan group scripts.")
+parser.add_argument("--host", default=default_url.hostname, help="Interface to bind (keep it on localhost).")
+parser.add_argument("--port", type=int, default=default_url.port or 8765)
+parser.add_argument("--models", nargs="*", default=["all-MiniLM-L6-v2", "all-mpnet-base-v2"],
+                    help="Models to load at start-up (others load on first request).")
+parser.add_argument("--max-batch", type=int, help="Texts per micro-batch (default: `embedding_server_max_batch`).")
+parser.add_argument("--max-wait-ms", type=float, help="How long a batch waits for more requests (default: `embedding_server_max_wait_ms`).")
+args = parser.parse_args()
+
+serve(args.host, args.port, args.models, args.max_batch, args.max_wait_ms)
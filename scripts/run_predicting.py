@@ -1,5 +1,6 @@
 import sys
 import os
+import argparse
 
 # ✅ Ensure Python finds the 'modules' directory
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -10,10 +11,43 @@ from modules.user_input import (
     select_csv_file, select_csv_column, select_prompt, confirm_selection
 )
 from modules.system_settings import SystemSettings
-from modules.prediction_processor import process_csv
+from modules.prediction_processor import process_csv, plan_csv
 from modules.file_handler import get_output_file, open_file_after_save
 from modules.json_handler import save_json  # ✅ Correctly using json_handler
 
+# ✅ Optional CLI overrides for the execution mode (defaults come from `settings.json`)
+parser = argparse.ArgumentParser(description="Run AI shipment status predictions over a CSV file.")
+parser.add_argument("--mode", choices=["sync", "async", "batch", "two_stage"],
+                    help="Row-by-row (sync), concurrent (async) or OpenAI Batch API (batch) requests, or map scans "
+                         "to scan groups and send only shipments the local state machine can't resolve (two_stage).")
+parser.add_argument("--concurrency", type=int, help="Maximum in-flight requests in async mode.")
+parser.add_argument("--cascade", action="store_true",
+                    help="Ask the cheap model first and escalate only low-confidence rows to the strong model.")
+parser.add_argument("--rules", action="store_true",
+                    help="Decide unambiguous terminal histories (e.g. Delivered) locally and send only the rest to the model.")
+parser.add_argument("--codes", action="store_true",
+                    help="Have the model answer with status_mapping.json codes under a strict JSON schema (fewer output tokens).")
+parser.add_argument("--plan", action="store_true",
+                    help="Only report projected tokens, cost, duration and batch size for the file, then exit.")
+parser.add_argument("--budget", type=float, help="Refuse to start if the projected cost (USD) is above this.")
+parser.add_argument("--run-id", help="Name of the run ledger (default: a timestamp, or the latest run with --resume).")
+parser.add_argument("--resume", action="store_true",
+                    help="Skip rows the run already completed and retry only unfinished or failed ones.")
+args = parser.parse_args()
+
+if args.mode:
+    SystemSettings.execution_mode = args.mode
+if args.concurrency:
+    SystemSettings.max_concurrency = args.concurrency
+if args.cascade:
+    SystemSettings.use_model_cascade = True
+if args.rules:
+    SystemSettings.use_rule_engine = True
+if args.codes:
+    SystemSettings.response_mode = "codes"
+if args.budget is not None:
+    SystemSettings.run_budget_usd = args.budget
+
 logger.info("🚀 Starting AI prediction process...")
 
 # ✅ Step 1: Get Model Type (e.g., OpenAI)
@@ -40,6 +74,16 @@ select_csv_column()
 selected_prompt = select_prompt()
 print(f"\n🟢 DEBUG: Using JSON prompt `{selected_prompt}`")
 
+# ✅ Pre-flight plan only: nothing is sent
+if args.plan:
+    plan = plan_csv(SystemSettings.input_file, SystemSettings.selected_column, SystemSettings.prompt_file)
+    if plan:
+        plan.log()
+        print(f"\n🧮 Run plan: {plan.as_dict()}")
+        if plan.exceeds_budget():
+            print(f"🛑 Over the ${SystemSettings.run_budget_usd} budget.")
+    exit(0)
+
 # ✅ Step 7: Confirmation Before Execution
 if not confirm_selection():
     logger.info("🚫 Process canceled by user.")
@@ -56,7 +100,9 @@ predictions = process_csv(
     output_file,  # ✅ Output CSV file
     json_output_file,  # ✅ Missing JSON output file (FIXED)
     SystemSettings.selected_column,  # ✅ Selected column
-    SystemSettings.prompt_file  # ✅ Prompt file
+    SystemSettings.prompt_file,  # ✅ Prompt file
+    run_id=args.run_id,  # ✅ Ledger of completed rows for `--resume`
+    resume=args.resume
 )
 
 # ✅ Step 9: Save JSON Predictions
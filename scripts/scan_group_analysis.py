@@ -1,9 +1,15 @@
 import pandas as pd
 import re
 import os
-from sentence_transformers import SentenceTransformer, util
+import sys
 from openpyxl import load_workbook
 
+# ✅ Ensure Python finds the 'modules' directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from modules.similarity_search import nearest_neighbours
+from modules.embedding_store import encode_texts
+
 # -------- SETTINGS --------
 
 # Path to your Excel file
@@ -30,28 +36,19 @@ print("Loading source sheet 'sg_final'...")
 sg_final_df = pd.read_excel(excel_path, sheet_name="sg_final")
 sg_names = sg_final_df['sg_name'].dropna().astype(str).tolist()
 
-# Load the semantic model
-print(f"Loading semantic model: {model_name} ...")
-model = SentenceTransformer(model_name)
-
-# Encode all scan group names
-print("Encoding scan group names...")
-sg_embeddings = model.encode(sg_names, convert_to_tensor=True)
+# Encode all scan group names (only names missing from the embedding store hit the model)
+print(f"Encoding scan group names with {model_name} ...")
+sg_embeddings = encode_texts(sg_names, model_name)
 
-# Perform internal similarity matching
+# Perform internal similarity matching (blockwise, self-matches skipped)
 print("Comparing scan groups internally...")
+neighbours = nearest_neighbours(sg_embeddings, threshold=similarity_threshold)
 match_results = []
 
 for i, source_name in enumerate(sg_names):
-    scores = util.cos_sim(sg_embeddings[i], sg_embeddings)[0]
-    matched_names = []
-    matched_scores = []
-
-    for j, score in enumerate(scores):
-        if i != j:  # Ignore self-match
-            if score >= similarity_threshold:
-                matched_names.append(sg_names[j])
-                matched_scores.append(str(round(float(score), 3)))
+    indices, scores = neighbours.row(i)
+    matched_names = [sg_names[j] for j in indices]
+    matched_scores = [str(round(float(score), 3)) for score in scores]
 
     # Build results
     match_flag = "Yes" if matched_names else "No"
@@ -1,11 +1,17 @@
+import os
+import sys
 import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from sklearn.preprocessing import StandardScaler
 import umap
 import hdbscan
 from openpyxl import load_workbook
 
+# ✅ Ensure Python finds the 'modules' directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from modules.embedding_store import encode_texts
+
 # Path to the Excel file
 excel_path = r"G:\Shared drives\Tech\PVR analysis\Tracking\PVR Scan Configuration\Scan group analysis\scan_group_analysis.xlsx"
 
@@ -19,13 +25,9 @@ sg_final_df = pd.read_excel(excel_path, sheet_name="sg_final_renamed")
 # Extract the renamed_sg_name column
 sg_names = sg_final_df['renamed_sg_name'].dropna().astype(str).tolist()
 
-# Load the upgraded semantic model
-print("Loading semantic model...")
-model = SentenceTransformer('all-mpnet-base-v2')
-
-# Encode the scan group names
+# Encode the scan group names with the upgraded semantic model (cached in the embedding store)
 print("Encoding scan group names...")
-sg_embeddings = model.encode(sg_names, convert_to_tensor=False)
+sg_embeddings = np.asarray(encode_texts(sg_names, 'all-mpnet-base-v2'), dtype=np.float32)
 
 # Dimensionality reduction
 print("Running UMAP dimensionality reduction...")
@@ -1,14 +1,18 @@
 import os
 import json
-import time
 import pandas as pd
 from tqdm import tqdm
 from datetime import datetime
 from dotenv import load_dotenv
-from openai import OpenAI
-from sentence_transformers import SentenceTransformer, util
 import inspect
 import argparse
+from modules.ai_model import create_chat_completion
+from modules.openai_client import get_client
+from modules.retry_policy import get_retry_policy, InvalidResponseError
+from modules.token_counter import count_tokens_batch, count_message_tokens
+from modules.token_packer import get_token_budget, pack_items
+from modules.similarity_search import nearest_neighbours
+from modules.embedding_store import encode_texts
 
 
 # ===== CONFIG =====
@@ -19,9 +23,9 @@ similarity_threshold = 0.75
 internal_similarity_threshold = 0.9
 gpt_model = "gpt-4o"
 embed_model = "all-MiniLM-L6-v2"
-batch_size = 25
+max_batch_size = None  # ✅ Optional cap; batches are packed by token budget
+completion_tokens_per_label = 25  # ✅ {"structured_name": ..., "progress_match": ...} per label, plus the new name
 max_retries = 3
-retry_backoff = 3.0
 timestamp = datetime.now().strftime("%Y%m%d_%H%M")
 
 from openpyxl import load_workbook
@@ -61,7 +65,7 @@ def load_api_key():
     load_dotenv(dotenv_path=dotenv_path)
     return os.getenv("OPENAI_API_KEY")
 
-client = OpenAI(api_key=load_api_key())
+client = get_client(load_api_key())
 
 # ===== GPT Prompt Builder =====
 def build_gpt_prompt(scan_batch: list[str]) -> list[dict]:
@@ -129,22 +133,69 @@ def build_gpt_prompt(scan_batch: list[str]) -> list[dict]:
     ]
 
 # ===== GPT Call =====
+def parse_results(response):
+    """(results, finish_reason) of a naming response; raises so malformed JSON is retried."""
+    choice = response.choices[0]
+    if choice.finish_reason == "length":
+        return [], "length"  # ✅ Cut-off JSON; the caller splits the batch
+    parsed = json.loads(choice.message.content.strip())
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("results", []), list):
+        raise InvalidResponseError("expected {\"results\": [...]}")
+    return parsed.get("results", []), choice.finish_reason
+
 def call_gpt(messages):
-    for attempt in range(1, max_retries + 1):
-        try:
-            response = client.chat.completions.create(
-                model=gpt_model,
-                messages=messages,
-                temperature=0.2,
-                response_format={"type": "json_object"}
-            )
-            content = response.choices[0].message.content.strip()
-            return json.loads(content).get("results", [])
-        except Exception as e:
-            print(f"GPT failed on attempt {attempt}: {e}")
-            if attempt < max_retries:
-                time.sleep(retry_backoff * attempt)
-    return []
+    try:
+        # ✅ Retries, jittered backoff and the shared circuit breaker live in `modules.retry_policy`;
+        # parsing runs inside the retried call, so malformed JSON is asked again
+        response = create_chat_completion(
+            client,
+            retry_policy=get_retry_policy(max_retries),
+            validate=parse_results,
+            model=gpt_model,
+            messages=messages,
+            temperature=0.2,
+            response_format={"type": "json_object"}
+        )
+        return parse_results(response)
+    except Exception as e:
+        print(f"GPT failed after retries: {e}")
+    return [], None
+
+def name_batch(batch: list[str]) -> tuple[list[dict], list[tuple[list[str], list[dict]]]]:
+    """
+    Structured names for a batch of labels, one per label in order.
+
+    Results are positional, so a cut-off answer or one with the wrong number of results is
+    split in half and retried; a single label that still fails is marked for review.
+
+    Returns:
+        tuple: (results, [(labels sent, raw results) per request] for logging)
+    """
+    results, finish_reason = call_gpt(build_gpt_prompt(batch))
+    sent = [(batch, results)]
+    if len(results) == len(batch):
+        return results, sent
+    if len(batch) == 1:
+        return [{"structured_name": f"REVIEW: {batch[0]}", "progress_match": "Uncertain"}], sent
+
+    print(f"✂️ {len(results)} results for {len(batch)} labels ({finish_reason}); splitting and retrying")
+    middle = len(batch) // 2
+    first, first_sent = name_batch(batch[:middle])
+    second, second_sent = name_batch(batch[middle:])
+    return first + second, sent + first_sent + second_sent
+
+def pack_label_batches(scan_groups: list[str]) -> list[list[int]]:
+    """Label indices per request, packed against the model's prompt/completion budget."""
+    budget = get_token_budget(gpt_model)
+    label_tokens = [tokens + 2 for tokens in count_tokens_batch(scan_groups, gpt_model)]  # ✅ "- " bullet and newline
+    completion = [tokens + completion_tokens_per_label for tokens in label_tokens]
+    system_tokens = count_message_tokens(build_gpt_prompt([]), gpt_model)
+    packs = sorted(pack_items(label_tokens, budget["prompt"], budget["completion"], completion, system_tokens,
+                              max_items=max_batch_size), key=lambda pack: pack[0])
+    for number, pack in enumerate(packs, start=1):
+        print(f"📦 Batch {number}: {len(pack)} labels, {system_tokens + sum(label_tokens[i] for i in pack)} prompt / "
+              f"~{sum(completion[i] for i in pack)} completion tokens")
+    return packs
 
 # ===== Batch Logger =====
 def log_gpt_batch(batch_num: int, scan_batch: list[str], gpt_results: list[dict]):
@@ -175,39 +226,35 @@ def main(max_batches=None):
     scan_groups = df[column_name].dropna().astype(str).tolist()
 
     print(f"🔸 Total scan group entries: {len(scan_groups)}")
-    structured_names, gpt_progresses = [], []
-
-    print("🚀 Calling GPT-4o for structured names and progress matches...")
-    batch_counter = 0
-    for i in tqdm(range(0, len(scan_groups), batch_size)):
-        if max_batches is not None and batch_counter >= max_batches:
-            break  # ✅ This line must be indented under the `if`
-
-        batch = scan_groups[i:i+batch_size]
-        messages = build_gpt_prompt(batch)
-        results = call_gpt(messages)
-        log_gpt_batch(batch_num=(i // batch_size) + 1, scan_batch=batch, gpt_results=results)
-
-        if results:
-            for item in results:
-                structured_names.append(item.get("structured_name", "REVIEW"))
-                gpt_progresses.append(item.get("progress_match", "Uncertain"))
-        else:
-            structured_names.extend([f"REVIEW: {s}" for s in batch])
-            gpt_progresses.extend(["Uncertain"] * len(batch))
+    structured_names, gpt_progresses = [None] * len(scan_groups), [None] * len(scan_groups)
+
+    packs = pack_label_batches(scan_groups)
+    if max_batches is not None:
+        packs = packs[:max_batches]
+    print(f"🚀 Calling GPT-4o for structured names and progress matches ({len(packs)} token-packed batches)...")
+    for batch_num, pack in enumerate(tqdm(packs), start=1):
+        batch = [scan_groups[i] for i in pack]
+        results, sent = name_batch(batch)
+        for scan_batch, gpt_results in sent:
+            log_gpt_batch(batch_num=batch_num, scan_batch=scan_batch, gpt_results=gpt_results)
+
+        for index, item in zip(pack, results):
+            structured_names[index] = item.get("structured_name", "REVIEW")
+            gpt_progresses[index] = item.get("progress_match", "Uncertain")
 
-        batch_counter += 1
+    done = [i for i, name in enumerate(structured_names) if name is not None]
+    structured_names = [structured_names[i] for i in done]
+    gpt_progresses = [gpt_progresses[i] for i in done]
 
-    scan_groups = scan_groups[:len(structured_names)]
-    df = df.iloc[:len(structured_names)].copy()
+    scan_groups = [scan_groups[i] for i in done]
+    df = df.iloc[done].copy()
 
     df["Structured Name (AI Ready)"] = structured_names
     df["Assigned Progress (GPT)"] = gpt_progresses
 
     print("🔹 Embedding structured names...")
-    model = SentenceTransformer(embed_model)
-    structured_embeddings = model.encode(structured_names, convert_to_tensor=True)
-    progress_embeddings = model.encode(progress_labels, convert_to_tensor=True)
+    structured_embeddings = encode_texts(structured_names, embed_model)  # ✅ Only new or edited names are encoded
+    progress_embeddings = encode_texts(progress_labels, embed_model)
 
     seen = set()
     duplicates = []
@@ -219,13 +266,9 @@ def main(max_batches=None):
             seen.add(name)
     df["Exact Duplicate"] = duplicates
 
-    similarity_flags = []
-    for i, emb_i in enumerate(structured_embeddings):
-        similar_count = 0
-        for j, emb_j in enumerate(structured_embeddings):
-            if i != j and float(util.cos_sim(emb_i, emb_j)[0]) >= internal_similarity_threshold:
-                similar_count += 1
-        similarity_flags.append("Yes" if similar_count > 0 else "No")
+    # ✅ Blockwise matrix products instead of one cos_sim call per pair
+    near_duplicates = nearest_neighbours(structured_embeddings, threshold=internal_similarity_threshold)
+    similarity_flags = ["Yes" if count > 0 else "No" for count in near_duplicates.counts()]
     df["Very Similar to Another Scan Group"] = similarity_flags
 
     print("🔹 Performing cosine similarity matching to progress states...")
@@ -234,10 +277,8 @@ def main(max_batches=None):
     vague_flags = []
     match_consistency = []
 
-    for i, emb in enumerate(structured_embeddings):
-        scores = util.cos_sim(emb, progress_embeddings)[0]
-        best_idx = scores.argmax()
-        best_score = float(scores[best_idx])
+    best_indices, best_scores = nearest_neighbours(structured_embeddings, progress_embeddings, k=1).best()
+    for i, (best_idx, best_score) in enumerate(zip(best_indices, best_scores.tolist())):
         bm_label = progress_labels[best_idx] if best_score >= similarity_threshold else "Uncertain"
         assigned_progress.append(bm_label)
         similarity_scores.append(round(best_score, 3))
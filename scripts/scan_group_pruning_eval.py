@@ -0,0 +1,71 @@
+import sys
+import os
+import argparse
+import numpy as np
+
+# ✅ Ensure Python finds the 'modules' directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from modules.logging_utils import logger
+from modules.prompt_generator import compile_prompt, generate_scan_prompt
+from modules.scan_group_mapper import SCAN_GROUPS_FILE, SCAN_GROUP_PROMPT_FILE, load_scan_groups
+from modules.scan_group_retriever import ScanGroupRetriever, recall_at_k, load_alignment_pairs
+from modules.embeddings import load_text_encoder
+from modules.token_counter import estimate_tokens
+
+LOG_DIR = os.path.join("data", "pvr_config_data")
+
+parser = argparse.ArgumentParser(description="Recall@k and prompt-token savings of retrieval-pruned scan group lists.")
+parser.add_argument("--logs", nargs="+", default=[os.path.join(LOG_DIR, "alignment_log_gpt-4o.csv"),
+                                                   os.path.join(LOG_DIR, "alignment_log_gpt-4o-mini.csv")],
+                    help="Historical alignment logs (scan_name, proposed_scan_group).")
+parser.add_argument("--scan-groups", default=SCAN_GROUPS_FILE)
+parser.add_argument("--prompt", default=SCAN_GROUP_PROMPT_FILE)
+parser.add_argument("--model", help="Embedding model (default: `embedding_model` setting, else all-MiniLM-L6-v2).")
+parser.add_argument("--ks", type=int, nargs="+", default=[1, 3, 5, 10, 20, 30])
+parser.add_argument("--top-k", type=int, default=10, help="k used for the prompt-token comparison.")
+parser.add_argument("--min-similarity", type=float, default=0.3)
+parser.add_argument("--batch-size", type=int, default=25)
+parser.add_argument("--chat-model", default="gpt-4o-mini", help="Tokenizer used to count prompt tokens.")
+args = parser.parse_args()
+
+encoder = load_text_encoder(args.model)
+if encoder is None:
+    logger.error("❌ No embedding model available (install sentence-transformers).")
+    sys.exit(1)
+
+retriever = ScanGroupRetriever(load_scan_groups(args.scan_groups), encoder, args.top_k, args.min_similarity)
+pairs = load_alignment_pairs(args.logs)
+known = {group.lower() for group in retriever.scan_groups}
+in_list = [pair for pair in pairs if pair[1].strip().lower() in known]
+print(f"\n📚 {len(pairs)} historical alignments, {len(in_list)} to a current scan group")
+
+# ✅ Step 1: Recall@k of the expected group among each scan's nearest groups
+print(f"\n{'k':>4}{'recall':>10}")
+for k, recall in recall_at_k(retriever, in_list, args.ks).items():
+    print(f"{k:>4}{recall:>10.1%}")
+
+# ✅ Step 2: System prompt tokens per batch, full list vs pruned candidates
+scan_texts = [text for text, _ in pairs]
+full_tokens = compile_prompt(args.prompt, args.scan_groups).token_count(args.chat_model)
+sent, sizes, fallbacks, batch_recall = [], [], 0, []
+for start in range(0, len(scan_texts), args.batch_size):
+    batch = pairs[start:start + args.batch_size]
+    candidates = retriever.candidates([text for text, _ in batch])
+    if candidates is None:
+        fallbacks += 1
+        sent.append(full_tokens)
+        sizes.append(len(retriever.scan_groups))
+        continue
+    messages = generate_scan_prompt([text for text, _ in batch], args.prompt, args.scan_groups, scan_groups=candidates)
+    sent.append(estimate_tokens(messages[0]["content"], args.chat_model))
+    sizes.append(len(candidates))
+    kept = {group.lower() for group in candidates}
+    batch_recall.extend(group.strip().lower() in kept for _, group in batch if group.strip().lower() in known)
+
+batches = len(sent)
+print(f"\n✂️ top-{args.top_k}, batches of {args.batch_size}: {batches} batches, {fallbacks} fell back to the full list")
+print(f"   Groups listed per batch: {np.mean(sizes):.1f} of {len(retriever.scan_groups)}")
+print(f"   System prompt tokens: {sum(sent)} vs {full_tokens * batches} ({1 - sum(sent) / (full_tokens * batches):.1%} saved)")
+if batch_recall:
+    print(f"   Expected group present in the pruned list: {np.mean(batch_recall):.1%}")
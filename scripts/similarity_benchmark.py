@@ -0,0 +1,49 @@
+import sys
+import os
+import time
+import argparse
+import tracemalloc
+import numpy as np
+
+# ✅ Ensure Python finds the 'modules' directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from modules.similarity_search import nearest_neighbours, block_rows
+from modules.ann_index import build_ann_index, ANN_BACKENDS, hnswlib
+
+parser = argparse.ArgumentParser(description="Time blockwise near-duplicate search and the ANN indexes on random embeddings.")
+parser.add_argument("--rows", type=int, default=100000, help="Embeddings to compare with each other.")
+parser.add_argument("--dim", type=int, default=384, help="Embedding size (all-MiniLM-L6-v2: 384).")
+parser.add_argument("--threshold", type=float, default=0.9)
+parser.add_argument("--k", type=int, default=10)
+parser.add_argument("--ann-only", action="store_true", help="Skip the exact all-pairs searches.")
+parser.add_argument("--queries", type=int, default=2000, help="Queries for the ANN recall check.")
+args = parser.parse_args()
+
+# ✅ Clustered vectors, so the threshold search finds near-duplicates like real scan texts do
+rng = np.random.default_rng(0)
+centres = rng.normal(size=(args.rows // 20, args.dim)).astype(np.float32)
+vectors = centres[rng.integers(0, len(centres), args.rows)] + 0.15 * rng.normal(size=(args.rows, args.dim)).astype(np.float32)
+
+print(f"\n🧪 {args.rows:,} × {args.dim} embeddings, {block_rows(args.rows)} queries per block")
+for label, kwargs in [] if args.ann_only else [(f"threshold >= {args.threshold}", {"threshold": args.threshold}), (f"top-{args.k}", {"k": args.k})]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    neighbours = nearest_neighbours(vectors, **kwargs)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<20}{elapsed:>8.1f}s{peak / 2 ** 20:>10,.0f} MB peak{len(neighbours.indices):>14,} neighbours")
+
+# ✅ ANN indexes: build time, query throughput and recall@k against the exact blockwise search
+queries = vectors[rng.choice(args.rows, args.queries, replace=False)] + 0.05 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+exact = nearest_neighbours(queries, vectors, k=args.k).indices.reshape(-1, args.k)
+for backend in [name for name in ANN_BACKENDS if name != "hnsw" or hnswlib is not None]:
+    start = time.perf_counter()
+    index = build_ann_index(vectors, backend=backend)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    ids, _ = index.query(queries, k=args.k)
+    queried = time.perf_counter() - start
+    recall = np.mean([len(set(found) & set(wanted)) / args.k for found, wanted in zip(ids.tolist(), exact.tolist())])
+    print(f"{backend:<20}{built:>8.1f}s build{args.queries / queried:>12,.0f} queries/s   recall@{args.k} {recall:.1%}")
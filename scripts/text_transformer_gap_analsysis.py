@@ -1,5 +1,13 @@
+import os
+import sys
+import math
 import pandas as pd
-from sentence_transformers import SentenceTransformer, util
+
+# ✅ Ensure Python finds the 'modules' directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from modules.embedding_store import encode_texts
+from modules.ann_index import get_ann_index
 
 # Path to the Excel file
 excel_path = r"G:\Shared drives\Tech\PVR analysis\Tracking\PVR Scan Configuration\Scan group analysis\Scan group vs smart scan.xlsx"
@@ -16,23 +24,20 @@ scan_groups_df = pd.read_excel(excel_path, sheet_name="scan_groups_list")
 smart_scans = smart_scans_df.iloc[:, 0].dropna().astype(str).tolist()
 scan_groups = scan_groups_df.iloc[:, 0].dropna().astype(str).tolist()
 
-# Load the semantic model
-print("Loading sentence-transformer model...")
-model = SentenceTransformer('all-MiniLM-L6-v2')
-
 # Encode sentences into semantic vectors
 print("Encoding smart scans and scan groups...")
-smart_embeddings = model.encode(smart_scans, convert_to_tensor=True)
-group_embeddings = model.encode(scan_groups, convert_to_tensor=True)
+smart_embeddings = encode_texts(smart_scans, 'all-MiniLM-L6-v2')  # ✅ Cached in the embedding store
+scan_groups_index, scan_groups_rows = get_ann_index("scan_groups", scan_groups, 'all-MiniLM-L6-v2')  # ✅ Built once, updated incrementally
+scan_groups_by_row = dict(zip(scan_groups_rows.tolist(), scan_groups))
 
 # Perform reverse matching: each smart scan gets its best-matching scan group
 print("Matching each smart scan to the closest scan group...")
 reverse_results = []
-for i, smart in enumerate(smart_scans):
-    scores = util.cos_sim(smart_embeddings[i], group_embeddings)[0]
-    best_idx = scores.argmax()
-    best_score = float(scores[best_idx])
-    best_match = scan_groups[best_idx]
+best_ids, best_scores = scan_groups_index.query(smart_embeddings, k=1)
+for smart, best_id, best_score in zip(smart_scans, best_ids[:, 0].tolist(), best_scores[:, 0].tolist()):
+    best_match = scan_groups_by_row.get(best_id)  # ✅ None for id -1 (NaN score): the index had nothing to return
+    if best_match is None or math.isnan(best_score):
+        best_match, best_score = "No match", 0.0
     reverse_results.append({
         "Smart Scan": smart,
         "Best Matching Scan Group": best_match,
@@ -1,5 +1,13 @@
+import os
+import sys
+import math
 import pandas as pd
-from sentence_transformers import SentenceTransformer, util
+
+# ✅ Ensure Python finds the 'modules' directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from modules.embedding_store import encode_texts
+from modules.ann_index import get_ann_index
 
 # Path to the Excel file
 excel_path = r"G:\Shared drives\Tech\PVR analysis\Tracking\PVR Scan Configuration\Scan group analysis\Scan group vs smart scan.xlsx"
@@ -15,23 +23,20 @@ scan_groups_df = pd.read_excel(excel_path, sheet_name="scan_groups_list")
 smart_scans = smart_scans_df.iloc[:, 0].dropna().astype(str).tolist()
 scan_groups = scan_groups_df.iloc[:, 0].dropna().astype(str).tolist()
 
-# Load sentence transformer model
-print("Loading semantic model...")
-model = SentenceTransformer('all-MiniLM-L6-v2')
-
 # Encode sentences
 print("Encoding scan group and smart scan entries...")
-smart_embeddings = model.encode(smart_scans, convert_to_tensor=True)
-group_embeddings = model.encode(scan_groups, convert_to_tensor=True)
+group_embeddings = encode_texts(scan_groups, 'all-MiniLM-L6-v2')  # ✅ Cached in the embedding store
+smart_scans_index, smart_scans_rows = get_ann_index("smart_scans", smart_scans, 'all-MiniLM-L6-v2')  # ✅ Built once, updated incrementally
+smart_scans_by_row = dict(zip(smart_scans_rows.tolist(), smart_scans))
 
 # Perform matching
 print("Matching each scan group to the closest smart scan...")
 results = []
-for i, group in enumerate(scan_groups):
-    scores = util.cos_sim(group_embeddings[i], smart_embeddings)[0]
-    best_idx = scores.argmax()
-    best_score = float(scores[best_idx])
-    best_match = smart_scans[best_idx]
+best_ids, best_scores = smart_scans_index.query(group_embeddings, k=1)
+for group, best_id, best_score in zip(scan_groups, best_ids[:, 0].tolist(), best_scores[:, 0].tolist()):
+    best_match = smart_scans_by_row.get(best_id)  # ✅ None for id -1 (NaN score): the index had nothing to return
+    if best_match is None or math.isnan(best_score):
+        best_match, best_score = "No match", 0.0
     results.append({
         "Scan Group": group,
         "Best Matching Smart Scan": best_match,